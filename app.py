@@ -1,31 +1,33 @@
 #app.py
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, stream_with_context, has_request_context
 from werkzeug.utils import secure_filename
 from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 import json
+import base64
 import re
 import fitz
 import requests
 from datetime import datetime, timedelta
-import difflib
-from difflib import get_close_matches
 import msal
 from dotenv import load_dotenv
-from functools import wraps
-from multiprocessing import Pool, cpu_count
-from vendor_extractors.sakata import load_package_descriptions, get_po_items
-from vendor_extractors.hm_clause import extract_hm_clause_data_from_bytes, find_best_hm_clause_package_description
-from vendor_extractors.kamterter import extract_kamterter_data_from_bytes
-from vendor_extractors.kamterter_shipping import extract_kamterter_shipping_data_from_bytes
-from vendor_extractors.seminis import extract_seminis_data_from_bytes, find_best_seminis_package_description
-from vendor_extractors.syngenta import extract_syngenta_data_from_bytes
-from vendor_extractors.nunhems import extract_nunhems_data_from_bytes, find_best_nunhems_package_description
+from functools import wraps, partial
+from concurrent.futures import ThreadPoolExecutor
+from vendor_extractors.sakata import load_package_descriptions, get_po_items, get_service_token
+from vendor_extractors.registry import get_vendor
+from vendor_extractors.azure_ocr import AZURE_OCR_METHOD, OCR_CACHE_METHOD
 import time
 import logging
-import psycopg2
+import multiprocessing
+import db_pool
+from token_broker import TokenBroker
 import db_logger
+import events
+import reference_cache
+import job_queue
+from matching import aggregate_duplicate_lots
+from pipeline import run_vendor_pipeline, fetch_po_options, attach_bc_options
 import urllib.parse
 
 app = Flask(__name__)
@@ -41,14 +43,13 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 app.logger.setLevel(logging.INFO)
-db_logger.init_app(app)
-# ---- POSTGRES MSAL CACHE CONFIG ----
-DB_CONFIG = {
-    'host': 'localhost',
-    'database': 'invoice_ocr',
-    'user': 'priyanshu',
-    'password': 'reorg0211',
-}
+# Extraction pool workers (vendor_extractors/parallel.py) re-import their parent's main module, and
+# through it this one; they only parse PDFs, so the database setup and background threads stay here
+if multiprocessing.parent_process() is None:
+    db_logger.init_app(app)
+    events.set_sink(events.BufferedDbSink())
+    job_queue.init_queue()
+    reference_cache.start_refresher()
 
 # Load environment variables
 load_dotenv()
@@ -61,6 +62,25 @@ AUTHORITY = f"https://login.microsoftonline.com/{BC_TENANT}"
 REDIRECT_PATH = "/auth/callback"
 SCOPE_BC = ["https://api.businesscentral.dynamics.com/.default"]
 
+# Upload batches are queued for worker.py instead of being processed in the request
+EXTRACTION_ASYNC = os.environ.get("EXTRACTION_ASYNC", "0").lower() in ("1", "true", "yes")
+# Vendors with an iter_extract fill their results page in file by file while the batch is still extracting
+# (off by default: each batch is parked in Postgres, PDFs included, until prune_jobs clears it)
+EXTRACTION_STREAM = os.environ.get("EXTRACTION_STREAM", "0").lower() in ("1", "true", "yes")
+_last_job_prune = 0.0
+
+def _prune_jobs_hourly():
+    """Streaming jobs are parked in Postgres even when no worker.py runs to prune them."""
+    global _last_job_prune
+    if time.time() - _last_job_prune > 3600:
+        _last_job_prune = time.time()
+        try:
+            removed = job_queue.prune_jobs()
+            if removed:
+                app.logger.info(f"Pruned {removed} old extraction job(s)")
+        except Exception as e:
+            app.logger.error(f"Job prune failed: {e}")
+
 def get_bc_env(vendor: str | None = None) -> str:
     """Return 'Production' if vendor in ["seminis", "hm_clause", "sakata", "syngenta", "kamterter"], else use default BC_ENV."""
     if vendor and vendor.strip().lower() in ["seminis", "hm_clause", "sakata", "syngenta", "kamterter"]:
@@ -85,61 +105,16 @@ def _bc_error_message(resp: requests.Response) -> str:
         pass
     return resp.text
 
-def load_cache():
-    """Load MSAL cache for this user from PostgreSQL."""
-    cache = msal.SerializableTokenCache()
-    user_name = session.get("user_name")
-    if user_name:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT token_cache_data 
-            FROM msal_token_cache 
-            WHERE user_name = %s
-        """, (user_name,))
-        row = cur.fetchone()
-        if row:
-            cache.deserialize(row[0])
-        cur.close()
-        conn.close()
-    return cache
-
-def save_cache(cache):
-    """Save MSAL cache for this user to PostgreSQL."""
-    if cache.has_state_changed:
-        user_name = session.get("user_name")
-        if user_name:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO msal_token_cache (user_name, token_cache_data, updated_at) 
-                VALUES (%s, %s, %s) 
-                ON CONFLICT (user_name) 
-                DO UPDATE SET token_cache_data = EXCLUDED.token_cache_data,
-                              updated_at = EXCLUDED.updated_at
-            """, (user_name, cache.serialize(), datetime.now()))
-            conn.commit()
-            cur.close()
-            conn.close()
-
-def clear_cache():
-    """Clear MSAL Token Cache for this user."""
-    user_name = session.get("user_name")
-    if user_name:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        cur.execute("DELETE FROM msal_token_cache WHERE user_name = %s", (user_name,))
-        conn.commit()
-        cur.close()
-        conn.close()
-
-def build_msal_app(cache=None) -> msal.ConfidentialClientApplication:
-    return msal.ConfidentialClientApplication(
-        client_id=CLIENT_ID,
-        client_credential=CLIENT_SECRET,
-        authority=AUTHORITY,
-        token_cache=cache,
-    )
+token_broker = TokenBroker(CLIENT_ID, CLIENT_SECRET, AUTHORITY, SCOPE_BC)
+
+def current_bc_token() -> str | None:
+    """The signed-in user's BC token via the broker (refreshed silently when near expiry)."""
+    token = token_broker.get_token(session.get("user_name"))
+    if token:
+        session["user_token"] = token
+    else:
+        session.pop("user_token", None)
+    return token
 
 # Timing decorators
 def timed_func(label: str):
@@ -159,295 +134,67 @@ def timed_get(url, **kwargs):
     resp = requests.get(url, **kwargs)
     elapsed = time.perf_counter() - start
     app.logger.info(f"[TIMING] GET {url} took {elapsed:.2f}s")
+    _note_rejected_token(resp, kwargs)
     resp.raise_for_status()
     return resp
 
+def timed_post_raw(url, **kwargs):
+    """timed_post without raise_for_status, for callers that inspect error responses."""
+    start = time.perf_counter()
+    resp = requests.post(url, **kwargs)
+    elapsed = time.perf_counter() - start
+    app.logger.info(f"[TIMING] POST {url} took {elapsed:.2f}s")
+    _note_rejected_token(resp, kwargs)
+    return resp
+
 def timed_post(url, **kwargs):
     start = time.perf_counter()
     resp = requests.post(url, **kwargs)
     elapsed = time.perf_counter() - start
     app.logger.info(f"[TIMING] POST {url} took {elapsed:.2f}s")
+    _note_rejected_token(resp, kwargs)
     resp.raise_for_status()
     return resp
 
 # Token validation
-@timed_func("token_is_valid")
-def token_is_valid(access_token: str) -> bool:
-    if not access_token:
-        return False
-    test_url = (
-        f"https://api.businesscentral.dynamics.com/v2.0/"
-        f"{BC_TENANT}/Production/ODataV4/"
-        f"Company('{BC_COMPANY}')/Items?$top=1"
-    )
-    try:
-        resp = timed_get(
-            test_url,
-            headers={"Authorization": f"Bearer {access_token}"}
-        )
-        return resp.status_code == 200
-    except requests.exceptions.RequestException:
-        return False
-
-def find_best_bc_item_match(vendor_desc: str, bc_options: list[dict], vendor: str = None) -> str | None:
-    """
-    Finds the best BC Item Number using a hybrid approach with strict validation:
-    1. Fuzzy String Similarity (Base Score 0-100)
-    2. ID Substring Matching (Bonus +61) -> STRICTLY for Numeric/Alphanumeric codes
-    3. Seminis Core Name Bonus (+100 per word) -> Emphasizes variety name over generic terms
-    4. Syngenta Capitalization Bonus (+20 per word) -> Weights uppercase vendor words higher
-    5. Tie-Breaking: If multiple items have the same top score, return None (Manual).
-    """
-    if not vendor_desc or not bc_options:
-        return None
-
-    # Normalization helper: Lowercase and space-separated punctuation
-    def normalize(text):
-        return re.sub(r'[^\w\s]', ' ', text.lower())
-
-    # Helper: Normalize to set of tokens
-    def get_tokens(text):
-        if not text: return set()
-        clean = normalize(text)
-        return set(clean.split())
+# Checked locally from the JWT's exp claim; BC itself is the judge only when a call comes back 401.
+TOKEN_EXPIRY_SKEW = 120  # seconds; treat a token this close to expiry as expired
+_token_expiry = {}  # access token -> exp (0 once BC has rejected it)
 
-    norm_vendor = normalize(vendor_desc)
-    vendor_tokens = set(norm_vendor.split())
-    
-    # --- 0a. Core Name Extraction (SEMINIS ONLY) ---
-    core_tokens = set()
-    if vendor == "seminis":
-        # Capture text between dash and the first digit of package size
-        match_core = re.search(r"-\s*(.+?)(?=\s+\d+)", vendor_desc.lower())
-        if match_core:
-            core_text = match_core.group(1)
-            core_tokens = get_tokens(core_text)
-
-    # --- 0b. Capitalized Word Extraction (SYNGENTA ONLY) ---
-    # Extract words that are fully uppercase and length > 2 (avoids 'KS', 'LB', 'EA')
-    capitalized_tokens = set()
-    if vendor == "syngenta":
-        # Split by non-word chars to handle punctuation attached to words
-        # Only keep words that are ALL CAPS and longer than 2 chars (e.g. FLAME, PAYLOAD)
-        raw_words = re.findall(r'\b[A-Z]{3,}\b', vendor_desc)
-        capitalized_tokens = set(raw_words)
-
-    best_match_no = None
-    best_score = 0
-    is_tie = False
-
-    for option in bc_options:
-        bc_desc = option.get("Description", "")
-        if not bc_desc:
-            continue
-        
-        bc_no = option.get("No", "")
-        norm_bc = normalize(bc_desc)
-        bc_tokens = set(norm_bc.split())
-
-        # --- Scoring Logic ---
-        score = 0
-
-        # 1. Fuzzy Similarity (Base Score 0-100)
-        sorted_vendor = " ".join(sorted(vendor_tokens))
-        sorted_bc = " ".join(sorted(bc_tokens))
-        
-        fuzzy_ratio = difflib.SequenceMatcher(None, sorted_vendor, sorted_bc).ratio()
-        score += fuzzy_ratio * 100 
-
-        # 2. Critical ID Match (Bonus +61)
-        id_match_found = False
-        for v_tok in vendor_tokens:
-            if len(v_tok) < 4 or v_tok.isalpha(): 
-                continue 
-            
-            for b_tok in bc_tokens:
-                if len(b_tok) < 4 or b_tok.isalpha(): 
-                    continue
-                
-                if v_tok == b_tok or v_tok in b_tok or b_tok in v_tok:
-                    score += 61 
-                    id_match_found = True
-                    break
-            if id_match_found: break
-
-        # 3. Core Name Bonus (Seminis Emphasis)
-        if core_tokens:
-            common_core = core_tokens.intersection(bc_tokens)
-            if common_core:
-                score += (len(common_core) * 100)
-
-        # 4. Capitalization Bonus (Syngenta)
-        # Boost score if a CAPITALIZED vendor word appears in the BC description
-        if capitalized_tokens:
-            for cap_word in capitalized_tokens:
-                # Check normalized BC tokens for the presence of this word
-                if cap_word.lower() in bc_tokens:
-                    # e.g. Vendor "PAYLOAD" (caps) matches BC "payload" (norm)
-                    score += 20 
-
-        # 5. Selection & Tie Detection
-        if score > best_score:
-            best_score = score
-            best_match_no = bc_no
-            is_tie = False
-        elif score == best_score and score > 0:
-            is_tie = True
-
-    # --- Strict Acceptance Criteria ---
-    if is_tie:
+def _jwt_exp(access_token: str) -> int | None:
+    """The exp claim of a JWT, without verifying its signature (MSAL got it from Entra ID for us)."""
+    try:
+        payload = access_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, ValueError, KeyError, TypeError):
         return None
 
-    # Threshold check
-    threshold = 60
-    if vendor == "hm_clause":
-        threshold = 30
-    if vendor == "syngenta":
-        threshold = 40  # Lowered threshold to work with Cap Bonus
-    if vendor == "seminis":
-        threshold = 50
-    if vendor == "nunhems":
-        threshold = 50
-    
-    if best_score >= threshold:
-        return best_match_no
-    
-    return None
-
-def aggregate_duplicate_lots(grouped_results: dict, vendor: str) -> dict:
-    """
-    Aggregates quantities and prices for duplicate lots based on the vendor.
-    """
-    if vendor == "sakata":
-        flattened_results = {}
-        for filename, items_list in grouped_results.items():
-            flat_lots_list = []
-            for item in items_list:
-                for lot in item.get("Lots", []):
-                    combined_lot = {k: v for k, v in item.items() if k != "Lots"}
-                    combined_lot.update(lot)
-                    if 'TotalQuantity' not in combined_lot:
-                         combined_lot['TotalQuantity'] = item.get('QtyShipped')
-                    flat_lots_list.append(combined_lot)
-            
-            if flat_lots_list:
-                flattened_results[filename] = flat_lots_list
-        grouped_results = flattened_results
-        
-    unique_items_map = {}
-    processed_grouped_results = {}
-
-    lot_keys = ["VendorLot", "VendorLotNo", "VendorProductLot"]
-    batch_keys = ["VendorBatchLot", "VendorBatchNo"]
-    desc_keys = ["VendorItemDescription", "VendorDescription"]
-
-    for filename, items_list in grouped_results.items():
-        processed_items_for_file = []
-        for item in items_list:
-            agg_key = None
-            
-            lot_no_raw = next((item.get(key) for key in lot_keys if item.get(key)), None)
-            lot_no = lot_no_raw.strip() if lot_no_raw else None
-
-            if vendor in ["hm_clause", "seminis"]:
-                batch_no_raw = next((item.get(key) for key in batch_keys if item.get(key)), None)
-                batch_no = batch_no_raw.strip() if batch_no_raw else None
-                if lot_no and batch_no:
-                    agg_key = (lot_no, batch_no)
-            
-            elif vendor in ["sakata", "syngenta"]:
-                item_no = item.get("VendorItemNumber")
-                if lot_no and item_no:
-                    agg_key = (lot_no, item_no)
-                elif lot_no:
-                    agg_key = (lot_no,)
-
-            if not agg_key:
-                processed_items_for_file.append(item)
-                continue
-
-            try:
-                current_qty = float(item.get("TotalQuantity", 0) or 0)
-                current_price = float(item.get("TotalPrice", 0) or 0)
-                current_upcharge = float(item.get("TotalUpcharge", 0) or 0)
-                current_discount = float(item.get("TotalDiscount", 0) or 0)
-            except (ValueError, TypeError):
-                processed_items_for_file.append(item)
-                continue
-
-            if agg_key in unique_items_map:
-                existing_item = unique_items_map[agg_key]
-                desc_key = next((key for key in desc_keys if key in existing_item), None)
-
-                # --- FIX: Smarter Description Merging ---
-                if desc_key:
-                    existing_desc = existing_item.get(desc_key, "")
-                    new_desc = item.get(desc_key, "")
-                    
-                    # If we haven't already marked it as combined, prepare the base description
-                    if "[COMBINED]" not in existing_desc:
-                        # For HM Clause: Pick the LONGEST description. 
-                        # This avoids cases where the first item has a truncated desc ("Pump...") 
-                        # but the second item has the full one ("Pump... Pail 30 Ks").
-                        best_desc = existing_desc
-                        if len(new_desc) > len(existing_desc):
-                            best_desc = new_desc
-                        
-                        if vendor == "hm_clause":
-                            existing_item[desc_key] = f"{best_desc} [COMBINED]"
-                        else:
-                            # Standard logic for others
-                            modified_desc = re.sub(r"\s+[\d,]+\s+\w+$", "", best_desc).strip()
-                            existing_item[desc_key] = f"{modified_desc} [COMBINED]"
-                
-                existing_qty = float(existing_item.get("TotalQuantity", 0) or 0)
-                existing_price = float(existing_item.get("TotalPrice", 0) or 0)
-                
-                existing_upcharge = float(existing_item.get("TotalUpcharge", 0) or 0)
-                existing_discount = float(existing_item.get("TotalDiscount", 0) or 0)
-                
-                existing_item["TotalQuantity"] = existing_qty + current_qty
-                existing_item["TotalPrice"] = existing_price + current_price
-                
-                existing_item["TotalUpcharge"] = existing_upcharge + current_upcharge
-                existing_item["TotalDiscount"] = existing_discount + current_discount
-                
-                new_total_qty = existing_item["TotalQuantity"]
-                new_total_price = existing_item["TotalPrice"]
-                new_total_upcharge = existing_item["TotalUpcharge"]
-                new_total_discount = existing_item["TotalDiscount"]
-                
-                cost_key = "USD_Actual_Cost_$"
-                if cost_key not in existing_item:
-                    cost_key = next((k for k in existing_item if "Cost" in k), "USD_Actual_Cost_$")
-
-                if new_total_qty > 0:
-                    if vendor == "sakata":
-                        pkg_qty = None
-                        desc = existing_item.get("VendorDescription", "")
-                        if m_pkg := re.search(r"(\d+)(?=\s*[Mm]\b|\s*[Ll][Bb]\b|M$|LB$)", desc):
-                            pkg_qty = int(m_pkg.group(1))
-
-                        if pkg_qty and pkg_qty > 0:
-                            total_seed_units = new_total_qty * pkg_qty
-                            if total_seed_units > 0:
-                                existing_item[cost_key] = round(new_total_price / total_seed_units, 4)
-                    else:
-                        if new_total_price:
-                            #existing_item[cost_key] = round(new_total_price / new_total_qty, 4)
-                            existing_item[cost_key] = round((new_total_price + new_total_upcharge - new_total_discount) / new_total_qty, 4)
-            else:
-                item["TotalQuantity"] = current_qty
-                item["TotalPrice"] = current_price
-                item["TotalUpcharge"] = current_upcharge
-                item["TotalDiscount"] = current_discount
-                unique_items_map[agg_key] = item
-                processed_items_for_file.append(item)
-
-        if processed_items_for_file:
-            processed_grouped_results[filename] = processed_items_for_file
-
-    return processed_grouped_results
+def token_is_valid(access_token: str) -> bool:
+    if not access_token:
+        return False
+    exp = _token_expiry.get(access_token)
+    if exp is None:
+        exp = _jwt_exp(access_token)
+        if exp is None:
+            return False
+        if len(_token_expiry) > 1000:
+            _token_expiry.clear()
+        _token_expiry[access_token] = exp
+    return exp - TOKEN_EXPIRY_SKEW > time.time()
+
+def mark_token_rejected(access_token: str):
+    """Record a 401 from BC so token_is_valid stops trusting the token's exp claim."""
+    if access_token:
+        _token_expiry[access_token] = 0
+        if has_request_context() and session.get("user_token") == access_token:
+            token_broker.invalidate(session.get("user_name"))
+
+def _note_rejected_token(resp: requests.Response, kwargs: dict):
+    if resp.status_code == 401:
+        auth = (kwargs.get("headers") or {}).get("Authorization", "")
+        if auth.startswith("Bearer "):
+            mark_token_rejected(auth[len("Bearer "):])
 
 @app.route("/api/items")
 def api_items():
@@ -472,37 +219,22 @@ def bc_options():
 
     try:
         from vendor_extractors.sakata import get_po_items
-        opts = get_po_items(po, session.get("user_token"))
+        opts = get_po_items(po, current_bc_token())
     except Exception as e:
         app.logger.error("bc-options lookup failed: %s", str(e))
         return jsonify([{"No": "ERROR", "Description": str(e)}])
 
     return jsonify(opts)
 
-# Treatments cache
-_treatments_cache = {}
+# Treatments (reference_cache datasets "treatments:<endpoint>")
+TREATMENTS_TTL = int(os.environ.get("TREATMENTS_TTL", "900"))
+TREATMENT_ENDPOINTS = ("Lot_Treatments_Card_Excel", "Lot_Treatments_Card_2_Excel")
 
-@timed_func("load_treatments")
-def load_treatments(endpoint: str, token: str) -> list[str]:
-    if endpoint in _treatments_cache:
-        return _treatments_cache[endpoint]
-    
-    # Validate token
+@timed_func("fetch_treatments")
+def _fetch_treatments(endpoint: str, token: str | None = None) -> list[str]:
+    # Background refreshes (and a caller whose token has expired) use the app-only token
     if not token_is_valid(token):
-        cache = load_cache()
-        msal_app = build_msal_app(cache)
-        app.logger.warning(f"Invalid token for endpoint {endpoint}, attempting refresh")
-        accounts = msal_app.get_accounts()
-        if accounts:
-            result = msal_app.acquire_token_silent(scopes=SCOPE_BC, account=accounts[0])
-            if "access_token" in result:
-                token = result["access_token"]
-            else:
-                app.logger.error(f"Silent token refresh failed: {result.get('error_description')}")
-                return []
-        else:
-            app.logger.error("No accounts available for token refresh")
-            return []
+        token = get_service_token()
 
     url = (
         f"https://api.businesscentral.dynamics.com/v2.0/"
@@ -513,44 +245,25 @@ def load_treatments(endpoint: str, token: str) -> list[str]:
         "Authorization": f"Bearer {token}",
         "Accept": "application/json"
     }
+    resp = timed_get(url, headers=headers)
+    rows = resp.json().get("value", [])
+    return [r["Treatment_Name"].strip() for r in rows if r.get("Treatment_Name")]
+
+def _register_treatments(endpoint: str) -> str:
+    name = f"treatments:{endpoint}"
+    reference_cache.register(name, partial(_fetch_treatments, endpoint), TREATMENTS_TTL)
+    return name
+
+for _endpoint in TREATMENT_ENDPOINTS:
+    _register_treatments(_endpoint)
+
+def load_treatments(endpoint: str, token: str) -> list[str]:
     try:
-        resp = timed_get(url, headers=headers)
-        rows = resp.json().get("value", [])
-        treatments = [r["Treatment_Name"].strip() for r in rows if r.get("Treatment_Name")]
-        _treatments_cache[endpoint] = treatments
-        return treatments
+        return reference_cache.get(_register_treatments(endpoint), token)
     except requests.exceptions.RequestException as e:
         app.logger.error(f"Failed to load treatments from {endpoint}: {e}")
         return []
 
-# Multiprocessing initializer
-def init_worker(pkg_descs: list[str]):
-    import vendor_extractors.sakata
-    vendor_extractors.sakata._pkg_desc_list = pkg_descs
-
-def _extract_hm_clause_file(path):
-    try:
-        return os.path.basename(path), extract_hm_clause_data(path)
-    except Exception as e:
-        app.logger.error(f"Error processing {path}: {e}")
-        return os.path.basename(path), []
-
-def _extract_seminis_file(path):
-    try:
-        # The Seminis extractor manages its own sub-files, so it just needs the main path
-        return os.path.basename(path), extract_seminis_invoice_data(path)
-    except Exception as e:
-        app.logger.error(f"Error processing {path}: {e}")
-        return os.path.basename(path), []
-    
-def _extract_nunhems_file(path):
-    try:
-        # The Nunhems extractor is designed to find its own related files in the same folder
-        return os.path.basename(path), extract_nunhems_invoice_data(path)
-    except Exception as e:
-        app.logger.error(f"Error processing {path} for Nunhems: {e}")
-        return os.path.basename(path), []
-    
 # Login required decorator
 def login_required(f):
     @wraps(f)
@@ -565,13 +278,10 @@ def sign_in():
     if session.get("user_token") and token_is_valid(session.get("user_token")):
         return redirect(url_for("index"))
 
-    cache = load_cache()
-    msal_app = build_msal_app(cache)
-    auth_url = msal_app.get_authorization_request_url(
+    auth_url = token_broker.app_for(None).get_authorization_request_url(
         scopes=SCOPE_BC,
         redirect_uri=url_for("auth_callback", _external=True)
     )
-    save_cache(cache)
     return redirect(auth_url)
 
 @app.route(REDIRECT_PATH)
@@ -585,8 +295,8 @@ def auth_callback():
     if not code:
         return "Authentication failed: No code received", 400
     
-    cache = load_cache()
-    msal_app = build_msal_app(cache)
+    cache = msal.SerializableTokenCache()
+    msal_app = token_broker.build_app(cache)
     
     result = msal_app.acquire_token_by_authorization_code(
         code=code,
@@ -600,21 +310,21 @@ def auth_callback():
     session.permanent = True
     session["user_token"] = result["access_token"]
     session["user_name"] = result.get("id_token_claims", {}).get("name", "User")
-    save_cache(cache)
+    token_broker.store_login(session["user_name"], cache, result)
     
     return redirect(url_for("index"))
 
 @app.route("/sign-out")
 def sign_out():
     user_name = session.get("user_name")
-    clear_cache()
+    token_broker.forget(user_name)
     session.clear()
     return redirect(url_for("sign_in", _external=True))
 
 @app.route("/logout")
 def logout():
     user_name = session.get("user_name")
-    clear_cache()
+    token_broker.forget(user_name)
     session.clear()
     return render_template("logout.html")
 
@@ -622,18 +332,21 @@ def logout():
 @app.route("/logs")
 @login_required
 def logs():
-    page = request.args.get('page', 1, type=int)
-    logs, total_logs = db_logger.get_paginated_logs(page=page, per_page=50)
+    before = request.args.get('before') or None
+    if not db_logger.parse_log_cursor(before):
+        before = None  # a mangled ?before= shows the first page rather than a 500
+    vendor = request.args.get('vendor') or None
+    logs, next_cursor = db_logger.get_paginated_logs(before=before, per_page=50, vendor=vendor)
     stats = db_logger.get_log_stats()
     
-    # Calculate total pages for pagination
-    total_pages = (total_logs + 49) // 50
-    
     return render_template("logs.html", 
                            logs=logs, 
                            stats=stats,
-                           current_page=page,
-                           total_pages=total_pages,
+                           before=before,
+                           vendor=vendor,
+                           next_cursor=next_cursor,
+                           azure_ocr_method=AZURE_OCR_METHOD,
+                           ocr_cache_method=OCR_CACHE_METHOD,
                            user_name=session.get("user_name"))
 
 # Admin route to fix stats manually on production ---
@@ -644,6 +357,55 @@ def fix_stats():
     message = db_logger.recalculate_stats()
     return f"<h1>Stats Maintenance</h1><p>{message}</p><p><a href='/logs'>Back to Logs</a></p>"
 
+# Connection pool size metrics (this process)
+@app.route("/metrics/db-pool")
+@login_required
+def db_pool_metrics():
+    return jsonify(db_pool.pool_stats())
+
+# Reference data (package descriptions, treatments, items): age and TTL of each dataset
+@app.route("/metrics/reference-cache")
+@login_required
+def reference_cache_metrics():
+    return jsonify(reference_cache.status())
+
+# Admin route to reload reference data now (e.g. right after adding a package description in BC)
+@app.route("/refresh-reference-data", methods=["GET", "POST"])
+@login_required
+def refresh_reference_data():
+    name = request.args.get("name") or None
+    if name and name not in reference_cache.status():
+        return jsonify({"message": f"Unknown dataset '{name}'"}), 404
+    errors = reference_cache.refresh(name, current_bc_token())
+    failed = {n: e for n, e in errors.items() if e}
+    return jsonify({"refreshed": [n for n, e in errors.items() if not e], "failed": failed,
+                    "datasets": reference_cache.status()}), 502 if failed else 200
+
+# Vendor extraction + BC enrichment, shared by the request handler and the job worker
+def build_vendor_results(vendor: str, pdf_files: list[tuple[str, bytes]], user_token: str) -> tuple[str, dict] | None:
+    """Run one vendor's pipeline on an upload batch. Returns (template, context), or None for an unknown vendor."""
+    spec = get_vendor(vendor)
+    if spec is None:
+        return None
+    if not spec.uses_bc:
+        return spec.template, dict(items=run_vendor_pipeline(spec, pdf_files))
+
+    # Load shared data from Business Central in the background, all three at once; the
+    # pipeline waits for package descriptions only when the vendor needs them, and the
+    # treatments only matter to the template
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        pkg_descs = pool.submit(load_package_descriptions, user_token)
+        treatments1 = pool.submit(load_treatments, "Lot_Treatments_Card_Excel", user_token)
+        treatments2 = pool.submit(load_treatments, "Lot_Treatments_Card_2_Excel", user_token)
+
+        final_grouped_results = run_vendor_pipeline(spec, pdf_files, user_token, pkg_descs=pkg_descs, po_lookup=get_po_items)
+        return spec.template, dict(
+            items=final_grouped_results,
+            treatments1=treatments1.result(),
+            treatments2=treatments2.result(),
+            pkg_descs=pkg_descs.result()
+        )
+
 # Main route
 @app.route("/", methods=["GET", "POST"])
 @login_required
@@ -651,12 +413,14 @@ def fix_stats():
 def index():
     user_token = session.get("user_token")
     if not token_is_valid(user_token):
-        session.pop("user_token", None)
+        user_token = current_bc_token()
+    if not user_token:
         session.pop("user_name", None)
         return redirect(url_for("sign_in"))
 
     if request.method == "POST":
         vendor = request.form.get("vendor")
+        spec = get_vendor(vendor)
         files = request.files.getlist("pdfs")
                 
         pdf_files = []
@@ -666,250 +430,269 @@ def index():
                 pdf_bytes = f.read()
                 pdf_files.append((safe_filename, pdf_bytes))
                 
-                # Save a temporary copy for the attachment process later ONLY for Kamterter
-                if vendor == "kamterter":
+                # Save a temporary copy for the attachment process later (Kamterter)
+                if spec and spec.keep_uploads:
                     temp_path = os.path.join(app.config["UPLOAD_FOLDER"], safe_filename)
                     with open(temp_path, "wb") as temp_file:
                         temp_file.write(pdf_bytes)
 
         if not pdf_files:
             return "No valid PDF files uploaded", 400
+        if spec is None:
+            return "Unsupported vendor selected", 400
 
-        if vendor == "sakata":
-            # Load shared data from Business Central
-            pkg_descs = load_package_descriptions(user_token)
-            treatments1 = load_treatments("Lot_Treatments_Card_Excel", user_token)
-            treatments2 = load_treatments("Lot_Treatments_Card_2_Excel", user_token)
+        async_mode = EXTRACTION_ASYNC or request.form.get("background") == "on"
+        if async_mode:
+            job_id = job_queue.enqueue(vendor, pdf_files, session.get("user_name"))
+            app.logger.info(f"Queued extraction job {job_id} ({vendor}, {len(pdf_files)} file(s))")
+            return redirect(url_for("job_status", job_id=job_id))
+
+        if EXTRACTION_STREAM and spec.iter_extract:
+            # Park the batch; the results page pulls it back through /jobs/<id>/stream
+            _prune_jobs_hourly()
+            job_id = job_queue.enqueue(vendor, pdf_files, session.get("user_name"),
+                                       status=job_queue.STATUS_STREAMING)
+            return redirect(url_for("job_status", job_id=job_id))
+
+        built = build_vendor_results(vendor, pdf_files, user_token)
+        if built is None:
+            return "Unsupported vendor selected", 400
+        template, context = built
+        return render_template(template, **context)
 
-            from vendor_extractors.sakata import extract_sakata_data_from_bytes
-            grouped_results = extract_sakata_data_from_bytes(pdf_files, token=user_token)
-            
-            # Aggregate duplicate lots
-            final_grouped_results = aggregate_duplicate_lots(grouped_results, vendor = "sakata")
+    stats = db_logger.get_log_stats()
+    return render_template("index.html", user_name=session.get("user_name"), stats=stats)
 
-            # Flatten the results to find all unique PO numbers
-            all_items = [item for items_list in final_grouped_results.values() for item in items_list]
-            all_pos = set(item.get("PurchaseOrder") for item in all_items if item.get("PurchaseOrder"))
+# Background job status; renders the vendor results page once the worker is done
+@app.route("/jobs/<int:job_id>")
+@login_required
+def job_status(job_id):
+    job = job_queue.get_job(job_id)
+    if not job or (job["user_name"] and job["user_name"] != session.get("user_name")):
+        return "Job not found", 404
+
+    if job["status"] == job_queue.STATUS_DONE:
+        result = job["result"]
+        return render_template(result["template"], **result["context"])
+
+    if job["status"] == job_queue.STATUS_STREAMING:
+        user_token = current_bc_token()
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            pkg_descs = pool.submit(load_package_descriptions, user_token)
+            treatments1 = pool.submit(load_treatments, "Lot_Treatments_Card_Excel", user_token)
+            treatments2 = pool.submit(load_treatments, "Lot_Treatments_Card_2_Excel", user_token)
+        return render_template(
+            get_vendor(job["vendor"]).template,
+            items={},
+            treatments1=treatments1.result(),
+            treatments2=treatments2.result(),
+            pkg_descs=pkg_descs.result(),
+            stream_url=url_for("job_stream", job_id=job_id),
+        )
 
-            if all_pos:
-                try:
-                    # Fetch BC options for all found POs at once
-                    po_items = get_po_items("|".join(all_pos), user_token)
-                    for item in all_items:
-                        # The BCOptions are already populated by the extractor, but this ensures consistency
-                        if item.get("PurchaseOrder"):
-                            item["BCOptions"] = po_items
-                        else:
-                            item["BCOptions"] = []
-                        
-                        # Find the best matching BC item
-                        vendor_desc = item.get("VendorDescription", "") # Corrected key from VendorItemDescription
-                        item["SuggestedBCItemNo"] = find_best_bc_item_match(vendor_desc, item["BCOptions"], vendor=vendor)
-                        
-                except Exception as e:
-                    app.logger.error(f"Failed to fetch PO items: {e}")
-                    for item in all_items:
-                        item["BCOptions"] = [{"No": "ERROR", "Description": str(e)}]
-
-            return render_template(
-                "results_sakata.html",
-                items=final_grouped_results,
-                treatments1=treatments1,
-                treatments2=treatments2,
-                pkg_descs=pkg_descs
-            )
-        
-        elif vendor == "hm_clause":
-            # 1. Load shared data from BC first
-            pkg_descs = load_package_descriptions(user_token)
-            treatments1 = load_treatments("Lot_Treatments_Card_Excel", user_token)
-            treatments2 = load_treatments("Lot_Treatments_Card_2_Excel", user_token)
-
-            grouped_results = extract_hm_clause_data_from_bytes(pdf_files)
-            
-            # Aggregate duplicate lots
-            final_grouped_results = aggregate_duplicate_lots(grouped_results, vendor = "hm_clause")
-
-            # 3. Create a flat list for post-processing
-            all_items_flat = [item for items_list in final_grouped_results.values() for item in items_list]
-            
-            # 4. Fetch all PO data at once
-            all_pos = set(item.get("PurchaseOrder") for item in all_items_flat if item.get("PurchaseOrder"))
-            po_items_for_all = []
-            if all_pos:
-                try:
-                    po_items_for_all = get_po_items("|".join(all_pos), user_token)
-                except Exception as e:
-                    app.logger.error(f"Failed to fetch PO items for HM Clause: {e}")
-                    po_items_for_all = [{"No": "ERROR", "Description": str(e)}]
-            
-            # 5. Enrich each item with PO options and package description
-            for item in all_items_flat:
-                if item.get("PurchaseOrder"):
-                    item["BCOptions"] = po_items_for_all
-                else:
-                    item["BCOptions"] = []
-                    
-                vendor_desc = item.get("VendorItemDescription", "")
-                item["SuggestedBCItemNo"] = find_best_bc_item_match(vendor_desc, item["BCOptions"], vendor=vendor)
-                
-                # Find and add the best package description
-                item["PackageDescription"] = find_best_hm_clause_package_description(vendor_desc, pkg_descs)
-            
-            # 6. Render the template
-            return render_template(
-                "results_hm_clause.html",
-                items=final_grouped_results,
-                treatments1=treatments1,
-                treatments2=treatments2,
-                pkg_descs=pkg_descs
-            )
-
-        elif vendor == "seminis":
-            # 1. Load shared data from BC
-            pkg_descs = load_package_descriptions(user_token)
-            treatments1 = load_treatments("Lot_Treatments_Card_Excel", user_token)
-            treatments2 = load_treatments("Lot_Treatments_Card_2_Excel", user_token)
-
-            # 2. Call the new in-memory extractor directly
-            grouped_results = extract_seminis_data_from_bytes(pdf_files, pkg_descs)
-            
-            # Aggregate duplicate lots
-            final_grouped_results = aggregate_duplicate_lots(grouped_results, vendor = "seminis")
-            
-            # 3. Flatten results for post-processing
-            all_items_flat = [item for items_list in final_grouped_results.values() for item in items_list]
-
-            # 4. Fetch all PO data at once
-            all_pos = set(item.get("PurchaseOrder") for item in all_items_flat if item.get("PurchaseOrder"))
-            po_items_for_all = []
-            if all_pos:
-                try:
-                    po_items_for_all = get_po_items("|".join(all_pos), user_token)
-                except Exception as e:
-                    app.logger.error(f"Failed to fetch PO items for Seminis: {e}")
-                    po_items_for_all = [{"No": "ERROR", "Description": str(e)}]
-
-            # 5. Enrich each item with BC options and package descriptions
-            for item in all_items_flat:
-                item["BCOptions"] = po_items_for_all if item.get("PurchaseOrder") else []
-                vendor_desc = item.get("VendorItemDescription", "")
-                item["SuggestedBCItemNo"] = find_best_bc_item_match(vendor_desc, item["BCOptions"], vendor=vendor)
-                #item["PackageDescription"] = find_best_seminis_package_description(vendor_desc, pkg_descs)
-
-            # 6. Render the template
-            return render_template(
-                "results_seminis.html",
-                items=final_grouped_results,
-                treatments1=treatments1,
-                treatments2=treatments2,
-                pkg_descs=pkg_descs
-            )
-        
-        elif vendor == "nunhems":
-            # 1. Load shared data from BC first
+    return render_template("job_status.html", job=job, user_name=session.get("user_name"))
+
+# NDJSON feed for a streaming results page: one "file" event per extracted file,
+# "update" events for cards a later file merged a duplicate lot into, then "done"
+@app.route("/jobs/<int:job_id>/stream")
+@login_required
+def job_stream(job_id):
+    job = job_queue.get_job(job_id)
+    if not job or (job["user_name"] and job["user_name"] != session.get("user_name")):
+        return "Job not found", 404
+    user_token = current_bc_token()
+    if not user_token:
+        return "Session expired", 401
+    job = job_queue.start_stream(job_id)
+    if job is None:
+        return "Job already started", 409
+
+    vendor = job["vendor"]
+    spec = get_vendor(vendor)
+
+    def generate():
+        start = time.perf_counter()
+        finished = False
+        try:
             pkg_descs = load_package_descriptions(user_token)
-            treatments1 = load_treatments("Lot_Treatments_Card_Excel", user_token)
-            treatments2 = load_treatments("Lot_Treatments_Card_2_Excel", user_token)
+            unique_items_map = {}
+            item_indexes = {}  # id(item) -> data-item-idx of its card
+            po_cache = {}
+            final_grouped_results = {}
+
+            for filename, items in spec.iter_extract(job["pdf_files"], pkg_descs):
+                merged = []
+                processed = aggregate_duplicate_lots({filename: items}, vendor, unique_items_map, merged)
+                item_list = processed.get(filename, [])
+
+                # PO options for this file's POs; files of one batch usually share them
+                pos = frozenset(i.get("PurchaseOrder") for i in item_list if i.get("PurchaseOrder"))
+                if pos not in po_cache:
+                    po_cache[pos] = fetch_po_options(item_list, get_po_items, user_token)
+                attach_bc_options(item_list, spec, po_cache[pos], pkg_descs)
+
+                for item in merged:
+                    if id(item) in item_indexes:
+                        yield json.dumps({
+                            "type": "update",
+                            "item_idx": item_indexes[id(item)],
+                            "html": render_template(f"partials/{vendor}_card.html", item=item,
+                                                    item_idx=item_indexes[id(item)], pkg_descs=pkg_descs),
+                        }) + "\n"
+
+                if not item_list:
+                    continue
+                start_idx = len(item_indexes)
+                for offset, item in enumerate(item_list):
+                    item_indexes[id(item)] = start_idx + offset
+                final_grouped_results[filename] = item_list
+                yield json.dumps({
+                    "type": "file",
+                    "filename": filename,
+                    "html": render_template(f"partials/{vendor}_file.html", filename=filename, item_list=item_list,
+                                            start_idx=start_idx, pkg_descs=pkg_descs),
+                }) + "\n"
+
+            # A refresh of /jobs/<id> renders the finished page like any background job
+            job_queue.complete_job(job_id, {
+                "template": spec.template,
+                "context": dict(
+                    items=final_grouped_results,
+                    treatments1=load_treatments("Lot_Treatments_Card_Excel", user_token),
+                    treatments2=load_treatments("Lot_Treatments_Card_2_Excel", user_token),
+                    pkg_descs=pkg_descs,
+                ),
+            })
+            finished = True
+            app.logger.info(f"Streamed job {job_id} ({vendor}, {len(final_grouped_results)} file(s)) "
+                            f"in {time.perf_counter() - start:.2f}s")
+            yield json.dumps({"type": "done"}) + "\n"
+        except Exception as e:
+            app.logger.error(f"Streaming job {job_id} failed: {e}")
+            job_queue.fail_job(job_id, str(e))
+            finished = True
+            yield json.dumps({"type": "error", "message": str(e)}) + "\n"
+        finally:
+            # A client disconnect closes the generator with GeneratorExit, which the except above
+            # does not see; without this the job would stay running and every reload get a 409
+            if not finished:
+                app.logger.warning(f"Streaming job {job_id} closed before it finished")
+                job_queue.fail_job(job_id, "Results stream closed before extraction finished")
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"})
+
+
+# --- BC company id and native-API URLs, per environment ---
+# The company GUID never changes, so it is looked up once per environment and shared
+# by every request; an entry is only dropped when BC answers 404 for a URL built from it.
+_bc_company_cache = {}  # bc_env -> {"company_id", "api_root", "api_base", "std_base"}
+
+def bc_company_urls(bc_env: str, token: str, refresh: bool = False) -> dict | None:
+    """
+    Company id and API base URLs for bc_env; None if BC_COMPANY does not exist there.
+    Raises requests.HTTPError if the companies lookup itself fails.
+    """
+    if not refresh and bc_env in _bc_company_cache:
+        return _bc_company_cache[bc_env]
 
-            grouped_results = extract_nunhems_data_from_bytes(pdf_files, pkg_descs)
-            
-            # Aggregate duplicate lots
-            final_grouped_results = aggregate_duplicate_lots(grouped_results, vendor = "nunhems")
+    env_root = f"https://api.businesscentral.dynamics.com/v2.0/{BC_TENANT}/{bc_env}"
+    company_url = f"{env_root}/api/v2.0/companies?$filter=name eq '{_odata_quote(BC_COMPANY)}'"
+    comp_resp = timed_get(company_url, headers={"Authorization": f"Bearer {token}", "Accept": "application/json"})
+    company_id = (comp_resp.json().get("value") or [{}])[0].get("id")
+    if not company_id:
+        _bc_company_cache.pop(bc_env, None)
+        return None
 
-            # 3. Create a flat list for post-processing
-            all_items_flat = [item for items_list in final_grouped_results.values() for item in items_list]
+    # Native API base URL uses Publisher/Group/Version from the AL code
+    api_root = f"{env_root}/api/PVORA/VendorInvoiceAutomation/v2.0"
+    urls = {
+        "company_id": company_id,
+        "api_root": api_root,
+        "api_base": f"{api_root}/companies({company_id})",
+        "std_base": f"{env_root}/api/v2.0/companies({company_id})",
+    }
+    _bc_company_cache[bc_env] = urls
+    app.logger.info(f"BC company id for {bc_env}: {company_id}")
+    return urls
 
-            # 4. Fetch all PO data at once
-            all_pos = set(item.get("PurchaseOrder") for item in all_items_flat if item.get("PurchaseOrder"))
-            po_items_for_all = []
-            if all_pos:
-                try:
-                    po_items_for_all = get_po_items("|".join(all_pos), user_token)
-                except Exception as e:
-                    app.logger.error(f"Failed to fetch PO items for Nunhems: {e}")
-                    po_items_for_all = [{"No": "ERROR", "Description": str(e)}]
-
-            # 5. Enrich each item with PO options and package description
-            for item in all_items_flat:
-                item["BCOptions"] = po_items_for_all if item.get("PurchaseOrder") else []
-                vendor_desc = item.get("VendorItemDescription", "")
-                item["SuggestedBCItemNo"] = find_best_bc_item_match(vendor_desc, item["BCOptions"], vendor=vendor)
-            
-            # 6. Render the template
-            return render_template(
-                "results_nunhems.html",
-                items=final_grouped_results,
-                treatments1=treatments1,
-                treatments2=treatments2,
-                pkg_descs=pkg_descs
-            )
-
-        elif vendor == "syngenta":
-            # 1. Load shared data from Business Central
-            pkg_descs = load_package_descriptions(user_token)
-            treatments1 = load_treatments("Lot_Treatments_Card_Excel", user_token)
-            treatments2 = load_treatments("Lot_Treatments_Card_2_Excel", user_token)
-
-            # 2. Extract Data using the new Syngenta module
-            grouped_results = extract_syngenta_data_from_bytes(pdf_files, pkg_descs)
-            
-            # 3. Aggregate duplicates (combines split lots if any)
-            final_grouped_results = aggregate_duplicate_lots(grouped_results, vendor="syngenta")
-
-            # 4. Flatten results to process POs efficiently
-            all_items_flat = [item for items_list in final_grouped_results.values() for item in items_list]
-            
-            # 5. Fetch PO Items for ALL unique POs found in one request (Bulk Fetch)
-            all_pos = set(item.get("PurchaseOrder") for item in all_items_flat if item.get("PurchaseOrder"))
-            po_items_for_all = []
-            
-            if all_pos:
-                try:
-                    # Joins all POs (e.g., "PO-1001|PO-1002") for a single API call
-                    po_items_for_all = get_po_items("|".join(all_pos), user_token)
-                except Exception as e:
-                    app.logger.error(f"Failed to fetch PO items for Syngenta: {e}")
-                    po_items_for_all = [{"No": "ERROR", "Description": str(e)}]
-
-            # 6. Enrich items with BC Options and Suggestions
-            for item in all_items_flat:
-                # Assign the bulk-fetched options if the item has a PO
-                item["BCOptions"] = po_items_for_all if item.get("PurchaseOrder") else []
-
-                # Find best match based on description
-                vendor_desc = item.get("VendorItemDescription", "")
-                item["SuggestedBCItemNo"] = find_best_bc_item_match(vendor_desc, item["BCOptions"], vendor=vendor)
-
-            # 7. Render Template
-            return render_template(
-                "results_syngenta.html",
-                items=final_grouped_results,
-                treatments1=treatments1,
-                treatments2=treatments2,
-                pkg_descs=pkg_descs
-            )
-            
-        elif vendor == "kamterter":
-            grouped_results = extract_kamterter_data_from_bytes(pdf_files)
-            return render_template("results_kamterter.html", items=grouped_results)
-
-        elif vendor == "kamterter_shipping":
-            # ponytail: simple branch just renders grouped results; no temp-save, no BC calls
-            grouped_results = extract_kamterter_shipping_data_from_bytes(pdf_files)
-            return render_template("results_kamterter_shipping.html", items=grouped_results)
+# --- Purchase line submission for create_purchase_invoice ---
+# "batch" sends lines through the API's $batch endpoint; "parallel" POSTs them individually
+BC_LINES_MODE = os.environ.get("BC_LINES_MODE", "batch").lower()
+BC_BATCH_SIZE = int(os.environ.get("BC_BATCH_SIZE", "100"))  # BC accepts at most 100 operations per $batch
+BC_LINE_CONCURRENCY = int(os.environ.get("BC_LINE_CONCURRENCY", "4"))
 
-        else:
-            for path in pdf_paths:
-                try:
-                    os.remove(path)
-                except Exception as e:
-                    app.logger.error(f"Could not delete {path}: {e}")
-            return "Unsupported vendor selected", 400
+def _line_result(line_no: int, status: int, error: str | None = None) -> dict:
+    return {"line": line_no, "status": status, "ok": status in (200, 201), "error": error}
 
-    stats = db_logger.get_log_stats()
-    return render_template("index.html", user_name=session.get("user_name"), stats=stats)
+def _post_lines_batch(api_root: str, entity_path: str, payloads: list[dict], headers: dict) -> list[dict] | None:
+    """
+    POSTs lines through {api_root}/$batch, BC_BATCH_SIZE per request, and maps
+    each response back to its line (1-based). None if $batch itself is refused.
 
+    Each request is one atomicity group (changeset), so BC commits a chunk's
+    lines together or not at all; a failed chunk reports every one of its lines
+    as failed.
+    """
+    results = []
+    for start in range(0, len(payloads), BC_BATCH_SIZE):
+        chunk = payloads[start:start + BC_BATCH_SIZE]
+        group = f"lines{start // BC_BATCH_SIZE + 1}"
+        batch_body = {"requests": [{
+            "method": "POST",
+            "id": str(start + i + 1),
+            "atomicityGroup": group,
+            "url": entity_path,
+            "headers": {"Content-Type": "application/json"},
+            "body": payload,
+        } for i, payload in enumerate(chunk)]}
+        resp = timed_post_raw(f"{api_root}/$batch", headers={**headers, "Accept": "application/json"}, json=batch_body)
+        if resp.status_code in (400, 404, 405, 501) and not results:
+            app.logger.warning(f"$batch refused ({resp.status_code}): {_bc_error_message(resp)}")
+            return None
+        if resp.status_code != 200:
+            error = _bc_error_message(resp)
+            results.extend(_line_result(start + i + 1, resp.status_code, error) for i in range(len(chunk)))
+            continue
+
+        by_id = {r.get("id"): r for r in resp.json().get("responses", [])}
+        chunk_results = []
+        for i in range(len(chunk)):
+            line_no = start + i + 1
+            r = by_id.get(str(line_no))
+            if r is None:
+                chunk_results.append(_line_result(line_no, 502, "No response for this line in $batch reply"))
+                continue
+            status = int(r.get("status", 500))
+            error = None
+            if status not in (200, 201):
+                body = r.get("body") or {}
+                error = (body.get("error") or {}).get("message") if isinstance(body, dict) else str(body)
+                error = error or f"HTTP {status}"
+            chunk_results.append(_line_result(line_no, status, error))
+
+        # The changeset was rolled back, so lines BC reported as created did not stick either
+        first_failed = next((r for r in chunk_results if not r["ok"]), None)
+        if first_failed:
+            rolled_back = f"Rolled back with Line {first_failed['line']}: {first_failed['error']}"
+            chunk_results = [r if not r["ok"] else _line_result(r["line"], 424, rolled_back)
+                             for r in chunk_results]
+        results.extend(chunk_results)
+    return results
+
+def _post_lines_parallel(lines_url: str, payloads: list[dict], headers: dict) -> list[dict]:
+    """One POST per line, BC_LINE_CONCURRENCY at a time (for environments without $batch)."""
+    def post(indexed):
+        line_no, payload = indexed
+        try:
+            resp = timed_post_raw(lines_url, headers=headers, json=payload)
+        except requests.exceptions.RequestException as e:
+            return _line_result(line_no, 502, str(e))
+        return _line_result(line_no, resp.status_code,
+                            None if resp.status_code in (200, 201) else _bc_error_message(resp))
+
+    with ThreadPoolExecutor(max_workers=max(1, BC_LINE_CONCURRENCY)) as pool:
+        return list(pool.map(post, enumerate(payloads, start=1)))
 
 # --- Purchase Invoice Creation Route (Kamterter | OData V4) ---
 @app.route("/create-purchase-invoice", methods=["POST"])
@@ -918,18 +701,9 @@ def index():
 def create_purchase_invoice():
     data = request.get_json(force=True)
     app.logger.info(f"Received data for invoice creation: {data}")
-    token = session.get("user_token")
-
-    # 1. Refresh Token
-    cache = load_cache()
-    msal_app = build_msal_app(cache)
-    accounts = msal_app.get_accounts()
-    if accounts:
-        result = msal_app.acquire_token_silent(scopes=SCOPE_BC, account=accounts[0])
-        if result and "access_token" in result:
-            token = result["access_token"]
-            session["user_token"] = token
-            save_cache(cache)
+
+    # 1. Token (cached by the broker until close to expiry)
+    token = current_bc_token()
     
     if not token:
         return jsonify({"message": "Authentication token missing"}), 401
@@ -964,24 +738,19 @@ def create_purchase_invoice():
     # ==========================================
     # 3. NATIVE API ROUTE SETUP
     # ==========================================
-    # Get the Company ID (GUID) required for native APIs
-    company_url = f"https://api.businesscentral.dynamics.com/v2.0/{BC_TENANT}/{bc_env}/api/v2.0/companies?$filter=name eq '{BC_COMPANY}'"
-    comp_resp = requests.get(company_url, headers=headers)
-    
-    if comp_resp.status_code != 200:
-        app.logger.error(f"❌ Failed to fetch Company ID: {comp_resp.text}")
-        return jsonify({"message": "Failed to fetch Company ID", "details": comp_resp.text}), 500
-
-    company_id = comp_resp.json().get("value", [{}])[0].get("id")
-    if not company_id:
+    # Company id and API base URLs, cached per environment after the first invoice
+    try:
+        bc_company = bc_company_urls(bc_env, token)
+    except requests.exceptions.HTTPError as e:
+        app.logger.error(f"❌ Failed to fetch Company ID: {e.response.text}")
+        return jsonify({"message": "Failed to fetch Company ID", "details": e.response.text}), 500
+    if not bc_company:
         return jsonify({"message": f"Company '{BC_COMPANY}' not found"}), 404
 
-    # Build the Native API Base URL using Publisher/Group/Version from AL code
-    api_base = (
-        f"https://api.businesscentral.dynamics.com/v2.0/"
-        f"{BC_TENANT}/{bc_env}/api/PVORA/VendorInvoiceAutomation/v2.0/"
-        f"companies({company_id})"
-    )
+    company_id = bc_company["company_id"]
+    api_root = bc_company["api_root"]
+    api_base = bc_company["api_base"]
+    std_base = bc_company["std_base"]
     
     # Use the EntitySetName defined in the AL Pages
     headers_url = f"{api_base}/PurchaseHeaders"
@@ -1000,6 +769,22 @@ def create_purchase_invoice():
     app.logger.info(f"Payload: {json.dumps(header_payload, indent=2)}")
     
     header_resp = requests.post(headers_url, headers=headers, json=header_payload)
+
+    if header_resp.status_code == 404:
+        # The cached company id may be stale (company recreated, environment restored)
+        app.logger.warning(f"PurchaseHeaders returned 404 in {bc_env}; re-resolving company id")
+        try:
+            refreshed = bc_company_urls(bc_env, token, refresh=True)
+        except requests.exceptions.HTTPError:
+            refreshed = None
+        if refreshed and refreshed["company_id"] != company_id:
+            company_id = refreshed["company_id"]
+            api_root = refreshed["api_root"]
+            api_base = refreshed["api_base"]
+            std_base = refreshed["std_base"]
+            headers_url = f"{api_base}/PurchaseHeaders"
+            lines_url = f"{api_base}/PurchaseLines"
+            header_resp = requests.post(headers_url, headers=headers, json=header_payload)
     
     if header_resp.status_code not in (200, 201):
         app.logger.error(f"❌ HEADER FAILED: {header_resp.status_code}")
@@ -1032,49 +817,47 @@ def create_purchase_invoice():
 
     app.logger.info(f"✅ Header Created & Verified: {document_no}")
 
-    # 5. Create Lines
+    # 5. Create Lines (one $batch request per BC_BATCH_SIZE lines)
     app.logger.info(f"=== CREATE PURCHASE LINES (Count: {len(purchase_lines)}) ===")
-    
-    success_count = 0
-    current_line_no = 10000 
-    
-    for idx, line in enumerate(purchase_lines, start=1):
-        
-        line_payload = {
-            "Document_Type": "Invoice",
-            "Document_No": document_no,
-            "Line_No": current_line_no, 
-            "Type": line["Type"],                 
-            "No": line["No"],
-            "Description": line.get("Description", ""),
-            "Quantity": float(line["Quantity"]),
-            "Direct_Unit_Cost": float(line["Direct_Unit_Cost"])
-        }
-        
-        line_resp = requests.post(lines_url, headers=headers, json=line_payload)
-        
-        if line_resp.status_code in (200, 201):
-            success_count += 1
-            current_line_no += 10000
-        else:
-            app.logger.error(f"❌ Line {idx} Failed")
-            app.logger.error(line_resp.text)
-            
-            # Attempt to parse the exact Business Central error message
-            bc_error_msg = line_resp.text
-            try:
-                bc_error_json = line_resp.json()
-                if "error" in bc_error_json and "message" in bc_error_json["error"]:
-                    bc_error_msg = bc_error_json["error"]["message"]
-            except Exception:
-                pass # Fallback to raw text if it's not JSON
-                
-            return jsonify({
-                "message": f"Failed to create Line {idx}",
-                "details": bc_error_msg
-            }), line_resp.status_code 
 
-    app.logger.info(f"✅ FINISHED: {success_count} lines created successfully.")
+    line_payloads = [{
+        "Document_Type": "Invoice",
+        "Document_No": document_no,
+        "Line_No": 10000 * idx,
+        "Type": line["Type"],
+        "No": line["No"],
+        "Description": line.get("Description", ""),
+        "Quantity": float(line["Quantity"]),
+        "Direct_Unit_Cost": float(line["Direct_Unit_Cost"])
+    } for idx, line in enumerate(purchase_lines, start=1)]
+
+    line_results = None
+    if BC_LINES_MODE == "batch":
+        line_results = _post_lines_batch(api_root, f"companies({company_id})/PurchaseLines", line_payloads, headers)
+        if line_results is None:
+            app.logger.warning("$batch unavailable; posting lines individually")
+    if line_results is None:
+        line_results = _post_lines_parallel(lines_url, line_payloads, headers)
+    if any(r["status"] == 401 for r in line_results):
+        # Parallel posts ran on pool threads with no request context, so the broker is told from here
+        mark_token_rejected(token)
+
+    success_count = sum(1 for r in line_results if r["ok"])
+    failed = [r for r in line_results if not r["ok"]]
+    if failed:
+        first = failed[0]
+        app.logger.error(f"❌ {len(failed)} of {len(line_results)} line(s) failed; first: Line {first['line']}: {first['error']}")
+        if not success_count:
+            # Nothing rolls back the header, so say it is there to be completed or deleted in BC
+            return jsonify({
+                "message": f"Failed to create Line {first['line']}; invoice {document_no} was left in BC without lines",
+                "details": first["error"],
+                "No": document_no,
+                "lines_created": 0,
+                "lines": line_results
+            }), first["status"] if first["status"] >= 400 else 502
+    else:
+        app.logger.info(f"✅ FINISHED: {success_count} lines created successfully.")
     
     # ==========================================
     # 6. ATTACH THE PDF TO THE INVOICE
@@ -1094,7 +877,7 @@ def create_purchase_invoice():
 
                 # if company_id:
                     # B. Create the Attachment Metadata (Placeholder)
-                attach_url = f"https://api.businesscentral.dynamics.com/v2.0/{BC_TENANT}/{bc_env}/api/v2.0/companies({company_id})/documentAttachments"
+                attach_url = f"{std_base}/documentAttachments"
                 attach_payload = {
                     "parentId": system_id,
                     "fileName": filename,
@@ -1133,10 +916,24 @@ def create_purchase_invoice():
                 except Exception as e:
                     app.logger.error(f"⚠️ Could not delete temp file {filepath}: {e}")
                     
+    if failed:
+        # Some chunks committed and others did not: the invoice exists but is missing lines
+        return jsonify({
+            "status": "partial",
+            "message": f"Purchase invoice {document_no} created with {success_count} of "
+                       f"{len(line_results)} lines; add the failed lines in BC",
+            "details": failed[0]["error"],
+            "No": document_no,
+            "lines_created": success_count,
+            "lines_failed": len(failed),
+            "lines": line_results
+        }), 207
+
     return jsonify({
         "message": "Purchase invoice created",
         "No": document_no,
-        "lines_created": success_count
+        "lines_created": success_count,
+        "lines": line_results
     }), 201
 
 # --- Kamterter Shipping: sandbox-only OData update route ---
@@ -1166,17 +963,8 @@ def update_kamterter_shipping_report():
     except Exception:
         return jsonify({"error": "Invalid est_date_from_treater"}), 400
 
-    # Acquire/refetch token using existing MSAL silent pattern
-    token = session.get("user_token")
-    cache = load_cache()
-    msal_app = build_msal_app(cache)
-    accounts = msal_app.get_accounts()
-    if accounts:
-        result = msal_app.acquire_token_silent(scopes=SCOPE_BC, account=accounts[0])
-        if result and "access_token" in result:
-            token = result["access_token"]
-            session["user_token"] = token
-            save_cache(cache)
+    # Token from the broker (cached until close to expiry)
+    token = current_bc_token()
 
     if not token:
         return jsonify({"error": "Authentication token missing"}), 401
@@ -1264,97 +1052,70 @@ def update_kamterter_shipping_report():
         "est_date_from_treater": est_date,
     })
     
-# Lot creation endpoint
-@app.route("/create-lot", methods=["POST"])
-@login_required
-@timed_func("create_lot")
-def create_lot():
+# --- Lot creation (Lot_Info_Card | OData V4) ---
+# Lots in one /create-lots request are POSTed this many at a time
+BC_LOT_CONCURRENCY = int(os.environ.get("BC_LOT_CONCURRENCY", "4"))
+
+def _normalize_lot_text(val):
+    if val is None:
+        return ""
+    val_str = str(val).strip()
+    return "" if val_str.lower() == "none" else val_str
+
+def _parse_lot_decimal(val):
+    s = str(val or "").strip()
+    if not s or s.lower() == "none":
+        return None
+    try:
+        return float(s)
+    except ValueError:
+        return None
 
-    # Silent MSAL refresh on every create_lot call
-    cache = load_cache()
-    msal_app = build_msal_app(cache)
-    accounts = msal_app.get_accounts()
-    if accounts:
-        result = msal_app.acquire_token_silent(
-            scopes=SCOPE_BC,
-            account=accounts[0]
-        )
-        if "access_token" in result:
-            session["user_token"] = result["access_token"]
-            app.logger.info("Token refreshed successfully")
-            save_cache(cache)
-        else:
-            app.logger.error("Silent token refresh failed: %s", result.get("error_description", "No details"))
-            session.pop("user_token", None)
-            session.pop("user_name", None)
-            return redirect(url_for("sign_in"))
-    else:
-        app.logger.warning("No accounts found for silent token refresh")
-        session.pop("user_token", None)
-        session.pop("user_name", None)
-        return redirect(url_for("sign_in"))
-    
-    def normalize_text(val):
-        if val is None:
-            return ""
-        val_str = str(val).strip()
-        return "" if val_str.lower() == "none" else val_str
+def _parse_lot_integer(val):
+    s = str(val or "").strip()
+    if not s or s.lower() == "none":
+        return None
+    try:
+        # Convert to float first to handle decimals (e.g., "123.0")
+        return int(float(s))
+    except (ValueError, TypeError):
+        return None
 
-    data = request.get_json()
-    vendor = normalize_text(data.get("vendor"))
-    print(f"Received data for lot creation: {data}")
-    def parse_decimal(val):
-        s = str(val or "").strip()
-        if not s or s.lower() == "none":
-            return None
-        try:
-            return float(s)
-        except ValueError:
-            return None
-    
-    def parse_integer(val):
-        s = str(val or "").strip()
-        if not s or s.lower() == "none":
-            return None
-        try:
-            # Convert to float first to handle decimals (e.g., "123.0")
-            return int(float(s))
-        except (ValueError, TypeError):
-            return None
-    
-    # Extract and normalize all fields
-    item_no        = normalize_text(data.get("BCItemNo"))
-    vendor_lot     = normalize_text(data.get("VendorLotNo"))
-    vendor_batch   = normalize_text(data.get("VendorBatchLot"))
-    country        = normalize_text(data.get("OriginCountry"))
-    td1            = normalize_text(data.get("TreatmentsDescription"))
-    td2_text       = normalize_text(data.get("TreatmentsDescription2"))
-    seed_size      = normalize_text(data.get("SeedSize"))
-    raw_sprout     = normalize_text(data.get("SproutCount"))
-    ktt            = normalize_text(data.get("KTT"))
-    seed_count     = parse_decimal(data.get("SeedCount"))
-    germ_pct       = normalize_text(data.get("CurrentGerm"))
-    pure           = parse_decimal(data.get("Purity"))
-    inert          = parse_decimal(data.get("Inert"))
-    grower_germ    = parse_decimal(data.get("GrowerGerm"))
-    usd_cost_val   = parse_decimal(data.get("USD_Actual_Cost_$"))
-    original_received_qty = parse_integer(data.get("TotalQuantity"))
-
-    raw_date            = normalize_text(data.get("CurrentGermDate"))
-    raw_grower_date     = normalize_text(data.get("GrowerGermDate"))
-
-    pkg_desc_val   = normalize_text(data.get("PackageDescription"))
-    
-    def normalize_date(raw):
-        try:
-            if re.match(r"\d{2}/\d{2}/\d{2}$", raw):  # e.g., 04/22/25
-                raw = re.sub(r"/(\d{2})$", lambda m: f"/20{m.group(1)}", raw)
-            return datetime.strptime(raw, "%m/%d/%Y").date().isoformat()
-        except Exception:
-            return None
+def _normalize_lot_date(raw):
+    try:
+        if re.match(r"\d{2}/\d{2}/\d{2}$", raw):  # e.g., 04/22/25
+            raw = re.sub(r"/(\d{2})$", lambda m: f"/20{m.group(1)}", raw)
+        return datetime.strptime(raw, "%m/%d/%Y").date().isoformat()
+    except Exception:
+        return None
 
-    germ_date_iso = normalize_date(raw_date)
-    grower_germ_date_iso = normalize_date(raw_grower_date)
+def _build_lot_payload(data: dict) -> tuple[str, dict]:
+    """Turns one results-table row into (vendor, Lot_Info_Card payload)."""
+    vendor = _normalize_lot_text(data.get("vendor"))
+
+    # Extract and normalize all fields
+    item_no        = _normalize_lot_text(data.get("BCItemNo"))
+    vendor_lot     = _normalize_lot_text(data.get("VendorLotNo"))
+    vendor_batch   = _normalize_lot_text(data.get("VendorBatchLot"))
+    country        = _normalize_lot_text(data.get("OriginCountry"))
+    td1            = _normalize_lot_text(data.get("TreatmentsDescription"))
+    td2_text       = _normalize_lot_text(data.get("TreatmentsDescription2"))
+    seed_size      = _normalize_lot_text(data.get("SeedSize"))
+    raw_sprout     = _normalize_lot_text(data.get("SproutCount"))
+    ktt            = _normalize_lot_text(data.get("KTT"))
+    seed_count     = _parse_lot_decimal(data.get("SeedCount"))
+    germ_pct       = _normalize_lot_text(data.get("CurrentGerm"))
+    pure           = _parse_lot_decimal(data.get("Purity"))
+    inert          = _parse_lot_decimal(data.get("Inert"))
+    grower_germ    = _parse_lot_decimal(data.get("GrowerGerm"))
+    usd_cost_val   = _parse_lot_decimal(data.get("USD_Actual_Cost_$"))
+    original_received_qty = _parse_lot_integer(data.get("TotalQuantity"))
+
+    raw_date            = _normalize_lot_text(data.get("CurrentGermDate"))
+    raw_grower_date     = _normalize_lot_text(data.get("GrowerGermDate"))
+
+    germ_date_iso = _normalize_lot_date(raw_date)
+    grower_germ_date_iso = _normalize_lot_date(raw_grower_date)
 
     treated = "Yes" if td1 and td1.lower() != "untreated" else "No"
     if raw_sprout:
@@ -1390,21 +1151,43 @@ def create_lot():
 
     payload = {k: v for k, v in raw_payload.items() if v != None}
 
-    app.logger.info("Extracted data: %s", data)
     app.logger.info("Raw payload: %s", raw_payload)
     app.logger.info("Prepared payload for BC: %s", payload)
-    
-    bc_url = (
+    return vendor, payload
+
+def _lot_info_url(vendor: str) -> str:
+    return (
         f"https://api.businesscentral.dynamics.com/v2.0/"
         f"{BC_TENANT}/{get_bc_env(vendor)}/ODataV4/"
         f"Company('{BC_COMPANY}')/Lot_Info_Card"
     )
-    headers = {
-        "Authorization": f"Bearer {session.get('user_token')}",
+
+def _lot_headers(token: str) -> dict:
+    return {
+        "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
         "Prefer": "odata.maxversion=4.0;IEEE754Compatible=true"
     }
 
+# Lot creation endpoint
+@app.route("/create-lot", methods=["POST"])
+@login_required
+@timed_func("create_lot")
+def create_lot():
+
+    # Token from the broker; MSAL is only consulted when it is close to expiry
+    if not current_bc_token():
+        session.pop("user_name", None)
+        return redirect(url_for("sign_in"))
+
+    data = request.get_json()
+    print(f"Received data for lot creation: {data}")
+    app.logger.info("Extracted data: %s", data)
+    vendor, payload = _build_lot_payload(data)
+
+    bc_url = _lot_info_url(vendor)
+    headers = _lot_headers(session.get('user_token'))
+
     try:
         resp = timed_post(bc_url, json=payload, headers=headers)
         resp.raise_for_status()
@@ -1427,6 +1210,7 @@ def create_lot():
     except requests.exceptions.HTTPError as e:
         app.logger.error("HTTP error creating lot: %d - %s", e.response.status_code, e.response.text)
         if e.response.status_code == 401:
+            mark_token_rejected(session.get("user_token"))
             session.pop("user_token", None)
             session.pop("user_name", None)
             return redirect(url_for("sign_in"))
@@ -1435,5 +1219,58 @@ def create_lot():
         app.logger.error("Unexpected error creating lot: %s", str(e))
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# Bulk lot creation: the whole results table in one request
+@app.route("/create-lots", methods=["POST"])
+@login_required
+@timed_func("create_lots")
+def create_lots():
+    token = current_bc_token()
+    if not token:
+        session.pop("user_name", None)
+        return jsonify({"status": "error", "message": "Authentication token missing"}), 401
+
+    lots = (request.get_json(silent=True) or {}).get("lots") or []
+    if not isinstance(lots, list) or not lots:
+        return jsonify({"status": "error", "message": "No lots to create"}), 400
+    app.logger.info(f"Received {len(lots)} lot(s) for bulk creation")
+
+    headers = _lot_headers(token)
+
+    # Lot_Info_Card is an OData V4 page that assigns Lot_No ('AUTO') on insert, so each
+    # lot is its own POST; a bounded pool keeps BC's per-user request limits in check
+    def post(indexed):
+        index, data = indexed
+        try:
+            vendor, payload = _build_lot_payload(data)
+            resp = timed_post_raw(_lot_info_url(vendor), json=payload, headers=headers)
+        except Exception as e:
+            app.logger.error("Unexpected error creating lot %d: %s", index, str(e))
+            return {"index": index, "status": "error", "code": 500, "message": str(e)}
+        if resp.status_code in (200, 201):
+            lot_no = resp.json().get("Lot_No")
+            app.logger.info(f"Created Lot No: {lot_no} (row {index})")
+            return {"index": index, "status": "success", "Lot_No": lot_no}
+        app.logger.error("HTTP error creating lot %d: %d - %s", index, resp.status_code, resp.text)
+        return {"index": index, "status": "error", "code": resp.status_code, "message": resp.text}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(BC_LOT_CONCURRENCY, len(lots)))) as pool:
+        results = list(pool.map(post, enumerate(lots)))
+
+    created = sum(1 for r in results if r["status"] == "success")
+    reauth = any(r.get("code") == 401 for r in results)
+    if reauth:
+        # post() ran on pool threads with no request context, so the broker is told from here
+        mark_token_rejected(token)
+        token_broker.invalidate(session.get("user_name"))
+        session.pop("user_token", None)
+        session.pop("user_name", None)
+        if not created:
+            return jsonify({"status": "error", "message": "Session expired", "reauth": True,
+                            "results": results}), 401
+
+    # Lots BC created before a 401 are still reported, so the page marks them before sending the user to sign in
+    return jsonify({"status": "success", "created": created, "failed": len(results) - created,
+                    "reauth": reauth, "results": results})
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5001, debug=False)
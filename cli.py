@@ -0,0 +1,139 @@
+# cli.py
+"""
+Headless batch extractor for backfills and offline benchmarking.
+
+    python cli.py seminis /archive/seminis/2025 -o seminis_2025.jsonl
+    python cli.py sakata ./pdfs -o sakata.parquet --format parquet --workers 8
+    python cli.py nunhems ./pdfs -o out.jsonl --no-bc --batch-size 40
+
+Runs the same registry pipeline as the web app (extract, aggregate duplicate
+lots, match BC items) without Flask, a session or a database: processing
+events are dropped, or appended to ``--event-log`` as JSONL. BC access uses
+the app-only service token; ``--no-bc`` runs extraction only, so items get
+no BC options or suggested item numbers.
+
+Each output row is one item, tagged with its vendor and source filename.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from typing import Iterator, List, Tuple
+
+import events
+from pipeline import run_vendor_pipeline
+from vendor_extractors import parallel
+from vendor_extractors.registry import get_vendor, vendor_names
+
+logger = logging.getLogger("invoice-ocr")
+
+
+def iter_pdf_paths(input_dir: str, recursive: bool) -> List[str]:
+    paths = []
+    for root, dirs, files in os.walk(input_dir):
+        paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(".pdf"))
+        if not recursive:
+            break
+    return sorted(paths)
+
+
+def iter_batches(paths: List[str], batch_size: int, input_dir: str) -> Iterator[List[Tuple[str, bytes]]]:
+    """
+    Reads the PDFs a batch at a time; batch_size 0 keeps the whole directory in one batch.
+    Files are named by their path relative to input_dir, so same-named PDFs in different
+    subdirectories of a --recursive run stay apart.
+    """
+    size = batch_size or len(paths) or 1
+    for i in range(0, len(paths), size):
+        batch = []
+        for path in paths[i:i + size]:
+            with open(path, "rb") as f:
+                batch.append((os.path.relpath(path, input_dir), f.read()))
+        yield batch
+
+
+def result_rows(vendor: str, grouped_results: dict) -> Iterator[dict]:
+    for filename, items in grouped_results.items():
+        for item in items:
+            # BCOptions is the PO's full line list, repeated on every item
+            row = {k: v for k, v in item.items() if k != "BCOptions"}
+            yield {"vendor": vendor, "filename": filename, **row}
+
+
+def write_parquet(rows: List[dict], path: str):
+    try:
+        import pandas as pd
+        # Nested values (e.g. Sakata lots) have no single Parquet type; store them as JSON text
+        frame = pd.DataFrame([
+            {k: json.dumps(v, default=str) if isinstance(v, (dict, list)) else v for k, v in row.items()}
+            for row in rows
+        ])
+        frame.to_parquet(path, index=False)
+    except ImportError as e:
+        sys.exit(f"Parquet output needs pandas and pyarrow ({e}); use --format jsonl")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Extract vendor invoices from a directory of PDFs.")
+    parser.add_argument("vendor", choices=vendor_names())
+    parser.add_argument("input_dir")
+    parser.add_argument("-o", "--output", required=True, help="output file (.jsonl or .parquet)")
+    parser.add_argument("--format", choices=("jsonl", "parquet"),
+                        help="defaults to the output file's extension, else jsonl")
+    parser.add_argument("--workers", type=int, default=parallel.EXTRACTION_WORKERS,
+                        help="processes for per-file parsing (default: EXTRACTION_WORKERS or CPU count)")
+    parser.add_argument("--no-bc", action="store_true",
+                        help="skip Business Central (no package descriptions, PO options or item matching)")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="files per pipeline run; reports only match invoices in the same batch (default: all)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="include subdirectories")
+    parser.add_argument("--event-log", help="append per-file processing events to this JSONL file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    fmt = args.format or ("parquet" if args.output.lower().endswith(".parquet") else "jsonl")
+    parallel.EXTRACTION_WORKERS = max(1, args.workers)
+    if args.event_log:
+        events.set_sink(events.FileSink(args.event_log))
+
+    spec = get_vendor(args.vendor)
+    paths = iter_pdf_paths(args.input_dir, args.recursive)
+    if not paths:
+        logger.error(f"[CLI] No PDFs found in {args.input_dir}")
+        return 1
+
+    token, pkg_descs, po_lookup = "", [], None
+    if spec.uses_bc and not args.no_bc:
+        from vendor_extractors.sakata import get_service_token, load_package_descriptions, get_po_items
+        token = get_service_token()
+        pkg_descs = load_package_descriptions(token)
+        po_lookup = get_po_items
+
+    start = time.perf_counter()
+    rows, done = [], 0
+    out = open(args.output, "w", encoding="utf-8") if fmt == "jsonl" else None
+    try:
+        for batch in iter_batches(paths, args.batch_size, args.input_dir):
+            grouped_results = run_vendor_pipeline(spec, batch, token, pkg_descs=pkg_descs, po_lookup=po_lookup)
+            for row in result_rows(spec.name, grouped_results):
+                if out:
+                    out.write(json.dumps(row, default=str) + "\n")
+                else:
+                    rows.append(row)
+            done += len(batch)
+            logger.info(f"[CLI] {done}/{len(paths)} file(s), {time.perf_counter() - start:.2f}s")
+    finally:
+        if out:
+            out.close()
+
+    if fmt == "parquet":
+        write_parquet(rows, args.output)
+    logger.info(f"[CLI] Wrote {args.output} in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
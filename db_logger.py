@@ -1,53 +1,69 @@
 # db_logger.py
-import psycopg2
+from psycopg2.extras import execute_values
+import db_pool
 import os
+import re
+from datetime import date, datetime, timezone
 from flask import g
+from vendor_extractors.ocr_cache import OCR_CACHE_METHOD
 
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'database': 'invoice_ocr',
-    'user': 'priyanshu',
-    'password': 'reorg0211',
-}
+# Lifetime counters are split over this many rows per metric; each process adds to
+# its own shard, so concurrent writers never wait on one another's row locks.
+STATS_SHARDS = int(os.getenv("STATS_SHARDS", "16"))
+STATS_KEYS = ['total_documents', 'ocr_count', 'text_count', 'total_pages', 'ocr_pages', 'text_pages',
+              'cache_count', 'cache_pages']
+
+# processing_log keeps full history in monthly partitions; partitions older than this
+# many months are dropped by log maintenance (0 keeps everything)
+LOG_RETENTION_MONTHS = int(os.getenv("LOG_RETENTION_MONTHS", "0"))
+# Partitions are created this many months ahead so inserts never land in the default one
+LOG_PARTITIONS_AHEAD = 2
 
 def get_db():
-    """Opens a new database connection if there is none for the current context."""
+    """Borrows a pooled connection for the current context if it has none."""
     if 'db' not in g:
-        g.db = psycopg2.connect(**DB_CONFIG)
+        g.db = db_pool.getconn()
     return g.db
 
 def close_db(e=None):
-    """Closes the database connection."""
+    """Returns the context's connection to the pool."""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        db_pool.putconn(db)
 
 def recalculate_stats():
     """
     Public function to forcibly recalculate all stats from the processing_log.
-    Call this manually to fix desynchronized counts.
+    Counters are written in the same transaction as the log rows, so this is
+    only needed after editing processing_log by hand.
     """
     db = get_db()
     cur = db.cursor()
     status_msg = ""
     try:
+        # Writers insert their log row and bump their shard in one transaction. SHARE ROW EXCLUSIVE
+        # conflicts with the ROW EXCLUSIVE lock those writes take, so in-flight writers finish first,
+        # new ones wait until the recount commits, and no increment is lost or counted twice.
+        cur.execute("LOCK TABLE processing_log, lifetime_stats_shards IN SHARE ROW EXCLUSIVE MODE;")
         cur.execute("""
             SELECT 
                 COUNT(*) AS total_docs,
                 COALESCE(SUM(page_count), 0) AS total_pages,
                 
-                COUNT(*) FILTER (WHERE extraction_method ILIKE '%OCR%') AS ocr_docs,
-                COALESCE(SUM(page_count) FILTER (WHERE extraction_method ILIKE '%OCR%'), 0) AS ocr_pages,
+                COUNT(*) FILTER (WHERE extraction_method ILIKE '%%OCR%%' AND extraction_method <> %(cache)s) AS ocr_docs,
+                COALESCE(SUM(page_count) FILTER (WHERE extraction_method ILIKE '%%OCR%%' AND extraction_method <> %(cache)s), 0) AS ocr_pages,
                 
-                COUNT(*) FILTER (WHERE extraction_method ILIKE 'Py%') AS text_docs,
-                COALESCE(SUM(page_count) FILTER (WHERE extraction_method ILIKE 'Py%'), 0) AS text_pages
+                COUNT(*) FILTER (WHERE extraction_method ILIKE 'Py%%') AS text_docs,
+                COALESCE(SUM(page_count) FILTER (WHERE extraction_method ILIKE 'Py%%'), 0) AS text_pages,
+
+                COUNT(*) FILTER (WHERE extraction_method = %(cache)s) AS cache_docs,
+                COALESCE(SUM(page_count) FILTER (WHERE extraction_method = %(cache)s), 0) AS cache_pages
             FROM processing_log;
-        """)
+        """, {'cache': OCR_CACHE_METHOD})
         row = cur.fetchone()
         
         if row:
-            total_docs, total_pages, ocr_docs, ocr_pages, text_docs, text_pages = row
+            total_docs, total_pages, ocr_docs, ocr_pages, text_docs, text_pages, cache_docs, cache_pages = row
             
             updates = [
                 ('total_documents', total_docs),
@@ -55,16 +71,16 @@ def recalculate_stats():
                 ('ocr_count', ocr_docs),
                 ('ocr_pages', ocr_pages),
                 ('text_count', text_docs),
-                ('text_pages', text_pages)
+                ('text_pages', text_pages),
+                ('cache_count', cache_docs),
+                ('cache_pages', cache_pages)
             ]
             
-            for key, val in updates:
-                cur.execute("""
-                    INSERT INTO lifetime_stats (metric_key, metric_value) 
-                    VALUES (%s, %s) 
-                    ON CONFLICT (metric_key) 
-                    DO UPDATE SET metric_value = EXCLUDED.metric_value;
-                """, (key, val))
+            # Collapse every shard into shard 0 with the recalculated totals
+            cur.execute("DELETE FROM lifetime_stats_shards;")
+            execute_values(cur, """
+                INSERT INTO lifetime_stats_shards (metric_key, shard, metric_value) VALUES %s;
+            """, [(key, 0, val) for key, val in updates])
             
             db.commit()
             status_msg = (
@@ -72,7 +88,8 @@ def recalculate_stats():
                 f"Total Docs: {total_docs}<br>"
                 f"Total Pages: {total_pages}<br>"
                 f"OCR Docs: {ocr_docs} ({ocr_pages} pages)<br>"
-                f"Text Docs: {text_docs} ({text_pages} pages)"
+                f"Text Docs: {text_docs} ({text_pages} pages)<br>"
+                f"OCR Cache Hits: {cache_docs} ({cache_pages} pages)"
             )
         else:
             status_msg = "No logs found to calculate stats from."
@@ -90,94 +107,194 @@ def init_db():
     db = get_db()
     cur = db.cursor()
     
-    # 1. Processing Log
+    # 1. Processing Log (partitioned by month on timestamp)
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('processing_log');")
+    row = cur.fetchone()
+    legacy = row is not None and row[0] == 'r'
+    if legacy:
+        # Pre-partitioning table: move it aside and copy its rows in below
+        cur.execute("ALTER TABLE processing_log RENAME TO processing_log_legacy;")
+        cur.execute("DROP INDEX IF EXISTS processing_log_timestamp_idx;")
+
     cur.execute("""
         CREATE TABLE IF NOT EXISTS processing_log (
-            id SERIAL PRIMARY KEY,
-            timestamp TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            id BIGSERIAL,
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
             vendor VARCHAR(50),
             po_number VARCHAR(100),
             filename VARCHAR(255),
             extraction_method VARCHAR(50),
-            page_count INTEGER
-        );
+            page_count INTEGER,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp);
     """)
+    cur.execute("CREATE TABLE IF NOT EXISTS processing_log_default PARTITION OF processing_log DEFAULT;")
+    # Keyset pagination on /logs, and per-vendor history
+    cur.execute("CREATE INDEX IF NOT EXISTS processing_log_ts_id_idx ON processing_log (timestamp DESC, id DESC);")
+    cur.execute("CREATE INDEX IF NOT EXISTS processing_log_vendor_ts_idx ON processing_log (vendor, timestamp DESC);")
+
+    if legacy:
+        cur.execute("SELECT MIN(timestamp) FROM processing_log_legacy;")
+        oldest = cur.fetchone()[0]
+        ensure_log_partitions(cur, since=oldest)
+        cur.execute("""
+            INSERT INTO processing_log (timestamp, vendor, po_number, filename, extraction_method, page_count)
+            SELECT COALESCE(timestamp, CURRENT_TIMESTAMP), vendor, po_number, filename, extraction_method, page_count
+            FROM processing_log_legacy;
+        """)
+        cur.execute("DROP TABLE processing_log_legacy;")
+    maintain_processing_log(cur)
 
-    # 2. Lifetime Stats
+    # 2. Lifetime Stats (sharded counters; a metric's value is the sum of its shards)
     cur.execute("""
-        CREATE TABLE IF NOT EXISTS lifetime_stats (
-            metric_key VARCHAR(50) PRIMARY KEY,
-            metric_value INTEGER DEFAULT 0
+        CREATE TABLE IF NOT EXISTS lifetime_stats_shards (
+            metric_key VARCHAR(50) NOT NULL,
+            shard SMALLINT NOT NULL,
+            metric_value BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (metric_key, shard)
         );
     """)
-    
+
+    # Carry the totals over from the old single-row-per-metric table, once
+    cur.execute("SELECT to_regclass('lifetime_stats') IS NOT NULL;")
+    if cur.fetchone()[0]:
+        cur.execute("""
+            INSERT INTO lifetime_stats_shards (metric_key, shard, metric_value)
+            SELECT metric_key, 0, metric_value FROM lifetime_stats
+            WHERE NOT EXISTS (SELECT 1 FROM lifetime_stats_shards)
+            ON CONFLICT DO NOTHING;
+        """)
+
     # Initialize defaults
-    keys = ['total_documents', 'ocr_count', 'text_count', 'total_pages', 'ocr_pages', 'text_pages']
-    for key in keys:
-        cur.execute("INSERT INTO lifetime_stats (metric_key, metric_value) VALUES (%s, 0) ON CONFLICT (metric_key) DO NOTHING;", (key,))
+    for key in STATS_KEYS:
+        cur.execute("INSERT INTO lifetime_stats_shards (metric_key, shard, metric_value) VALUES (%s, 0, 0) ON CONFLICT DO NOTHING;", (key,))
     
     db.commit()
     cur.close()
     close_db()
 
-def log_processing_event(vendor, filename, extraction_info, po_number=None):
-    """Logs event, updates lifetime stats (pages & docs), and prunes old logs."""
-    db = get_db()
-    cur = db.cursor()
-    try:
-        method = extraction_info.get('method', 'Unknown')
-        pages = extraction_info.get('page_count', 0)
+def _month_start(d):
+    return date(d.year, d.month, 1)
 
-        # 1. Update Lifetime Stats (Running Totals)
-        cur.execute("UPDATE lifetime_stats SET metric_value = metric_value + 1 WHERE metric_key = 'total_documents';")
-        cur.execute("UPDATE lifetime_stats SET metric_value = metric_value + %s WHERE metric_key = 'total_pages';", (pages,))
-        
-        # Fuzzy match for method type
-        if 'OCR' in method:
-            cur.execute("UPDATE lifetime_stats SET metric_value = metric_value + 1 WHERE metric_key = 'ocr_count';")
-            cur.execute("UPDATE lifetime_stats SET metric_value = metric_value + %s WHERE metric_key = 'ocr_pages';", (pages,))
-        else:
-            # Assume Text/PyMuPDF for anything else (catches PyMuPDF, PyMaPOF, etc)
-            cur.execute("UPDATE lifetime_stats SET metric_value = metric_value + 1 WHERE metric_key = 'text_count';")
-            cur.execute("UPDATE lifetime_stats SET metric_value = metric_value + %s WHERE metric_key = 'text_pages';", (pages,))
+def _add_months(d, n):
+    months = d.year * 12 + d.month - 1 + n
+    return date(months // 12, months % 12 + 1, 1)
 
-        # 2. Insert new detailed log entry
-        cur.execute("""
-            INSERT INTO processing_log (vendor, po_number, filename, extraction_method, page_count)
-            VALUES (%s, %s, %s, %s, %s);
-        """, (vendor, po_number, filename, method, pages))
-        
-        # 3. Prune: Keep only last 100 entries in the log table
-        cur.execute("""
-            DELETE FROM processing_log 
-            WHERE id NOT IN (
-                SELECT id FROM processing_log 
-                ORDER BY timestamp DESC 
-                LIMIT 100
-            );
+def ensure_log_partitions(cur, since=None):
+    """Creates the monthly processing_log partitions from `since` (default: this month) to LOG_PARTITIONS_AHEAD ahead."""
+    today = datetime.now(timezone.utc).date()
+    month = _month_start(since or today)
+    last = _add_months(_month_start(today), LOG_PARTITIONS_AHEAD)
+    while month <= last:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS processing_log_p{month:%Y%m} PARTITION OF processing_log
+            FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}');
         """)
-        
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        print(f"Database log failed: {e}")
+        month = _add_months(month, 1)
+
+def drop_expired_log_partitions(cur, retention_months=None):
+    """Drops whole monthly partitions past the retention window. Returns their names."""
+    retention_months = LOG_RETENTION_MONTHS if retention_months is None else retention_months
+    if retention_months <= 0:
+        return []
+    cutoff = _add_months(_month_start(datetime.now(timezone.utc).date()), -retention_months)
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'processing_log'::regclass;
+    """)
+    dropped = []
+    for (name,) in cur.fetchall():
+        m = re.fullmatch(r"processing_log_p(\d{4})(\d{2})", name)
+        if m and date(int(m.group(1)), int(m.group(2)), 1) < cutoff:
+            cur.execute(f"DROP TABLE {name};")
+            dropped.append(name)
+    return dropped
+
+def maintain_processing_log(cur):
+    """Upcoming partitions in, expired ones out. Run at startup and periodically (worker.py)."""
+    ensure_log_partitions(cur)
+    return drop_expired_log_partitions(cur)
+
+def run_log_maintenance():
+    """maintain_processing_log on its own connection, for callers outside a Flask app context."""
+    with db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            dropped = maintain_processing_log(cur)
+        conn.commit()
+        return dropped
+
+_partitions_month = {}  # pid -> month whose partitions that process has already ensured
+
+def _stat_keys(method):
+    """Lifetime stats (count, pages) keys an extraction method is counted under."""
+    # Fuzzy match for method type (cache hits first: their label also contains "OCR")
+    if method == OCR_CACHE_METHOD:
+        return 'cache_count', 'cache_pages'
+    if 'OCR' in method:
+        return 'ocr_count', 'ocr_pages'
+    # Assume Text/PyMuPDF for anything else (catches PyMuPDF, PyMaPOF, etc)
+    return 'text_count', 'text_pages'
+
+def write_processing_events(conn, events):
+    """
+    Writes a batch of processing events (see events.py): one multi-row INSERT
+    and one upsert of the summed counter deltas into this process's stats
+    shard. Commits.
+    """
+    if not events:
+        return
+    deltas = {'total_documents': 0, 'total_pages': 0}
+    rows = []
+    for e in events:
+        method = e.get('method') or 'Unknown'
+        pages = e.get('page_count') or 0
+        count_key, pages_key = _stat_keys(method)
+        deltas['total_documents'] += 1
+        deltas['total_pages'] += pages
+        deltas[count_key] = deltas.get(count_key, 0) + 1
+        deltas[pages_key] = deltas.get(pages_key, 0) + pages
+        rows.append((e.get('timestamp'), e.get('vendor'), e.get('po_number'), e.get('filename'), method, pages))
+
+    cur = conn.cursor()
+    try:
+        # Month rollover in a long-running process: make sure the new month has a partition
+        month = _month_start(datetime.now(timezone.utc).date())
+        if _partitions_month.get(os.getpid()) != month:
+            ensure_log_partitions(cur)
+            _partitions_month[os.getpid()] = month
+        execute_values(cur, """
+            INSERT INTO processing_log (timestamp, vendor, po_number, filename, extraction_method, page_count)
+            VALUES %s;
+        """, rows)
+        shard = os.getpid() % STATS_SHARDS
+        execute_values(cur, """
+            INSERT INTO lifetime_stats_shards AS s (metric_key, shard, metric_value) VALUES %s
+            ON CONFLICT (metric_key, shard) DO UPDATE SET metric_value = s.metric_value + EXCLUDED.metric_value;
+        """, [(key, shard, delta) for key, delta in deltas.items()])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
     finally:
         cur.close()
 
 def get_log_stats():
-    """Retrieves aggregated statistics from the lifetime_stats table."""
+    """Retrieves aggregated statistics from the sharded lifetime stats."""
     db = get_db()
     cur = db.cursor()
     
-    cur.execute("SELECT metric_key, metric_value FROM lifetime_stats;")
+    # At most len(STATS_KEYS) * STATS_SHARDS rows, whatever the log size
+    cur.execute("SELECT metric_key, SUM(metric_value) FROM lifetime_stats_shards GROUP BY metric_key;")
     rows = cur.fetchall()
-    stats_map = {row[0]: row[1] for row in rows}
+    stats_map = {row[0]: int(row[1]) for row in rows}
     cur.close()
     
     total_docs = stats_map.get('total_documents', 0)
     total_pages = stats_map.get('total_pages', 0)
     ocr_pages = stats_map.get('ocr_pages', 0)
     text_pages = stats_map.get('text_pages', 0)
+    cache_docs = stats_map.get('cache_count', 0)
+    cache_pages = stats_map.get('cache_pages', 0)
     
     # Calculate Percentage based on PAGES
     ocr_percent_pages = round((ocr_pages / total_pages) * 100, 1) if total_pages > 0 else 0.0
@@ -187,28 +304,59 @@ def get_log_stats():
         'total_pages': total_pages,
         'ocr_pages': ocr_pages,
         'text_pages': text_pages,
-        'ocr_percent': ocr_percent_pages
+        'ocr_percent': ocr_percent_pages,
+        'cache_docs': cache_docs,
+        'cache_pages': cache_pages
     }
 
-def get_paginated_logs(page=1, per_page=50):
-    """Retrieves a paginated list of log entries."""
-    offset = (page - 1) * per_page
+def parse_log_cursor(before):
+    """(timestamp, id) from a get_paginated_logs cursor, or None if it doesn't parse."""
+    if not before:
+        return None
+    ts, sep, log_id = before.rpartition('_')
+    if not sep:
+        return None
+    try:
+        return datetime.fromisoformat(ts), int(log_id)
+    except ValueError:
+        return None
+
+def get_paginated_logs(before=None, per_page=50, vendor=None):
+    """
+    One page of log entries, newest first, using keyset pagination.
+
+    `before` is the cursor returned with the previous page (None for the
+    newest entries; a malformed cursor also gets the newest entries).
+    Returns (logs, next_cursor); next_cursor is None on the last page.
+    """
+    conditions, params = [], []
+    cursor = parse_log_cursor(before)
+    if cursor:
+        conditions.append("(timestamp, id) < (%s, %s)")
+        params += list(cursor)
+    if vendor:
+        conditions.append("vendor = %s")
+        params.append(vendor)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
     db = get_db()
     cur = db.cursor()
-    
-    cur.execute("""
-        SELECT timestamp, vendor, po_number, filename, extraction_method, page_count
+    cur.execute(f"""
+        SELECT timestamp, vendor, po_number, filename, extraction_method, page_count, id
         FROM processing_log
-        ORDER BY timestamp DESC
-        LIMIT %s OFFSET %s;
-    """, (per_page, offset))
+        {where}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT %s;
+    """, params + [per_page + 1])
     logs = cur.fetchall()
-    
-    cur.execute("SELECT COUNT(*) FROM processing_log;")
-    total = cur.fetchone()[0]
-    
     cur.close()
-    return logs, total
+
+    next_cursor = None
+    if len(logs) > per_page:
+        logs = logs[:per_page]
+        last = logs[-1]
+        next_cursor = f"{last[0].isoformat()}_{last[6]}"
+    return logs, next_cursor
 
 def init_app(app):
     """Register database functions with the Flask app."""
@@ -0,0 +1,100 @@
+# db_pool.py
+"""
+The one Postgres connection pool for the process.
+
+db_logger (processing log, stats), the MSAL token cache in app.py, the job
+queue and the event sink all borrow connections from here instead of paying
+for a fresh ``psycopg2.connect`` on every call. The pool is created on first
+use and re-created in a forked child, since connections must not be shared
+across processes.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+# Database configuration
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'invoice_ocr',
+    'user': 'priyanshu',
+    'password': 'reorg0211',
+}
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+
+_pool = None
+_pool_pid = None
+_lock = threading.Lock()
+# ThreadedConnectionPool raises as soon as DB_POOL_MAX connections are out; callers
+# queue on this semaphore instead, so a burst of threads waits rather than failing
+_slots = None
+_stats = {"in_use": 0, "peak_in_use": 0, "waits": 0, "timeouts": 0}
+_stats_lock = threading.Lock()
+
+
+def get_pool() -> ThreadedConnectionPool:
+    global _pool, _pool_pid, _slots
+    if _pool is None or _pool_pid != os.getpid():
+        with _lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **DB_CONFIG)
+                _slots = threading.BoundedSemaphore(DB_POOL_MAX)
+                _stats.update(in_use=0, peak_in_use=0, waits=0, timeouts=0)
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def getconn():
+    """
+    Borrows a connection, waiting up to DB_POOL_TIMEOUT seconds for one to be
+    returned when all DB_POOL_MAX are in use. Raises psycopg2.pool.PoolError on timeout.
+    """
+    pool, slots = get_pool(), _slots
+    if not slots.acquire(blocking=False):
+        with _stats_lock:
+            _stats["waits"] += 1
+        if not slots.acquire(timeout=DB_POOL_TIMEOUT):
+            with _stats_lock:
+                _stats["timeouts"] += 1
+            raise PoolError(f"no database connection free after {DB_POOL_TIMEOUT:.0f}s")
+    try:
+        conn = pool.getconn()
+    except Exception:
+        slots.release()
+        raise
+    with _stats_lock:
+        _stats["in_use"] += 1
+        _stats["peak_in_use"] = max(_stats["peak_in_use"], _stats["in_use"])
+    return conn
+
+
+def putconn(conn, close: bool = False):
+    """Returns a connection; an open transaction is rolled back, a broken connection discarded."""
+    try:
+        get_pool().putconn(conn, close=close or bool(conn.closed))
+    finally:
+        with _stats_lock:
+            _stats["in_use"] -= 1
+        _slots.release()
+
+
+@contextmanager
+def connection():
+    conn = getconn()
+    try:
+        yield conn
+    finally:
+        putconn(conn)
+
+
+def pool_stats() -> dict:
+    """Pool size metrics for /metrics/db-pool."""
+    if _pool is None or _pool_pid != os.getpid():
+        return {"min": DB_POOL_MIN, "max": DB_POOL_MAX, "in_use": 0, "peak_in_use": 0, "waits": 0, "timeouts": 0}
+    with _stats_lock:
+        return {"min": DB_POOL_MIN, "max": DB_POOL_MAX, **_stats}
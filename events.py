@@ -0,0 +1,137 @@
+# events.py
+"""
+Where extractors send processing events (one per extracted file).
+
+Extractors call ``log_processing_event`` and never touch the database: the
+event goes to the process-wide sink. The web app installs a
+``BufferedDbSink``, which collects events in memory and writes them from a
+background thread in one batch (``db_logger.write_processing_events``)
+instead of several statements and a commit per file on the request path.
+The default ``NullSink`` drops events, so the CLI, pool workers and scripts
+need no database; ``FileSink`` appends them to a JSONL file instead.
+"""
+
+import os
+import json
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional
+
+logger = logging.getLogger("invoice-ocr")
+
+# BufferedDbSink writes at least this often (seconds), sooner once EVENT_BUFFER_MAX events are waiting
+EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "2"))
+EVENT_BUFFER_MAX = int(os.getenv("EVENT_BUFFER_MAX", "200"))
+
+
+class EventSink:
+    def emit(self, event: dict) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+
+class NullSink(EventSink):
+    def emit(self, event: dict) -> None:
+        pass
+
+
+class FileSink(EventSink):
+    """Appends each event as a JSON line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, event: dict) -> None:
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event, default=str) + "\n")
+
+
+class BufferedDbSink(EventSink):
+    """Buffers events and writes them to processing_log/lifetime_stats from a background thread."""
+
+    def __init__(self, flush_interval: float = None, max_buffer: int = None):
+        self.flush_interval = EVENT_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.max_buffer = EVENT_BUFFER_MAX if max_buffer is None else max_buffer
+        self._buffer: List[dict] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        atexit.register(self.close)
+
+    def _ensure_thread(self):
+        # Started on first use, and again in a forked child (threads do not survive fork)
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="event-sink", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def emit(self, event: dict) -> None:
+        with self._lock:
+            self._buffer.append(event)
+            full = len(self._buffer) >= self.max_buffer
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                events, self._buffer = self._buffer, []
+            if not events:
+                return
+            import db_pool
+            from db_logger import write_processing_events
+            try:
+                with db_pool.connection() as conn:
+                    write_processing_events(conn, events)
+            except Exception as e:
+                # Same as the old inline logger: a failed log write never fails an extraction
+                logger.error(f"Database log failed ({len(events)} event(s) dropped): {e}")
+
+    def close(self) -> None:
+        self._stopping = True
+        self._wake.set()
+        self.flush()
+
+
+_sink: EventSink = NullSink()
+
+
+def set_sink(sink: EventSink) -> EventSink:
+    """Installs the process-wide sink and returns the previous one."""
+    global _sink
+    previous, _sink = _sink, sink
+    return previous
+
+
+def get_sink() -> EventSink:
+    return _sink
+
+
+def log_processing_event(vendor, filename, extraction_info, po_number=None):
+    """Records that a file was extracted, and how (extraction_info: method, page_count)."""
+    _sink.emit({
+        "timestamp": datetime.now(timezone.utc),
+        "vendor": vendor,
+        "filename": filename,
+        "method": extraction_info.get("method", "Unknown"),
+        "page_count": extraction_info.get("page_count", 0),
+        "po_number": po_number,
+    })
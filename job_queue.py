@@ -0,0 +1,249 @@
+# job_queue.py
+"""
+Postgres-backed queue for background extraction jobs.
+
+Big uploads used to run OCR and every BC call inside the POST to ``/``, so
+they hit proxy/worker timeouts and held a web worker for the whole batch. In
+async mode the web process only stores the batch (``enqueue``) and redirects
+to ``/jobs/<id>``; ``worker.py`` processes claim jobs with
+``SELECT ... FOR UPDATE SKIP LOCKED`` so any number of them can run side by
+side without handing out the same job twice.
+
+Borrows its own pooled connections (not Flask's ``g``) so it works in both
+the web app and the worker.
+"""
+
+import os
+import json
+import socket
+import psycopg2
+from typing import List, Optional, Tuple
+
+import db_pool
+
+# A 'running' job whose worker died is handed out again after this long.
+JOB_STALE_AFTER_MIN = int(os.getenv("JOB_STALE_AFTER_MIN", "30"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+# Finished jobs (and their PDFs) are deleted after this many days.
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+# Stored for a streaming results page; run by the browser's stream request, never by worker.py
+STATUS_STREAMING = 'streaming'
+# A streaming job whose stream request has started. Kept apart from 'running' so a crashed
+# stream is failed rather than reclaimed: the browser that wanted it is gone.
+STATUS_STREAM_RUNNING = 'stream_running'
+
+
+def _connect():
+    return db_pool.getconn()
+
+
+def init_queue():
+    """Creates the job tables."""
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS extraction_jobs (
+                id SERIAL PRIMARY KEY,
+                vendor VARCHAR(50) NOT NULL,
+                user_name VARCHAR(255),
+                status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker VARCHAR(255),
+                error TEXT,
+                result JSONB,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP WITH TIME ZONE,
+                finished_at TIMESTAMP WITH TIME ZONE
+            );
+        """)
+        # BC access tokens are never persisted with a job (older tables carried one)
+        cur.execute("ALTER TABLE extraction_jobs DROP COLUMN IF EXISTS user_token;")
+        # Partial index keeps the claim query cheap however many finished jobs pile up
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS extraction_jobs_queued_idx
+            ON extraction_jobs (id) WHERE status = 'queued';
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS extraction_job_files (
+                job_id INTEGER REFERENCES extraction_jobs(id) ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                filename VARCHAR(255) NOT NULL,
+                pdf_bytes BYTEA NOT NULL,
+                PRIMARY KEY (job_id, position)
+            );
+        """)
+        conn.commit()
+    finally:
+        cur.close()
+        db_pool.putconn(conn)
+
+
+def enqueue(vendor: str, pdf_files: List[Tuple[str, bytes]], user_name: str,
+            status: str = STATUS_QUEUED) -> int:
+    """
+    Stores the uploaded batch and queues it. Returns the job id. Only the user
+    name is kept; whoever runs the job gets a BC token for it from the token broker.
+    """
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            INSERT INTO extraction_jobs (vendor, user_name, status)
+            VALUES (%s, %s, %s) RETURNING id;
+        """, (vendor, user_name, status))
+        job_id = cur.fetchone()[0]
+        cur.executemany("""
+            INSERT INTO extraction_job_files (job_id, position, filename, pdf_bytes)
+            VALUES (%s, %s, %s, %s);
+        """, [(job_id, i, name, psycopg2.Binary(data)) for i, (name, data) in enumerate(pdf_files)])
+        conn.commit()
+        return job_id
+    finally:
+        cur.close()
+        db_pool.putconn(conn)
+
+
+def claim_job(worker_id: str = None) -> Optional[dict]:
+    """
+    Atomically takes the oldest queued job (or a stale running one) and marks it
+    running. Returns None when there is nothing to do.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    return _claim(worker_id, STATUS_QUEUED, STATUS_RUNNING)
+
+
+def start_stream(job_id: int) -> Optional[dict]:
+    """Claims a streaming job for the request that will stream it. None if it already started."""
+    return _claim(f"stream:{socket.gethostname()}:{os.getpid()}", STATUS_STREAMING, STATUS_STREAM_RUNNING, job_id)
+
+
+def _claim(worker_id: str, status: str, new_status: str, job_id: int = None) -> Optional[dict]:
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        # Jobs that keep killing their worker are given up on rather than retried forever
+        cur.execute("""
+            UPDATE extraction_jobs
+            SET status = 'failed', error = 'Worker stopped responding', finished_at = CURRENT_TIMESTAMP
+            WHERE status = 'running' AND attempts >= %s
+              AND started_at < CURRENT_TIMESTAMP - make_interval(mins => %s);
+        """, (JOB_MAX_ATTEMPTS, JOB_STALE_AFTER_MIN))
+        # A stream whose request died with its process is never picked up again
+        cur.execute("""
+            UPDATE extraction_jobs
+            SET status = 'failed', error = 'Results stream stopped responding', finished_at = CURRENT_TIMESTAMP
+            WHERE status = 'stream_running'
+              AND started_at < CURRENT_TIMESTAMP - make_interval(mins => %s);
+        """, (JOB_STALE_AFTER_MIN,))
+
+        cur.execute("""
+            UPDATE extraction_jobs
+            SET status = %s, started_at = CURRENT_TIMESTAMP, attempts = attempts + 1, worker = %s
+            WHERE id = (
+                SELECT id FROM extraction_jobs
+                WHERE (status = %s
+                       OR (status = 'running' AND attempts < %s
+                           AND started_at < CURRENT_TIMESTAMP - make_interval(mins => %s)))
+                  AND (%s IS NULL OR id = %s)
+                ORDER BY id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, vendor, user_name;
+        """, (new_status, worker_id, status, JOB_MAX_ATTEMPTS, JOB_STALE_AFTER_MIN, job_id, job_id))
+        row = cur.fetchone()
+        conn.commit()
+        if not row:
+            return None
+
+        job_id, vendor, user_name = row
+        cur.execute("""
+            SELECT filename, pdf_bytes FROM extraction_job_files
+            WHERE job_id = %s ORDER BY position;
+        """, (job_id,))
+        pdf_files = [(name, bytes(data)) for name, data in cur.fetchall()]
+        return {
+            'id': job_id,
+            'vendor': vendor,
+            'user_name': user_name,
+            'pdf_files': pdf_files,
+        }
+    finally:
+        cur.close()
+        db_pool.putconn(conn)
+
+
+def complete_job(job_id: int, result: dict):
+    """Stores the render result and drops the uploaded PDFs."""
+    _finish(job_id, STATUS_DONE, result=json.dumps(result, default=str))
+
+
+def fail_job(job_id: int, error: str):
+    _finish(job_id, STATUS_FAILED, error=error)
+
+
+def _finish(job_id: int, status: str, result: str = None, error: str = None):
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            UPDATE extraction_jobs
+            SET status = %s, result = %s, error = %s, finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s;
+        """, (status, result, error, job_id))
+        cur.execute("DELETE FROM extraction_job_files WHERE job_id = %s;", (job_id,))
+        conn.commit()
+    finally:
+        cur.close()
+        db_pool.putconn(conn)
+
+
+def get_job(job_id: int) -> Optional[dict]:
+    """Status (and result once done) of one job, without its PDFs."""
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT id, vendor, user_name, status, error, result, created_at, started_at, finished_at,
+                   (SELECT COUNT(*) FROM extraction_job_files f WHERE f.job_id = j.id)
+            FROM extraction_jobs j WHERE id = %s;
+        """, (job_id,))
+        row = cur.fetchone()
+    finally:
+        cur.close()
+        db_pool.putconn(conn)
+    if not row:
+        return None
+    keys = ('id', 'vendor', 'user_name', 'status', 'error', 'result',
+            'created_at', 'started_at', 'finished_at', 'file_count')
+    return dict(zip(keys, row))
+
+
+def prune_jobs(days: int = None) -> int:
+    """
+    Deletes finished jobs older than the retention window, and streaming jobs
+    whose results page was never opened. Returns the number removed.
+    """
+    days = JOB_RETENTION_DAYS if days is None else days
+    conn = _connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            DELETE FROM extraction_jobs
+            WHERE (status IN ('done', 'failed')
+                   AND finished_at < CURRENT_TIMESTAMP - make_interval(days => %s))
+               OR (status = 'streaming'
+                   AND created_at < CURRENT_TIMESTAMP - make_interval(days => %s));
+        """, (days, days))
+        removed = cur.rowcount
+        conn.commit()
+        return removed
+    finally:
+        cur.close()
+        db_pool.putconn(conn)
@@ -0,0 +1,279 @@
+# matching.py
+"""
+BC item matching and duplicate-lot aggregation, shared by every vendor.
+
+Kept free of Flask so the web app, the job worker and the batch CLI run the
+same code.
+"""
+
+import re
+import difflib
+
+
+def find_best_bc_item_match(vendor_desc: str, bc_options: list[dict], vendor: str = None) -> str | None:
+    """
+    Finds the best BC Item Number using a hybrid approach with strict validation:
+    1. Fuzzy String Similarity (Base Score 0-100)
+    2. ID Substring Matching (Bonus +61) -> STRICTLY for Numeric/Alphanumeric codes
+    3. Seminis Core Name Bonus (+100 per word) -> Emphasizes variety name over generic terms
+    4. Syngenta Capitalization Bonus (+20 per word) -> Weights uppercase vendor words higher
+    5. Tie-Breaking: If multiple items have the same top score, return None (Manual).
+    """
+    if not vendor_desc or not bc_options:
+        return None
+
+    # Normalization helper: Lowercase and space-separated punctuation
+    def normalize(text):
+        return re.sub(r'[^\w\s]', ' ', text.lower())
+
+    # Helper: Normalize to set of tokens
+    def get_tokens(text):
+        if not text: return set()
+        clean = normalize(text)
+        return set(clean.split())
+
+    norm_vendor = normalize(vendor_desc)
+    vendor_tokens = set(norm_vendor.split())
+    
+    # --- 0a. Core Name Extraction (SEMINIS ONLY) ---
+    core_tokens = set()
+    if vendor == "seminis":
+        # Capture text between dash and the first digit of package size
+        match_core = re.search(r"-\s*(.+?)(?=\s+\d+)", vendor_desc.lower())
+        if match_core:
+            core_text = match_core.group(1)
+            core_tokens = get_tokens(core_text)
+
+    # --- 0b. Capitalized Word Extraction (SYNGENTA ONLY) ---
+    # Extract words that are fully uppercase and length > 2 (avoids 'KS', 'LB', 'EA')
+    capitalized_tokens = set()
+    if vendor == "syngenta":
+        # Split by non-word chars to handle punctuation attached to words
+        # Only keep words that are ALL CAPS and longer than 2 chars (e.g. FLAME, PAYLOAD)
+        raw_words = re.findall(r'\b[A-Z]{3,}\b', vendor_desc)
+        capitalized_tokens = set(raw_words)
+
+    best_match_no = None
+    best_score = 0
+    is_tie = False
+
+    for option in bc_options:
+        bc_desc = option.get("Description", "")
+        if not bc_desc:
+            continue
+        
+        bc_no = option.get("No", "")
+        norm_bc = normalize(bc_desc)
+        bc_tokens = set(norm_bc.split())
+
+        # --- Scoring Logic ---
+        score = 0
+
+        # 1. Fuzzy Similarity (Base Score 0-100)
+        sorted_vendor = " ".join(sorted(vendor_tokens))
+        sorted_bc = " ".join(sorted(bc_tokens))
+        
+        fuzzy_ratio = difflib.SequenceMatcher(None, sorted_vendor, sorted_bc).ratio()
+        score += fuzzy_ratio * 100 
+
+        # 2. Critical ID Match (Bonus +61)
+        id_match_found = False
+        for v_tok in vendor_tokens:
+            if len(v_tok) < 4 or v_tok.isalpha(): 
+                continue 
+            
+            for b_tok in bc_tokens:
+                if len(b_tok) < 4 or b_tok.isalpha(): 
+                    continue
+                
+                if v_tok == b_tok or v_tok in b_tok or b_tok in v_tok:
+                    score += 61 
+                    id_match_found = True
+                    break
+            if id_match_found: break
+
+        # 3. Core Name Bonus (Seminis Emphasis)
+        if core_tokens:
+            common_core = core_tokens.intersection(bc_tokens)
+            if common_core:
+                score += (len(common_core) * 100)
+
+        # 4. Capitalization Bonus (Syngenta)
+        # Boost score if a CAPITALIZED vendor word appears in the BC description
+        if capitalized_tokens:
+            for cap_word in capitalized_tokens:
+                # Check normalized BC tokens for the presence of this word
+                if cap_word.lower() in bc_tokens:
+                    # e.g. Vendor "PAYLOAD" (caps) matches BC "payload" (norm)
+                    score += 20 
+
+        # 5. Selection & Tie Detection
+        if score > best_score:
+            best_score = score
+            best_match_no = bc_no
+            is_tie = False
+        elif score == best_score and score > 0:
+            is_tie = True
+
+    # --- Strict Acceptance Criteria ---
+    if is_tie:
+        return None
+
+    # Threshold check
+    threshold = 60
+    if vendor == "hm_clause":
+        threshold = 30
+    if vendor == "syngenta":
+        threshold = 40  # Lowered threshold to work with Cap Bonus
+    if vendor == "seminis":
+        threshold = 50
+    if vendor == "nunhems":
+        threshold = 50
+    
+    if best_score >= threshold:
+        return best_match_no
+    
+    return None
+
+
+def aggregate_duplicate_lots(grouped_results: dict, vendor: str,
+                             unique_items_map: dict | None = None, merged_into: list | None = None) -> dict:
+    """
+    Aggregates quantities and prices for duplicate lots based on the vendor.
+    Streaming callers pass the same ``unique_items_map`` for every file so lots
+    merge across files; earlier items that absorbed a duplicate are appended
+    to ``merged_into`` so they can be re-sent.
+    """
+    if vendor == "sakata":
+        flattened_results = {}
+        for filename, items_list in grouped_results.items():
+            flat_lots_list = []
+            for item in items_list:
+                for lot in item.get("Lots", []):
+                    combined_lot = {k: v for k, v in item.items() if k != "Lots"}
+                    combined_lot.update(lot)
+                    if 'TotalQuantity' not in combined_lot:
+                         combined_lot['TotalQuantity'] = item.get('QtyShipped')
+                    flat_lots_list.append(combined_lot)
+            
+            if flat_lots_list:
+                flattened_results[filename] = flat_lots_list
+        grouped_results = flattened_results
+        
+    if unique_items_map is None:
+        unique_items_map = {}
+    processed_grouped_results = {}
+
+    lot_keys = ["VendorLot", "VendorLotNo", "VendorProductLot"]
+    batch_keys = ["VendorBatchLot", "VendorBatchNo"]
+    desc_keys = ["VendorItemDescription", "VendorDescription"]
+
+    for filename, items_list in grouped_results.items():
+        processed_items_for_file = []
+        for item in items_list:
+            agg_key = None
+            
+            lot_no_raw = next((item.get(key) for key in lot_keys if item.get(key)), None)
+            lot_no = lot_no_raw.strip() if lot_no_raw else None
+
+            if vendor in ["hm_clause", "seminis"]:
+                batch_no_raw = next((item.get(key) for key in batch_keys if item.get(key)), None)
+                batch_no = batch_no_raw.strip() if batch_no_raw else None
+                if lot_no and batch_no:
+                    agg_key = (lot_no, batch_no)
+            
+            elif vendor in ["sakata", "syngenta"]:
+                item_no = item.get("VendorItemNumber")
+                if lot_no and item_no:
+                    agg_key = (lot_no, item_no)
+                elif lot_no:
+                    agg_key = (lot_no,)
+
+            if not agg_key:
+                processed_items_for_file.append(item)
+                continue
+
+            try:
+                current_qty = float(item.get("TotalQuantity", 0) or 0)
+                current_price = float(item.get("TotalPrice", 0) or 0)
+                current_upcharge = float(item.get("TotalUpcharge", 0) or 0)
+                current_discount = float(item.get("TotalDiscount", 0) or 0)
+            except (ValueError, TypeError):
+                processed_items_for_file.append(item)
+                continue
+
+            if agg_key in unique_items_map:
+                existing_item = unique_items_map[agg_key]
+                desc_key = next((key for key in desc_keys if key in existing_item), None)
+
+                # --- FIX: Smarter Description Merging ---
+                if desc_key:
+                    existing_desc = existing_item.get(desc_key, "")
+                    new_desc = item.get(desc_key, "")
+                    
+                    # If we haven't already marked it as combined, prepare the base description
+                    if "[COMBINED]" not in existing_desc:
+                        # For HM Clause: Pick the LONGEST description. 
+                        # This avoids cases where the first item has a truncated desc ("Pump...") 
+                        # but the second item has the full one ("Pump... Pail 30 Ks").
+                        best_desc = existing_desc
+                        if len(new_desc) > len(existing_desc):
+                            best_desc = new_desc
+                        
+                        if vendor == "hm_clause":
+                            existing_item[desc_key] = f"{best_desc} [COMBINED]"
+                        else:
+                            # Standard logic for others
+                            modified_desc = re.sub(r"\s+[\d,]+\s+\w+$", "", best_desc).strip()
+                            existing_item[desc_key] = f"{modified_desc} [COMBINED]"
+                
+                existing_qty = float(existing_item.get("TotalQuantity", 0) or 0)
+                existing_price = float(existing_item.get("TotalPrice", 0) or 0)
+                
+                existing_upcharge = float(existing_item.get("TotalUpcharge", 0) or 0)
+                existing_discount = float(existing_item.get("TotalDiscount", 0) or 0)
+                
+                existing_item["TotalQuantity"] = existing_qty + current_qty
+                existing_item["TotalPrice"] = existing_price + current_price
+                
+                existing_item["TotalUpcharge"] = existing_upcharge + current_upcharge
+                existing_item["TotalDiscount"] = existing_discount + current_discount
+                
+                new_total_qty = existing_item["TotalQuantity"]
+                new_total_price = existing_item["TotalPrice"]
+                new_total_upcharge = existing_item["TotalUpcharge"]
+                new_total_discount = existing_item["TotalDiscount"]
+                
+                cost_key = "USD_Actual_Cost_$"
+                if cost_key not in existing_item:
+                    cost_key = next((k for k in existing_item if "Cost" in k), "USD_Actual_Cost_$")
+
+                if new_total_qty > 0:
+                    if vendor == "sakata":
+                        pkg_qty = None
+                        desc = existing_item.get("VendorDescription", "")
+                        if m_pkg := re.search(r"(\d+)(?=\s*[Mm]\b|\s*[Ll][Bb]\b|M$|LB$)", desc):
+                            pkg_qty = int(m_pkg.group(1))
+
+                        if pkg_qty and pkg_qty > 0:
+                            total_seed_units = new_total_qty * pkg_qty
+                            if total_seed_units > 0:
+                                existing_item[cost_key] = round(new_total_price / total_seed_units, 4)
+                    else:
+                        if new_total_price:
+                            #existing_item[cost_key] = round(new_total_price / new_total_qty, 4)
+                            existing_item[cost_key] = round((new_total_price + new_total_upcharge - new_total_discount) / new_total_qty, 4)
+                if merged_into is not None:
+                    merged_into.append(existing_item)
+            else:
+                item["TotalQuantity"] = current_qty
+                item["TotalPrice"] = current_price
+                item["TotalUpcharge"] = current_upcharge
+                item["TotalDiscount"] = current_discount
+                unique_items_map[agg_key] = item
+                processed_items_for_file.append(item)
+
+        if processed_items_for_file:
+            processed_grouped_results[filename] = processed_items_for_file
+
+    return processed_grouped_results
@@ -0,0 +1,101 @@
+# pipeline.py
+"""
+The extract -> aggregate -> match pipeline every vendor runs, driven by its
+``VendorSpec`` (vendor_extractors/registry.py).
+
+BC access is passed in (``po_lookup``, ``pkg_descs``) so the same code serves
+the web request, the job worker and the batch CLI, where BC may be off.
+``pkg_descs`` may be a Future still loading, and vendors with an
+``iter_extract`` have their POs looked up while later files are parsing, so
+BC round trips overlap the CPU-bound extraction instead of preceding it.
+"""
+
+import os
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from matching import find_best_bc_item_match, aggregate_duplicate_lots
+from vendor_extractors.registry import VendorSpec
+
+logger = logging.getLogger("invoice-ocr")
+
+# (po_numbers joined by "|", token) -> BC purchase-line options
+PoLookup = Callable[[str, str], List[dict]]
+
+# Concurrent PO lookups started during extraction
+PO_PREFETCH_WORKERS = int(os.getenv("PO_PREFETCH_WORKERS", "2"))
+
+
+def _resolve(pkg_descs: Union[List[str], Future, None]) -> List[str]:
+    if isinstance(pkg_descs, Future):
+        pkg_descs = pkg_descs.result()
+    return pkg_descs or []
+
+
+def fetch_po_options(items: List[dict], po_lookup: PoLookup, token: str) -> List[dict]:
+    """BC options for every PO the items reference, in one call."""
+    all_pos = sorted(set(item.get("PurchaseOrder") for item in items if item.get("PurchaseOrder")))
+    if not all_pos:
+        return []
+    try:
+        return po_lookup("|".join(all_pos), token)
+    except Exception as e:
+        logger.error(f"Failed to fetch PO items: {e}")
+        return [{"No": "ERROR", "Description": str(e)}]
+
+
+def attach_bc_options(items: List[dict], spec: VendorSpec, po_items: List[dict], pkg_descs: Optional[List[str]] = None):
+    """Sets BCOptions, SuggestedBCItemNo and (where the vendor has a finder) PackageDescription."""
+    for item in items:
+        item["BCOptions"] = po_items if item.get("PurchaseOrder") else []
+        vendor_desc = item.get(spec.desc_key, "")
+        item["SuggestedBCItemNo"] = find_best_bc_item_match(vendor_desc, item["BCOptions"], vendor=spec.name)
+        if spec.package_description:
+            item["PackageDescription"] = spec.package_description(vendor_desc, pkg_descs or [])
+
+
+def _extract_with_po_prefetch(spec: VendorSpec, pdf_files: List[Tuple[str, bytes]], pkg_descs: List[str],
+                              po_lookup: PoLookup, token: str) -> Dict[str, List[dict]]:
+    """
+    ``spec.iter_extract``, handing each file's new PO numbers to ``po_lookup``
+    in the background as soon as the file is parsed. The lookups only warm the
+    PO cache (sakata.get_po_items); fetch_po_options still makes the final call.
+    """
+    grouped_results, seen_pos, lookups = {}, set(), []
+    with ThreadPoolExecutor(max_workers=max(1, PO_PREFETCH_WORKERS)) as pool:
+        for filename, items in spec.iter_extract(pdf_files, pkg_descs):
+            grouped_results[filename] = items
+            new_pos = sorted({item.get("PurchaseOrder") for item in items if item.get("PurchaseOrder")} - seen_pos)
+            if new_pos:
+                seen_pos.update(new_pos)
+                lookups.append(pool.submit(po_lookup, "|".join(new_pos), token))
+        for lookup in lookups:
+            try:
+                lookup.result()
+            except Exception as e:
+                logger.warning(f"PO prefetch failed (retried after extraction): {e}")
+    return grouped_results
+
+
+def run_vendor_pipeline(spec: VendorSpec, pdf_files: List[Tuple[str, bytes]], token: str = "",
+                        pkg_descs: Union[List[str], Future, None] = None,
+                        po_lookup: Optional[PoLookup] = None) -> Dict[str, List[dict]]:
+    """
+    Extracts one upload batch and returns ``{filename: [item, ...]}`` ready for
+    the vendor's results template. Without ``po_lookup`` items get no BC options.
+    A ``pkg_descs`` Future is only waited on when the vendor first needs it.
+    """
+    extract_pkg_descs = _resolve(pkg_descs) if spec.extract_uses_pkg_descs else []
+    if spec.uses_bc and spec.iter_extract and po_lookup and token:
+        grouped_results = _extract_with_po_prefetch(spec, pdf_files, extract_pkg_descs, po_lookup, token)
+    else:
+        grouped_results = spec.extract(pdf_files, extract_pkg_descs, token)
+    if not spec.uses_bc:
+        return grouped_results
+
+    final_grouped_results = aggregate_duplicate_lots(grouped_results, vendor=spec.name)
+    all_items = [item for items_list in final_grouped_results.values() for item in items_list]
+    po_items = fetch_po_options(all_items, po_lookup, token) if po_lookup else []
+    attach_bc_options(all_items, spec, po_items, _resolve(pkg_descs))
+    return final_grouped_results
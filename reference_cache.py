@@ -0,0 +1,189 @@
+# reference_cache.py
+"""
+BC reference data (package descriptions, treatments, the item list) shared by
+every request in the process.
+
+Each dataset is registered with a loader and a TTL. ``get`` returns the
+cached value; once it is older than its TTL the old value is still served
+while one background refresh runs (stale-while-revalidate). Only a dataset
+that has never loaded makes the caller wait for BC. After
+``start_refresher`` a background thread also loads every registered dataset
+up front and reloads expired ones, so neither a cold worker nor a stale
+list ever lands on the upload path.
+
+Loaders take one argument, a BC token or None. The caller's token is used
+for a cold load on the request path; background loads pass None and the
+loader falls back to the app-only service token.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("invoice-ocr")
+
+# Seconds between refresher sweeps
+REFERENCE_REFRESH_INTERVAL = float(os.getenv("REFERENCE_REFRESH_INTERVAL", "60"))
+
+
+class _Dataset:
+    def __init__(self, name: str, loader: Callable[[Optional[str]], Any], ttl: float):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.value: Any = None
+        self.loaded_at = 0.0
+        self.last_error: Optional[str] = None
+        self.lock = threading.Lock()  # one load at a time per dataset
+        self.refreshing = False
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at > 0
+
+    def stale(self, now: float = None) -> bool:
+        return not self.loaded or (now or time.time()) - self.loaded_at >= self.ttl
+
+
+_datasets: Dict[str, _Dataset] = {}
+_registry_lock = threading.Lock()
+_refresher: Optional[threading.Thread] = None
+_refresher_pid = None
+_refresher_enabled = False
+_wake = threading.Event()
+
+
+def register(name: str, loader: Callable[[Optional[str]], Any], ttl: float) -> None:
+    """Declares a dataset; registering an existing name again is a no-op."""
+    with _registry_lock:
+        if name not in _datasets:
+            _datasets[name] = _Dataset(name, loader, ttl)
+    if _refresher_enabled:
+        _wake.set()
+
+
+def _load(ds: _Dataset, token: Optional[str], if_cold: bool = False) -> Any:
+    """Runs the loader under the dataset lock. Raises if it fails."""
+    with ds.lock:
+        if if_cold and ds.loaded:
+            return ds.value  # loaded by whoever held the lock before us
+        start = time.perf_counter()
+        try:
+            value = ds.loader(token)
+        except Exception as e:
+            ds.last_error = str(e)
+            raise
+        finally:
+            ds.refreshing = False
+        ds.value, ds.loaded_at, ds.last_error = value, time.time(), None
+        logger.info(f"[REFCACHE] Loaded {ds.name} in {time.perf_counter() - start:.2f}s")
+        return value
+
+
+def _refresh_in_background(ds: _Dataset) -> None:
+    with _registry_lock:
+        if ds.refreshing:
+            return
+        ds.refreshing = True
+
+    def run():
+        try:
+            _load(ds, None)
+        except Exception as e:
+            logger.error(f"[REFCACHE] Refresh of {ds.name} failed, serving stale data: {e}")
+
+    threading.Thread(target=run, name=f"refcache-{ds.name}", daemon=True).start()
+
+
+def get(name: str, token: Optional[str] = None) -> Any:
+    """
+    The dataset's value. Stale values are returned immediately and refreshed
+    in the background; a dataset that has never loaded is loaded now with
+    ``token``, and the loader's exception propagates if that fails.
+    """
+    ds = _datasets[name]
+    _ensure_refresher()
+    if not ds.loaded:
+        return _load(ds, token, if_cold=True)
+    if ds.stale():
+        _refresh_in_background(ds)
+    return ds.value
+
+
+def peek(name: str) -> Any:
+    """The cached value (possibly stale), or None; never calls BC."""
+    ds = _datasets.get(name)
+    return ds.value if ds is not None and ds.loaded else None
+
+
+def put(name: str, value: Any) -> None:
+    """Seeds a dataset with a value loaded elsewhere (e.g. a pool worker's shared data)."""
+    with _registry_lock:
+        ds = _datasets.setdefault(name, _Dataset(name, lambda token: value, float("inf")))
+    ds.value, ds.loaded_at, ds.last_error = value, time.time(), None
+
+
+def refresh(name: Optional[str] = None, token: Optional[str] = None) -> Dict[str, Optional[str]]:
+    """Reloads one dataset (or all of them) now. Returns {name: error or None}."""
+    names = [name] if name else list(_datasets)
+    results = {}
+    for n in names:
+        try:
+            _load(_datasets[n], token)
+            results[n] = None
+        except Exception as e:
+            logger.error(f"[REFCACHE] Forced refresh of {n} failed: {e}")
+            results[n] = str(e)
+    return results
+
+
+def status() -> Dict[str, dict]:
+    now = time.time()
+    return {
+        name: {
+            "loaded": ds.loaded,
+            "age_seconds": round(now - ds.loaded_at, 1) if ds.loaded else None,
+            "ttl_seconds": ds.ttl,
+            "stale": ds.stale(now),
+            "size": len(ds.value) if hasattr(ds.value, "__len__") else None,
+            "last_error": ds.last_error,
+        }
+        for name, ds in list(_datasets.items())
+    }
+
+
+# ── Background refresher ─────────────────────────────────────────────────────
+
+def start_refresher() -> None:
+    """Loads every registered dataset in the background and keeps them within their TTLs."""
+    global _refresher_enabled
+    _refresher_enabled = True
+    _ensure_refresher()
+
+
+def _ensure_refresher() -> None:
+    # Threads do not survive fork: a forked web/worker process starts its own
+    global _refresher, _refresher_pid
+    if not _refresher_enabled:
+        return
+    if _refresher is None or _refresher_pid != os.getpid():
+        with _registry_lock:
+            if _refresher is None or _refresher_pid != os.getpid():
+                _refresher_pid = os.getpid()
+                _refresher = threading.Thread(target=_run_refresher, name="refcache", daemon=True)
+                _refresher.start()
+
+
+def _run_refresher() -> None:
+    while True:
+        now = time.time()
+        for ds in list(_datasets.values()):
+            if ds.stale(now) and not ds.refreshing:
+                try:
+                    _load(ds, None)
+                except Exception as e:
+                    logger.error(f"[REFCACHE] Background load of {ds.name} failed: {e}")
+        _wake.wait(REFERENCE_REFRESH_INTERVAL)
+        _wake.clear()
@@ -0,0 +1,31 @@
+import os
+
+from cli import iter_batches, iter_pdf_paths
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def test_recursive_batches_keep_same_named_files_apart(tmp_path):
+    _write(tmp_path / "invoice.pdf", b"root")
+    _write(tmp_path / "2024" / "invoice.pdf", b"2024")
+    _write(tmp_path / "2025" / "invoice.pdf", b"2025")
+    _write(tmp_path / "notes.txt", b"skip")
+
+    paths = iter_pdf_paths(str(tmp_path), recursive=True)
+    (batch,) = iter_batches(paths, 0, str(tmp_path))
+
+    assert dict(batch) == {
+        os.path.join("2024", "invoice.pdf"): b"2024",
+        os.path.join("2025", "invoice.pdf"): b"2025",
+        "invoice.pdf": b"root",
+    }
+
+
+def test_batch_size_splits_the_directory(tmp_path):
+    for i in range(5):
+        _write(tmp_path / f"{i}.pdf", bytes([i]))
+    paths = iter_pdf_paths(str(tmp_path), recursive=False)
+    assert [len(b) for b in iter_batches(paths, 2, str(tmp_path))] == [2, 2, 1]
@@ -0,0 +1,15 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from db_logger import parse_log_cursor
+
+
+def test_cursor_round_trip():
+    ts = datetime(2024, 3, 1, 9, 30, 15, 123456, tzinfo=timezone.utc)
+    assert parse_log_cursor(f"{ts.isoformat()}_42") == (ts, 42)
+
+
+@pytest.mark.parametrize("before", [None, "", "2024-03-01T09:30:15", "not-a-date_42", "2024-03-01T09:30:15_x"])
+def test_malformed_cursor_means_first_page(before):
+    assert parse_log_cursor(before) is None
@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+from psycopg2.pool import PoolError
+
+import db_pool
+
+
+class FakeConn:
+    closed = 0
+
+
+class FakePool:
+    """ThreadedConnectionPool's contract: getconn raises once maxconn are checked out."""
+
+    def __init__(self, minconn, maxconn, **kwargs):
+        self.maxconn = maxconn
+        self.used = 0
+
+    def getconn(self):
+        if self.used >= self.maxconn:
+            raise PoolError("connection pool exhausted")
+        self.used += 1
+        return FakeConn()
+
+    def putconn(self, conn, close=False):
+        self.used -= 1
+
+
+@pytest.fixture(autouse=True)
+def fake_pool(monkeypatch):
+    monkeypatch.setattr(db_pool, "ThreadedConnectionPool", FakePool)
+    monkeypatch.setattr(db_pool, "DB_POOL_MAX", 2)
+    monkeypatch.setattr(db_pool, "_pool", None)
+
+
+def test_getconn_waits_for_a_returned_connection():
+    held = [db_pool.getconn(), db_pool.getconn()]
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(db_pool.getconn()))
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive()  # blocked, not failed
+
+    db_pool.putconn(held.pop())
+    waiter.join(2)
+    assert len(got) == 1
+    stats = db_pool.pool_stats()
+    assert stats["in_use"] == 2 and stats["waits"] == 1 and stats["timeouts"] == 0
+
+
+def test_getconn_times_out(monkeypatch):
+    monkeypatch.setattr(db_pool, "DB_POOL_TIMEOUT", 0.05)
+    db_pool.getconn(), db_pool.getconn()
+    with pytest.raises(PoolError):
+        db_pool.getconn()
+    assert db_pool.pool_stats()["timeouts"] == 1
+
+
+def test_connection_context_returns_the_connection():
+    with db_pool.connection():
+        assert db_pool.pool_stats()["in_use"] == 1
+    stats = db_pool.pool_stats()
+    assert stats["in_use"] == 0 and stats["peak_in_use"] == 1
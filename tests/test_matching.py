@@ -0,0 +1,82 @@
+from matching import aggregate_duplicate_lots
+
+
+def _hm_item(qty, price, desc="Spinach Pump 25 Ks", cost=None):
+    item = {
+        "VendorLot": "L100", "VendorBatchLot": "B7", "VendorItemDescription": desc,
+        "TotalQuantity": qty, "TotalPrice": price,
+    }
+    if cost is not None:
+        item["USD_Actual_Cost_$"] = cost
+    return item
+
+
+def test_hm_clause_merges_lot_and_batch_and_recomputes_cost():
+    grouped = {"a.pdf": [_hm_item("2", "20", cost=10.0), _hm_item(3, 45, desc="Spinach Pump Pail 30 Ks")]}
+    result = aggregate_duplicate_lots(grouped, "hm_clause")
+
+    assert len(result["a.pdf"]) == 1
+    merged = result["a.pdf"][0]
+    assert merged["TotalQuantity"] == 5
+    assert merged["TotalPrice"] == 65
+    assert merged["USD_Actual_Cost_$"] == 13.0
+    # the longer description wins and is flagged
+    assert merged["VendorItemDescription"] == "Spinach Pump Pail 30 Ks [COMBINED]"
+
+
+def test_cost_includes_upcharge_and_discount():
+    first = dict(_hm_item(1, 10, cost=10.0), TotalUpcharge=2, TotalDiscount=0)
+    second = dict(_hm_item(1, 10), TotalUpcharge=0, TotalDiscount=4)
+    merged = aggregate_duplicate_lots({"a.pdf": [first, second]}, "hm_clause")["a.pdf"][0]
+    assert merged["USD_Actual_Cost_$"] == 9.0
+
+
+def test_different_batches_are_not_merged():
+    other = dict(_hm_item(1, 10), VendorBatchLot="B8")
+    result = aggregate_duplicate_lots({"a.pdf": [_hm_item(1, 10), other]}, "hm_clause")
+    assert len(result["a.pdf"]) == 2
+
+
+def test_syngenta_trims_package_size_from_combined_description():
+    items = [
+        {"VendorLot": "S1", "VendorItemNumber": "123", "VendorItemDescription": "FLAME Tomato 1,000 SDS",
+         "TotalQuantity": 1, "TotalPrice": 5},
+        {"VendorLot": "S1", "VendorItemNumber": "123", "VendorItemDescription": "FLAME Tomato 1,000 SDS",
+         "TotalQuantity": 1, "TotalPrice": 5},
+    ]
+    merged = aggregate_duplicate_lots({"a.pdf": items}, "syngenta")["a.pdf"][0]
+    assert merged["VendorItemDescription"] == "FLAME Tomato [COMBINED]"
+    assert merged["TotalQuantity"] == 2
+
+
+def test_sakata_flattens_lots_and_prices_per_seed_unit():
+    item = {
+        "VendorItemNumber": "SK1", "VendorDescription": "Spinach Seaside 25M", "QtyShipped": 2,
+        "Lots": [
+            {"VendorLotNo": "X1", "TotalPrice": 100},
+            {"VendorLotNo": "X1", "TotalPrice": 100},
+        ],
+    }
+    result = aggregate_duplicate_lots({"a.pdf": [item]}, "sakata")
+    assert len(result["a.pdf"]) == 1
+    merged = result["a.pdf"][0]
+    assert "Lots" not in merged
+    assert merged["TotalQuantity"] == 4
+    assert merged["USD_Actual_Cost_$"] == 2.0  # 200 / (4 packages * 25M)
+
+
+def test_items_without_a_key_or_numbers_pass_through():
+    no_lot = {"VendorItemDescription": "Freight", "TotalQuantity": 1}
+    bad_qty = {"VendorLot": "L1", "VendorBatchLot": "B1", "TotalQuantity": "n/a"}
+    result = aggregate_duplicate_lots({"a.pdf": [no_lot, bad_qty], "empty.pdf": []}, "hm_clause")
+    assert result == {"a.pdf": [no_lot, bad_qty]}
+
+
+def test_streaming_callers_merge_across_files():
+    unique_items_map, merged_into = {}, []
+    first = aggregate_duplicate_lots({"a.pdf": [_hm_item(1, 10)]}, "hm_clause", unique_items_map, merged_into)
+    second = aggregate_duplicate_lots({"b.pdf": [_hm_item(2, 20)]}, "hm_clause", unique_items_map, merged_into)
+
+    assert second == {}
+    assert merged_into == [first["a.pdf"][0]]
+    assert first["a.pdf"][0]["TotalQuantity"] == 3
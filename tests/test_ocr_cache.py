@@ -0,0 +1,73 @@
+import os
+import time
+
+import pytest
+
+from vendor_extractors import ocr_cache
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocr_cache, "OCR_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(ocr_cache, "OCR_CACHE_ENABLED", True)
+    return tmp_path
+
+
+def test_cache_key_is_stable_and_salted_by_variant():
+    pdf = b"%PDF-1.7 example"
+    assert ocr_cache.cache_key(pdf) == ocr_cache.cache_key(pdf)
+    assert ocr_cache.cache_key(pdf) != ocr_cache.cache_key(pdf + b" ")
+    assert ocr_cache.cache_key(pdf, "pages=1") != ocr_cache.cache_key(pdf)
+    assert ocr_cache.cache_key(pdf, "pages=1") != ocr_cache.cache_key(pdf, "pages=2")
+
+
+def test_miss_then_hit(cache_dir):
+    key = ocr_cache.cache_key(b"doc")
+    assert ocr_cache.get(key) is None
+
+    payload = {"analyzeResult": {"pages": [{"lines": [{"content": "INVOICE"}]}]}}
+    ocr_cache.put(key, payload)
+
+    assert ocr_cache.get(key) == payload
+    assert (cache_dir / key[:2] / f"{key}.json").is_file()
+
+
+def test_disabled_cache_never_reads_or_writes(cache_dir, monkeypatch):
+    monkeypatch.setattr(ocr_cache, "OCR_CACHE_ENABLED", False)
+    key = ocr_cache.cache_key(b"doc")
+    ocr_cache.put(key, {"a": 1})
+    assert ocr_cache.get(key) is None
+    assert not any(cache_dir.iterdir())
+
+
+def test_unreadable_entry_is_dropped(cache_dir):
+    key = ocr_cache.cache_key(b"doc")
+    path = cache_dir / key[:2] / f"{key}.json"
+    path.parent.mkdir()
+    path.write_text("{not json")
+
+    assert ocr_cache.get(key) is None
+    assert not path.exists()
+
+
+def test_evict_removes_least_recently_used_first(cache_dir):
+    keys = [ocr_cache.cache_key(bytes([i])) for i in range(3)]
+    for age, key in zip((300, 200, 100), keys):
+        ocr_cache.put(key, {"blob": "x" * 1000})
+        path = cache_dir / key[:2] / f"{key}.json"
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+
+    # A hit refreshes the oldest entry, so the middle one is now the LRU.
+    assert ocr_cache.get(keys[0]) is not None
+
+    entry_size = (cache_dir / keys[0][:2] / f"{keys[0]}.json").stat().st_size
+    assert ocr_cache.evict(max_bytes=entry_size * 2) == 1
+    assert ocr_cache.get(keys[1]) is None
+    assert ocr_cache.get(keys[0]) is not None
+    assert ocr_cache.get(keys[2]) is not None
+
+
+def test_evict_is_a_no_op_under_the_cap(cache_dir):
+    ocr_cache.put(ocr_cache.cache_key(b"doc"), {"a": 1})
+    assert ocr_cache.evict(max_bytes=10 * 1024 * 1024) == 0
@@ -0,0 +1,99 @@
+import fitz
+import pytest
+
+from vendor_extractors import page_quality
+from vendor_extractors.page_quality import (
+    PageQuality, _glyph_valid_ratio, no_usable_text, pages_needing_ocr, score_page,
+)
+
+LONG_TEXT = "INVOICE 12345 Lot ABC-001 Spinach Seed 25 LB " * 12
+
+
+def _page_with_text(text):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(36, 36, 576, 756), text, fontsize=8)
+    return doc, page
+
+
+def _page_with_image(coverage_rect, text=""):
+    doc = fitz.open()
+    page = doc.new_page()
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 20, 20), False)
+    pix.clear_with(200)
+    page.insert_image(coverage_rect, pixmap=pix)
+    if text:
+        page.insert_text((40, 40), text, fontsize=8)
+    return doc, page
+
+
+def _quality(needs_ocr, char_count=500):
+    return PageQuality(char_count, 1.0, 0.0, False, needs_ocr, "")
+
+
+def test_glyph_valid_ratio():
+    assert _glyph_valid_ratio("") == 1.0
+    assert _glyph_valid_ratio("   \n") == 1.0
+    assert _glyph_valid_ratio("INVOICE 123") == 1.0
+    assert _glyph_valid_ratio("ab\ufffd\ufffd") == pytest.approx(0.5)
+    assert _glyph_valid_ratio("a\ue000") == pytest.approx(0.5)  # private use
+
+
+def test_plenty_of_text_is_usable():
+    doc, page = _page_with_text(LONG_TEXT)
+    q = score_page(page)
+    assert not q.needs_ocr
+    assert q.usable_text
+    assert q.char_count >= page_quality.SPARSE_CHARS
+
+
+def test_blank_page_is_skipped():
+    doc = fitz.open()
+    page = doc.new_page()
+    q = score_page(page)
+    assert not q.needs_ocr
+    assert not q.usable_text
+    assert q.reason == "blank page"
+
+
+def test_scanned_page_needs_ocr():
+    doc, page = _page_with_image(fitz.Rect(0, 0, 612, 792))
+    q = score_page(page)
+    assert q.needs_ocr
+    assert q.image_coverage >= page_quality.MIN_IMAGE_COVERAGE
+
+
+def test_scan_with_thin_text_layer_needs_ocr():
+    doc, page = _page_with_image(fitz.Rect(0, 0, 612, 792), text="Scanned by office copier " * 4)
+    q = score_page(page)
+    assert page_quality.MIN_CHARS <= q.char_count < page_quality.SPARSE_CHARS
+    assert q.needs_ocr
+    assert q.reason.startswith("sparse text")
+
+
+def test_small_logo_does_not_trigger_ocr():
+    doc, page = _page_with_image(fitz.Rect(36, 36, 96, 96), text="Short memo " * 10)
+    q = score_page(page)
+    assert not q.needs_ocr
+
+
+def test_garbled_text_layer_needs_ocr():
+    doc, page = _page_with_text(LONG_TEXT)
+    q = score_page(page, text="\ufffd" * 300 + "abc")
+    assert q.needs_ocr
+    assert q.reason.startswith("garbled")
+
+
+def test_keyword_hit_keeps_short_text_layer():
+    doc, page = _page_with_image(fitz.Rect(0, 0, 612, 792))
+    text = "SYNGENTA INVOICE No. 9000123 dated 01/02/2024 total 100.00"
+    q = score_page(page, keywords=("invoice",), text=text)
+    assert q.keyword_hit
+    assert not q.needs_ocr
+
+
+def test_document_policies():
+    qualities = [_quality(False), _quality(True), _quality(False, char_count=0), _quality(True)]
+    assert pages_needing_ocr(qualities) == [2, 4]
+    assert not no_usable_text(qualities)
+    assert no_usable_text([_quality(True), _quality(False, char_count=0)])
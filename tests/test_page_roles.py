@@ -0,0 +1,50 @@
+from vendor_extractors.page_roles import (
+    ANALYSIS_REPORT, BOILERPLATE, GERM_LETTER, INVOICE, PACKING_LIST, UNKNOWN, UNKNOWN_ROLE,
+    PageRole, RoleRule, classify_lines, classify_pages, classify_text, document_roles,
+)
+
+
+def test_default_rules_classify_each_role():
+    assert classify_text("Commercial Invoice No. 123").role == INVOICE
+    assert classify_text("REPORT OF SEED ANALYSIS").role == ANALYSIS_REPORT
+    assert classify_text("Packing Slip for order 55").role == PACKING_LIST
+    assert classify_text("Test date confirmation for lot A1").role == GERM_LETTER
+    assert classify_text("Terms and Conditions of Sale apply").role == BOILERPLATE
+
+
+def test_reports_win_over_the_invoice_they_quote():
+    assert classify_text("Certificate of Analysis - Invoice 9001").role == ANALYSIS_REPORT
+    assert classify_text("Packing list for invoice 9001").role == PACKING_LIST
+
+
+def test_invoice_with_terms_is_still_an_invoice():
+    assert classify_text("INVOICE ... NOTICE TO PURCHASER").role == INVOICE
+
+
+def test_empty_or_unmatched_text_is_unknown():
+    assert classify_text("") is UNKNOWN_ROLE
+    assert classify_text("   \n ") is UNKNOWN_ROLE
+    assert classify_text("Dear customer, thank you").role == UNKNOWN
+
+
+def test_vendor_rules_need_all_of_and_any_of():
+    rules = (
+        RoleRule("customs_invoice", INVOICE, all_of=("CONSIGNEE", "H-S CODE")),
+        RoleRule("quality_cert", ANALYSIS_REPORT, all_of=("QUALITY",), any_of=("CERTIFICATE", "CERT.")),
+    )
+    assert classify_text("Consignee: X  H-S code 1209", rules) == PageRole("customs_invoice", INVOICE)
+    assert classify_text("Consignee only", rules) is UNKNOWN_ROLE
+    assert classify_text("Quality cert. 42", rules) == PageRole("quality_cert", ANALYSIS_REPORT)
+    assert classify_text("Quality notes", rules) is UNKNOWN_ROLE
+
+
+def test_classify_lines_joins_lines():
+    rules = (RoleRule("customs_invoice", INVOICE, all_of=("CONSIGNEE", "H-S CODE")),)
+    assert classify_lines(["Consignee: X", "H-S code 1209"], rules).label == "customs_invoice"
+
+
+def test_document_roles():
+    roles = classify_pages(["INVOICE 1", "", "Seed analysis", "INVOICE 1 page 2"])
+    assert [r.role for r in roles] == [INVOICE, UNKNOWN, ANALYSIS_REPORT, INVOICE]
+    assert document_roles(roles) == {INVOICE, UNKNOWN, ANALYSIS_REPORT}
+    assert document_roles([]) == set()
@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+import reference_cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_registry(monkeypatch):
+    monkeypatch.setattr(reference_cache, "_datasets", {})
+    monkeypatch.setattr(reference_cache, "_refresher_enabled", False)
+
+
+class Loader:
+    """Counts calls and returns ``values`` in turn; an Exception value is raised."""
+
+    def __init__(self, *values):
+        self.values = list(values)
+        self.tokens = []
+        self.called = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self, token):
+        self.gate.wait(2)
+        self.tokens.append(token)
+        value = self.values.pop(0) if len(self.values) > 1 else self.values[0]
+        self.called.set()
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+def _expire(name):
+    reference_cache._datasets[name].loaded_at -= 3600
+
+
+def _wait_for_refresh(name):
+    ds = reference_cache._datasets[name]
+    for _ in range(200):
+        if not ds.refreshing:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("background refresh did not finish")
+
+
+def test_cold_get_loads_with_callers_token():
+    loader = Loader(["a"])
+    reference_cache.register("items", loader, ttl=60)
+
+    assert reference_cache.peek("items") is None
+    assert reference_cache.get("items", "user-token") == ["a"]
+    assert reference_cache.get("items", "user-token") == ["a"]
+    assert loader.tokens == ["user-token"]
+
+
+def test_cold_load_failure_propagates():
+    reference_cache.register("items", Loader(RuntimeError("BC down")), ttl=60)
+
+    with pytest.raises(RuntimeError):
+        reference_cache.get("items")
+    assert reference_cache.status()["items"]["last_error"] == "BC down"
+    assert reference_cache.peek("items") is None
+
+
+def test_register_twice_keeps_the_first_loader():
+    reference_cache.register("items", Loader(["first"]), ttl=60)
+    reference_cache.register("items", Loader(["second"]), ttl=60)
+    assert reference_cache.get("items") == ["first"]
+
+
+def test_stale_value_is_served_while_refreshing_in_background():
+    loader = Loader(["old"], ["new"])
+    reference_cache.register("items", loader, ttl=60)
+    reference_cache.get("items", "user-token")
+    loader.called.clear()
+    loader.gate.clear()
+    _expire("items")
+    assert reference_cache.status()["items"]["stale"]
+
+    assert reference_cache.get("items", "user-token") == ["old"]
+    assert reference_cache.get("items", "user-token") == ["old"]  # one refresh at a time
+    loader.gate.set()
+    assert loader.called.wait(2)
+    _wait_for_refresh("items")
+
+    assert reference_cache.get("items") == ["new"]
+    assert loader.tokens == ["user-token", None]  # background loads use the service token
+    assert not reference_cache.status()["items"]["stale"]
+
+
+def test_failed_background_refresh_keeps_stale_value():
+    loader = Loader(["old"], RuntimeError("BC down"))
+    reference_cache.register("items", loader, ttl=60)
+    reference_cache.get("items")
+    loader.called.clear()
+    loader.gate.clear()
+    _expire("items")
+
+    assert reference_cache.get("items") == ["old"]
+    loader.gate.set()
+    assert loader.called.wait(2)
+    _wait_for_refresh("items")
+
+    assert reference_cache.peek("items") == ["old"]
+    status = reference_cache.status()["items"]
+    assert status["stale"] and status["last_error"] == "BC down"
+
+
+def test_put_seeds_an_unregistered_dataset():
+    reference_cache.put("package_descriptions", {"SK1": "25M"})
+    assert reference_cache.peek("package_descriptions") == {"SK1": "25M"}
+    assert reference_cache.get("package_descriptions") == {"SK1": "25M"}
+    assert not reference_cache.status()["package_descriptions"]["stale"]
+
+
+def test_forced_refresh_reports_errors_per_dataset():
+    reference_cache.register("items", Loader(["a"], ["b"]), ttl=60)
+    reference_cache.register("treatments", Loader(RuntimeError("401")), ttl=60)
+
+    assert reference_cache.refresh("items", "user-token") == {"items": None}
+    assert reference_cache.refresh() == {"items": None, "treatments": "401"}
+    assert reference_cache.peek("items") == ["b"]
+    assert reference_cache.status()["items"]["size"] == 1
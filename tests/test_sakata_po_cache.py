@@ -0,0 +1,90 @@
+from collections import OrderedDict
+
+import pytest
+
+from vendor_extractors import sakata
+
+
+class FakeBC:
+    """Stands in for _fetch_po_lines: {query: {po: lines}}; a query mapped to None fails."""
+
+    def __init__(self, live, archive):
+        self.results = {"PurchaseOrderQuery": live, "ArchivePurchaseOrderQuery": archive}
+        self.calls = []
+
+    def __call__(self, query, po_numbers, headers):
+        self.calls.append((query, list(po_numbers)))
+        result = self.results[query]
+        if result is None:
+            return None
+        return {po: lines for po, lines in result.items() if po in po_numbers}
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(sakata, "_po_cache", OrderedDict())
+
+
+def _line(no):
+    return {"No": no, "Description": f"Item {no}"}
+
+
+def test_second_lookup_is_served_from_cache(monkeypatch):
+    bc = FakeBC(live={"PO1": [_line("A"), _line("B")]}, archive={})
+    monkeypatch.setattr(sakata, "_fetch_po_lines", bc)
+
+    assert sakata.get_po_items("PO1", "tok") == [_line("A"), _line("B")]
+    assert sakata.get_po_items(" PO1 ", "tok") == [_line("A"), _line("B")]
+    assert bc.calls == [("PurchaseOrderQuery", ["PO1"])]
+
+
+def test_only_uncached_pos_are_fetched_and_results_are_deduplicated(monkeypatch):
+    bc = FakeBC(live={"PO1": [_line("A")], "PO2": [_line("A"), _line("C")]}, archive={"PO3": [_line("D")]})
+    monkeypatch.setattr(sakata, "_fetch_po_lines", bc)
+    sakata.get_po_items("PO1", "tok")
+    bc.calls.clear()
+
+    assert sakata.get_po_items("PO1|PO2|PO3|PO1", "tok") == [_line("A"), _line("C"), _line("D")]
+    assert bc.calls == [
+        ("PurchaseOrderQuery", ["PO2", "PO3"]),
+        ("ArchivePurchaseOrderQuery", ["PO3"]),
+    ]
+
+
+def test_unknown_po_is_cached_as_empty(monkeypatch):
+    bc = FakeBC(live={}, archive={})
+    monkeypatch.setattr(sakata, "_fetch_po_lines", bc)
+
+    assert sakata.get_po_items("PO9", "tok") == []
+    assert sakata.get_po_items("PO9", "tok") == []
+    assert len(bc.calls) == 2  # live + archive, once
+
+
+def test_failed_live_lookup_is_not_cached(monkeypatch):
+    bc = FakeBC(live=None, archive={"PO1": [_line("OLD")]})
+    monkeypatch.setattr(sakata, "_fetch_po_lines", bc)
+    assert sakata.get_po_items("PO1", "tok") == [_line("OLD")]
+
+    bc.results["PurchaseOrderQuery"] = {"PO1": [_line("NEW")]}
+    assert sakata.get_po_items("PO1", "tok") == [_line("NEW")]
+
+
+def test_failed_archive_lookup_is_not_cached(monkeypatch):
+    bc = FakeBC(live={}, archive=None)
+    monkeypatch.setattr(sakata, "_fetch_po_lines", bc)
+    assert sakata.get_po_items("PO1", "tok") == []
+
+    bc.results["ArchivePurchaseOrderQuery"] = {"PO1": [_line("OLD")]}
+    assert sakata.get_po_items("PO1", "tok") == [_line("OLD")]
+
+
+def test_expired_and_overflowing_entries_are_dropped(monkeypatch):
+    monkeypatch.setattr(sakata, "PO_CACHE_MAX", 2)
+    for po in ("PO1", "PO2", "PO3"):
+        sakata._po_cache_put(po, [_line(po)])
+    assert sakata._po_cache_get("PO1") is None
+    assert sakata._po_cache_get("PO3") == [_line("PO3")]
+
+    monkeypatch.setattr(sakata, "PO_CACHE_TTL", -1)
+    sakata._po_cache_put("PO4", [_line("PO4")])
+    assert sakata._po_cache_get("PO4") is None
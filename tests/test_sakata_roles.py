@@ -0,0 +1,21 @@
+from vendor_extractors.page_roles import ANALYSIS_REPORT, INVOICE, PACKING_LIST, classify_pages, document_roles
+from vendor_extractors.sakata import SAKATA_INVOICE_ROLE_RULES
+
+
+def _roles(*page_texts):
+    return document_roles(classify_pages(page_texts, SAKATA_INVOICE_ROLE_RULES))
+
+
+def test_invoice_mentioning_seed_analysis_is_an_invoice():
+    page = "Sakata Seed America  INV-0012345  Spinach Seaside 25M  Seed analysis available on request"
+    assert _roles(page) == {INVOICE}
+
+
+def test_invoice_identified_only_by_its_number():
+    assert _roles("Invoice number 12345  Ship to: Stokes Seeds") == {INVOICE}
+    assert _roles("INV-0012345  Lot 7781  Qty 4") == {INVOICE}
+
+
+def test_supporting_documents_are_not_invoices():
+    assert _roles("REPORT OF SEED ANALYSIS  Lot 7781  Germination 92%") == {ANALYSIS_REPORT}
+    assert _roles("Packing list  Lot 7781") == {PACKING_LIST}
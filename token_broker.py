@@ -0,0 +1,176 @@
+# token_broker.py
+"""
+Per-user BC access tokens, kept in memory until shortly before they expire.
+
+BC-calling routes used to build a ConfidentialClientApplication, load the
+user's MSAL cache from Postgres, call acquire_token_silent and write the
+cache back on every request - 50 lot creations meant 50 of each. The broker
+keeps, per signed-in user, one MSAL app bound to that user's token cache
+plus the current access token. MSAL is only asked again when the token is
+within ``refresh_margin`` seconds of expiry (or BC rejected it), and the
+cache goes back to Postgres only when MSAL changed it.
+
+All users' MSAL apps share one HTTP session, so authority discovery and
+connections are reused.
+"""
+
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+import msal
+import requests
+
+import db_pool
+
+logger = logging.getLogger("invoice-ocr")
+
+
+class _UserTokens:
+    def __init__(self, cache: msal.SerializableTokenCache, app: msal.ConfidentialClientApplication):
+        self.cache = cache
+        self.app = app
+        self.access_token: Optional[str] = None
+        self.expires_at = 0.0
+        # Set when BC rejected the token: MSAL would otherwise hand back the same cached one
+        self.force_refresh = False
+        self.lock = threading.Lock()
+
+
+class TokenBroker:
+    def __init__(self, client_id: str, client_secret: str, authority: str, scopes: list, refresh_margin: int = 300):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.authority = authority
+        self.scopes = scopes
+        self.refresh_margin = refresh_margin
+        self._http = requests.Session()
+        self._users: Dict[str, _UserTokens] = {}
+        self._lock = threading.Lock()
+
+    # ── MSAL apps and persisted caches ───────────────────────────────────────
+
+    def build_app(self, cache: msal.SerializableTokenCache = None) -> msal.ConfidentialClientApplication:
+        return msal.ConfidentialClientApplication(
+            client_id=self.client_id,
+            client_credential=self.client_secret,
+            authority=self.authority,
+            token_cache=cache,
+            http_client=self._http,
+        )
+
+    def _user(self, user_name: str) -> _UserTokens:
+        with self._lock:
+            entry = self._users.get(user_name)
+        if entry is None:
+            cache = load_user_cache(user_name)
+            entry = _UserTokens(cache, self.build_app(cache))
+            with self._lock:
+                entry = self._users.setdefault(user_name, entry)
+        return entry
+
+    def app_for(self, user_name: Optional[str]) -> msal.ConfidentialClientApplication:
+        """The MSAL app for sign-in flows; a throwaway one before we know who the user is."""
+        return self._user(user_name).app if user_name else self.build_app()
+
+    # ── Tokens ───────────────────────────────────────────────────────────────
+
+    def get_token(self, user_name: Optional[str], force_refresh: bool = False) -> Optional[str]:
+        """A BC access token for the user, or None if they have to sign in again."""
+        if not user_name:
+            return None
+        entry = self._user(user_name)
+        with entry.lock:
+            force_refresh = force_refresh or entry.force_refresh
+            if not force_refresh and entry.access_token and entry.expires_at - self.refresh_margin > time.time():
+                return entry.access_token
+
+            accounts = entry.app.get_accounts()
+            if not accounts:
+                logger.warning(f"[TOKENS] No MSAL account cached for {user_name}")
+                return None
+            result = entry.app.acquire_token_silent(scopes=self.scopes, account=accounts[0],
+                                                    force_refresh=force_refresh)
+            if not result or "access_token" not in result:
+                logger.error(f"[TOKENS] Silent token refresh failed for {user_name}: "
+                             f"{(result or {}).get('error_description', 'No details')}")
+                entry.access_token = None
+                return None
+
+            entry.access_token = result["access_token"]
+            entry.expires_at = time.time() + int(result.get("expires_in", 0))
+            entry.force_refresh = False
+            if entry.cache.has_state_changed:
+                save_user_cache(user_name, entry.cache)
+            return entry.access_token
+
+    def store_login(self, user_name: str, cache: msal.SerializableTokenCache, result: dict):
+        """Adopts the cache and token from a completed authorization-code sign-in."""
+        entry = _UserTokens(cache, self.build_app(cache))
+        entry.access_token = result["access_token"]
+        entry.expires_at = time.time() + int(result.get("expires_in", 0))
+        with self._lock:
+            self._users[user_name] = entry
+        if cache.has_state_changed:
+            save_user_cache(user_name, cache)
+
+    def invalidate(self, user_name: Optional[str]):
+        """BC rejected the user's token: the next get_token makes MSAL fetch a new one."""
+        entry = self._users.get(user_name) if user_name else None
+        if entry is not None:
+            entry.access_token = None
+            entry.force_refresh = True
+
+    def forget(self, user_name: Optional[str]):
+        """Sign-out: drops the user's tokens from memory and Postgres."""
+        if not user_name:
+            return
+        with self._lock:
+            self._users.pop(user_name, None)
+        delete_user_cache(user_name)
+
+
+# ── Postgres persistence (msal_token_cache) ──────────────────────────────────
+
+def load_user_cache(user_name: str) -> msal.SerializableTokenCache:
+    """Load MSAL cache for this user from PostgreSQL."""
+    cache = msal.SerializableTokenCache()
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT token_cache_data
+            FROM msal_token_cache
+            WHERE user_name = %s
+        """, (user_name,))
+        row = cur.fetchone()
+        if row:
+            cache.deserialize(row[0])
+        cur.close()
+    return cache
+
+
+def save_user_cache(user_name: str, cache: msal.SerializableTokenCache):
+    """Save MSAL cache for this user to PostgreSQL."""
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO msal_token_cache (user_name, token_cache_data, updated_at)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (user_name)
+            DO UPDATE SET token_cache_data = EXCLUDED.token_cache_data,
+                          updated_at = EXCLUDED.updated_at
+        """, (user_name, cache.serialize(), datetime.now()))
+        conn.commit()
+        cur.close()
+    cache.has_state_changed = False
+
+
+def delete_user_cache(user_name: str):
+    """Clear MSAL Token Cache for this user."""
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM msal_token_cache WHERE user_name = %s", (user_name,))
+        conn.commit()
+        cur.close()
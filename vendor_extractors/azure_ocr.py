@@ -0,0 +1,313 @@
+# vendor_extractors/azure_ocr.py
+"""
+Shared Azure Form Recognizer (prebuilt-layout) client.
+
+Every vendor extractor used to carry its own copy of the analyze/poll loop,
+each opening a fresh connection per request and sleeping a hard-coded
+1.0-1.5s between polls. This module owns the single implementation:
+
+- One pooled keep-alive ``requests.Session`` per process, so the submit and
+  every poll reuse the same TLS connection.
+- Polling honours Azure's ``Retry-After`` header and a wall-clock deadline
+  instead of a fixed number of fixed sleeps.
+- ``analyze_pdf`` returns an ``OcrResult`` carrying pages, lines, polygons and
+  page numbers. Vendors build whatever view they need (flat lines, per-page
+  lines, joined text) from that one object.
+- ``analyze_many`` OCRs a whole batch concurrently from a bounded thread pool
+  (``AZURE_OCR_MAX_CONCURRENCY``), so a batch of scanned files costs roughly
+  the slowest document rather than the sum of all of them.
+- ``pages=[...]`` restricts analysis to selected 1-based pages of the original
+  upload (Azure's ``pages`` query parameter). Returned pages keep their
+  original page numbers, so page-level OCR needs no single-page PDF rebuilds.
+- Results are cached on disk by the SHA-256 of the submitted bytes (see
+  ``ocr_cache``); a cached result has ``from_cache=True`` and its ``method``
+  is ``ocr_cache.OCR_CACHE_METHOD`` so ``processing_log`` can tell hits from paid calls.
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from . import ocr_cache
+from .ocr_cache import OCR_CACHE_METHOD
+
+load_dotenv()
+AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT")
+AZURE_KEY      = os.getenv("AZURE_KEY")
+
+ANALYZE_PATH = "formrecognizer/documentModels/prebuilt-layout:analyze?api-version=2023-07-31"
+
+# extraction_info['method'] label written to processing_log (cache hits use OCR_CACHE_METHOD)
+AZURE_OCR_METHOD = "Azure OCR"
+
+# Polling / timeout knobs (seconds)
+POLL_INTERVAL   = float(os.getenv("AZURE_OCR_POLL_INTERVAL", "1.0"))
+ANALYZE_TIMEOUT = float(os.getenv("AZURE_OCR_TIMEOUT", "60"))
+SUBMIT_TIMEOUT  = 60
+POLL_TIMEOUT    = 15
+POOL_SIZE       = int(os.getenv("AZURE_OCR_POOL_SIZE", "16"))
+# In-flight analyze operations per batch; keep within the Azure resource's TPS quota
+MAX_CONCURRENCY = max(1, int(os.getenv("AZURE_OCR_MAX_CONCURRENCY", "4")))
+
+logger = logging.getLogger("invoice-ocr")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# RESULT OBJECTS
+# ─────────────────────────────────────────────────────────────────────────────
+
+@dataclass
+class OcrLine:
+    content: str
+    polygon: List[float] = field(default_factory=list)
+
+
+@dataclass
+class OcrPage:
+    page_number: int                      # 1-based page number in the submitted PDF
+    width: Optional[float] = None
+    height: Optional[float] = None
+    unit: Optional[str] = None
+    lines: List[OcrLine] = field(default_factory=list)
+
+    def text_lines(self) -> List[str]:
+        """Stripped, non-empty line contents in reading order."""
+        return [ln.content.strip() for ln in self.lines if ln.content and ln.content.strip()]
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.text_lines())
+
+
+@dataclass
+class OcrResult:
+    pages: List[OcrPage] = field(default_factory=list)
+    from_cache: bool = False
+
+    @property
+    def method(self) -> str:
+        return OCR_CACHE_METHOD if self.from_cache else AZURE_OCR_METHOD
+
+    @property
+    def page_count(self) -> int:
+        return len(self.pages)
+
+    def page_lines(self) -> List[List[str]]:
+        """One list of stripped lines per page."""
+        return [page.text_lines() for page in self.pages]
+
+    def lines(self) -> List[str]:
+        """All stripped lines across all pages, flattened."""
+        return [ln for page in self.pages for ln in page.text_lines()]
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines())
+
+    def page(self, page_number: int) -> Optional[OcrPage]:
+        """Look up a page by its 1-based number in the submitted PDF."""
+        for page in self.pages:
+            if page.page_number == page_number:
+                return page
+        return None
+
+    @classmethod
+    def from_analyze_result(cls, analyze_result: dict) -> "OcrResult":
+        pages = []
+        for idx, page in enumerate(analyze_result.get("pages", []), 1):
+            lines = [
+                OcrLine(content=ln.get("content", ""), polygon=ln.get("polygon") or [])
+                for ln in page.get("lines", [])
+            ]
+            pages.append(OcrPage(
+                page_number=page.get("pageNumber", idx),
+                width=page.get("width"),
+                height=page.get("height"),
+                unit=page.get("unit"),
+                lines=lines,
+            ))
+        return cls(pages=pages)
+
+    def to_analyze_result(self) -> dict:
+        """The subset of Azure's analyzeResult schema that ``from_analyze_result`` reads."""
+        return {
+            "pages": [
+                {
+                    "pageNumber": page.page_number,
+                    "width": page.width,
+                    "height": page.height,
+                    "unit": page.unit,
+                    "lines": [{"content": ln.content, "polygon": ln.polygon} for ln in page.lines],
+                }
+                for page in self.pages
+            ]
+        }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# HTTP SESSION
+# ─────────────────────────────────────────────────────────────────────────────
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Process-wide keep-alive session with a connection pool sized for concurrent polls."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                s.headers.update({"Ocp-Apim-Subscription-Key": AZURE_KEY or ""})
+                _session = s
+    return _session
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ANALYZE
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _retry_after(resp: requests.Response) -> float:
+    try:
+        return max(float(resp.headers.get("Retry-After", POLL_INTERVAL)), 0.25)
+    except (TypeError, ValueError):
+        return POLL_INTERVAL
+
+
+def format_pages(pages: Sequence[int]) -> str:
+    """1-based page numbers -> Azure ``pages`` syntax, e.g. [1, 2, 3, 7] -> "1-3,7"."""
+    nums = sorted(set(int(p) for p in pages))
+    ranges = []
+    for n in nums:
+        if ranges and n == ranges[-1][1] + 1:
+            ranges[-1][1] = n
+        else:
+            ranges.append([n, n])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def _analyze_url(pages: Optional[Sequence[int]] = None) -> str:
+    url = f"{AZURE_ENDPOINT}{ANALYZE_PATH}"
+    if pages:
+        url += f"&pages={format_pages(pages)}"
+    return url
+
+
+def _cache_variant(pages: Optional[Sequence[int]] = None) -> str:
+    return ANALYZE_PATH + (f"&pages={format_pages(pages)}" if pages else "")
+
+
+def submit_analyze(pdf_bytes: bytes, pages: Optional[Sequence[int]] = None) -> str:
+    """POST the PDF to the layout model and return the Operation-Location URL."""
+    if not AZURE_ENDPOINT or not AZURE_KEY:
+        raise ValueError("Azure OCR credentials (AZURE_ENDPOINT / AZURE_KEY) are not set.")
+
+    resp = get_session().post(
+        _analyze_url(pages),
+        headers={"Content-Type": "application/pdf"},
+        data=pdf_bytes,
+        timeout=SUBMIT_TIMEOUT,
+    )
+    if resp.status_code != 202:
+        raise RuntimeError(f"Azure OCR request failed: {resp.text}")
+
+    op_url = resp.headers.get("Operation-Location")
+    if not op_url:
+        raise RuntimeError("Azure OCR missing Operation-Location header")
+    return op_url
+
+
+def poll_analyze(op_url: str, timeout: float = ANALYZE_TIMEOUT) -> OcrResult:
+    """Poll an analyze operation until it succeeds, fails or the deadline passes."""
+    session = get_session()
+    deadline = time.monotonic() + timeout
+    delay = POLL_INTERVAL
+    while time.monotonic() < deadline:
+        time.sleep(delay)
+        resp = session.get(op_url, timeout=POLL_TIMEOUT)
+        result = resp.json()
+        status = result.get("status")
+        if status == "succeeded":
+            return OcrResult.from_analyze_result(result.get("analyzeResult", {}))
+        if status == "failed":
+            raise RuntimeError("Azure OCR analysis failed.")
+        delay = _retry_after(resp)
+    raise TimeoutError("Azure OCR timed out.")
+
+
+def analyze_pdf(pdf_bytes: bytes, pages: Optional[Sequence[int]] = None) -> OcrResult:
+    """
+    Run prebuilt-layout OCR on in-memory PDF bytes, serving repeats from the OCR cache.
+    ``pages`` (1-based) limits analysis to those pages; results keep original page numbers.
+    """
+    key = ocr_cache.cache_key(pdf_bytes, _cache_variant(pages))
+    cached = ocr_cache.get(key)
+    if cached is not None:
+        result = OcrResult.from_analyze_result(cached)
+        result.from_cache = True
+        logger.info(f"[OCR CACHE] Hit {key[:12]} ({result.page_count} pages)")
+        return result
+
+    start = time.perf_counter()
+    result = poll_analyze(submit_analyze(pdf_bytes, pages))
+    logger.info(f"[TIMING] Azure OCR ({result.page_count} pages) took {time.perf_counter() - start:.2f}s")
+    ocr_cache.put(key, result.to_analyze_result())
+    return result
+
+
+Payload = Union[bytes, Tuple[bytes, Optional[Sequence[int]]]]
+
+
+def analyze_many(payloads: List[Payload], max_workers: Optional[int] = None) -> List[Union[OcrResult, Exception]]:
+    """
+    OCR several PDFs concurrently. Every request is submitted as soon as a worker
+    is free and all operations are polled in parallel, up to ``max_workers``
+    (default ``AZURE_OCR_MAX_CONCURRENCY``) in flight at once.
+
+    A payload is either raw PDF bytes or ``(pdf_bytes, pages)`` to OCR only the
+    given 1-based pages of that file.
+
+    Returns one entry per payload, in input order: an ``OcrResult`` or the
+    exception raised for that payload, so one bad page never sinks the batch.
+    Identical payloads are only sent once.
+    """
+    if not payloads:
+        return []
+
+    unique: Dict[str, Tuple[bytes, Optional[Sequence[int]]]] = {}
+    keys = []
+    for payload in payloads:
+        pdf_bytes, pages = payload if isinstance(payload, tuple) else (payload, None)
+        key = ocr_cache.cache_key(pdf_bytes, _cache_variant(pages))
+        keys.append(key)
+        unique.setdefault(key, (pdf_bytes, pages))
+
+    def _run(job: Tuple[bytes, Optional[Sequence[int]]]) -> Union[OcrResult, Exception]:
+        try:
+            return analyze_pdf(*job)
+        except Exception as e:
+            logger.warning(f"[OCR] Batch item failed: {e}")
+            return e
+
+    workers = min(max_workers or MAX_CONCURRENCY, len(unique))
+    start = time.perf_counter()
+    if workers <= 1:
+        done = {key: _run(job) for key, job in unique.items()}
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="azure-ocr") as pool:
+            futures = {key: pool.submit(_run, job) for key, job in unique.items()}
+            done = {key: fut.result() for key, fut in futures.items()}
+    logger.info(f"[TIMING] Azure OCR batch ({len(unique)} docs, {workers} workers) took {time.perf_counter() - start:.2f}s")
+    return [done[key] for key in keys]
@@ -0,0 +1,145 @@
+# vendor_extractors/document_store.py
+"""
+Request-scoped memo of extracted document text.
+
+Vendor extractors make several passes over the same upload batch (analysis
+reports, packing lists, then invoices). Each pass used to re-open every PDF
+and, for scanned files, re-send it to Azure OCR. A ``DocumentStore`` extracts
+each file exactly once - PyMuPDF first, with files lacking a usable text
+layer (see ``page_quality``) OCR'd together in one concurrent batch - and
+every pass reads from it.
+
+Extractors with their own OCR triggers (e.g. HM Clause's per-pass checks) can
+build the store with ``needs_ocr=None`` and call ``ocr_result()`` /
+``prefetch_ocr()`` instead; the OCR result is still fetched at most once per
+file and shared by every pass.
+
+Every page is also given a role (invoice, analysis report, packing list...,
+see ``page_roles``) from whatever text is available, so role-specific passes
+can skip documents they have no business reading.
+"""
+
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import fitz  # PyMuPDF
+
+from .azure_ocr import analyze_pdf, analyze_many, OcrResult
+from .page_quality import PageQuality, score_document, no_usable_text
+from .page_roles import DEFAULT_RULES, PageRole, RoleRule, classify_lines, document_roles
+
+
+def _split_lines(text: str) -> List[str]:
+    return [ln.strip() for ln in text.splitlines() if ln.strip()]
+
+
+def _classify(pages: List[List[str]], rules: Sequence[RoleRule]) -> List[PageRole]:
+    return [classify_lines(lines, rules) for lines in pages]
+
+
+@dataclass
+class ExtractedDocument:
+    filename: str
+    pdf_bytes: bytes
+    pages: List[List[str]] = field(default_factory=list)  # stripped, non-empty lines per page
+    page_texts: List[str] = field(default_factory=list)   # raw PyMuPDF get_text() per page
+    qualities: List[PageQuality] = field(default_factory=list)
+    roles: List[PageRole] = field(default_factory=list)     # one per entry in ``pages``
+    method: str = "PyMuPDF"
+    page_count: int = 0
+    ocr: Optional[OcrResult] = None
+
+    def ocr_result(self) -> OcrResult:
+        """OCR this document on first use; later calls (from any pass) reuse the result."""
+        if self.ocr is None:
+            self.ocr = analyze_pdf(self.pdf_bytes)
+        return self.ocr
+
+    @property
+    def info(self) -> Dict:
+        """The extraction_info dict expected by log_processing_event."""
+        return {"method": self.method, "page_count": self.page_count}
+
+    @property
+    def role_set(self) -> Set[str]:
+        return document_roles(self.roles)
+
+    def classify_ocr(self, rules: Sequence[RoleRule] = DEFAULT_RULES) -> List[PageRole]:
+        """Re-classify pages from the OCR result (scanned pages have no text-layer role)."""
+        self.roles = _classify(self.ocr_result().page_lines(), rules)
+        return self.roles
+
+    @property
+    def lines(self) -> List[str]:
+        return [ln for page in self.pages for ln in page]
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+
+class DocumentStore:
+    """
+    Extracts every (filename, bytes) pair once, in upload order.
+    OCR failures propagate, matching the extractors' previous behaviour.
+    """
+
+    def __init__(self, pdf_files: List[Tuple[str, bytes]],
+                 needs_ocr: Optional[Callable[[List[PageQuality]], bool]] = no_usable_text,
+                 role_rules: Sequence[RoleRule] = DEFAULT_RULES):
+        self._docs: List[ExtractedDocument] = []
+        self._by_name: Dict[str, ExtractedDocument] = {}
+
+        scanned: List[ExtractedDocument] = []
+        for filename, pdf_bytes in pdf_files:
+            doc = ExtractedDocument(filename=filename, pdf_bytes=pdf_bytes)
+            page_texts: List[str] = []
+            try:
+                with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf:
+                    doc.page_count = pdf.page_count
+                    page_texts = [page.get_text() for page in pdf]
+                    doc.qualities = score_document(pdf, texts=page_texts)
+            except Exception as e:
+                print(f"DEBUG [{filename}]: PyMuPDF exception: {e}")
+                if needs_ocr is not None:
+                    scanned.append(doc)
+            else:
+                doc.page_texts = page_texts
+                doc.pages = [_split_lines(t) for t in page_texts]
+                doc.roles = _classify(doc.pages, role_rules)
+                if needs_ocr is not None and needs_ocr(doc.qualities):
+                    scanned.append(doc)
+            self._docs.append(doc)
+            self._by_name.setdefault(filename, doc)
+
+        if scanned:
+            print(f"DEBUG: Sending {len(scanned)} file(s) to Azure OCR concurrently...")
+            for doc, result in zip(scanned, analyze_many([d.pdf_bytes for d in scanned])):
+                if isinstance(result, Exception):
+                    raise result
+                doc.ocr = result
+                doc.method = result.method
+                doc.pages = result.page_lines()
+                doc.page_count = result.page_count
+                doc.roles = _classify(doc.pages, role_rules)
+
+    def prefetch_ocr(self, docs: List[ExtractedDocument]) -> None:
+        """
+        OCR the given documents concurrently so later ``ocr_result()`` calls are
+        free. Failures are left unset; ``ocr_result()`` retries and raises them.
+        """
+        pending = [d for d in docs if d.ocr is None]
+        if not pending:
+            return
+        for doc, result in zip(pending, analyze_many([d.pdf_bytes for d in pending])):
+            if not isinstance(result, Exception):
+                doc.ocr = result
+
+    def __iter__(self) -> Iterator[ExtractedDocument]:
+        return iter(self._docs)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __getitem__(self, filename: str) -> ExtractedDocument:
+        return self._by_name[filename]
@@ -3,57 +3,44 @@ import json
 import fitz  # PyMuPDF
 import re
 from typing import List, Dict, Tuple
-import requests
 from difflib import get_close_matches
-import time
 from collections import defaultdict
 import datetime
-from db_logger import log_processing_event
+from events import log_processing_event
+from .azure_ocr import analyze_pdf, OcrResult
+from .document_store import DocumentStore, ExtractedDocument
+from .page_quality import score_page, no_usable_text
+from .page_roles import DEFAULT_RULES, RoleRule, INVOICE, ANALYSIS_REPORT
+from .parallel import parallel_map
+from .registry import VendorSpec
 
 item_usage_counter = defaultdict(int)
 
-AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT")
-AZURE_KEY = os.getenv("AZURE_KEY")
+# Purity/germ reports are uploaded named after their lot (e.g. "A12345.pdf").
+REPORT_FILENAME_RE = re.compile(r"^[A-Z]\d{5}", re.IGNORECASE)
+
+# The generic rules, plus HM Clause's loose report check: a bare "REPORT" or
+# "ANALYSIS" makes a page a report only if nothing more specific matched.
+HM_CLAUSE_ROLE_RULES = DEFAULT_RULES + (
+    RoleRule(ANALYSIS_REPORT, ANALYSIS_REPORT, any_of=("REPORT", "ANALYSIS")),
+)
 
 def extract_text_with_azure_ocr(pdf_bytes: bytes) -> List[str]:
     """
     Performs OCR on in-memory PDF bytes using Azure Form Recognizer.
     """
-    headers = {
-        "Ocp-Apim-Subscription-Key": AZURE_KEY,
-        "Content-Type": "application/pdf"
-    }
-    response = requests.post(
-        f"{AZURE_ENDPOINT}formrecognizer/documentModels/prebuilt-layout:analyze?api-version=2023-07-31",
-        headers=headers,
-        data=pdf_bytes
-    )
-
-    if response.status_code != 202:
-        raise RuntimeError(f"OCR request failed: {response.text}")
-
-    result_url = response.headers["Operation-Location"]
-
-    for _ in range(30):
-        time.sleep(1.5)
-        result = requests.get(result_url, headers={"Ocp-Apim-Subscription-Key": AZURE_KEY}).json()
-        if result.get("status") == "succeeded":
-            lines = []
-            for page in result.get("analyzeResult", {}).get("pages", []):
-                page_text = " ".join(line.get("content", "").strip() for line in page.get("lines", []) if line.get("content"))
-                if page_text.lower().startswith("limitation of warranty and liability") or \
-                   "limitation of warranty and liability" in page_text.lower():
-                    continue
-                for line in page.get("lines", []):
-                    content = line.get("content", "").strip()
-                    if content:
-                        lines.append(content)
-                lines.append("--- PAGE BREAK ---")
-            return lines
-
-        elif result.get("status") == "failed":
-            raise RuntimeError("OCR analysis failed")
-    raise TimeoutError("OCR timed out")
+    return _ocr_result_to_lines(analyze_pdf(pdf_bytes))
+
+def _ocr_result_to_lines(result: OcrResult) -> List[str]:
+    """Flatten OCR pages, dropping warranty boilerplate and ending each page with a PAGE BREAK marker."""
+    lines = []
+    for page in result.pages:
+        page_text = " ".join(page.text_lines()).lower()
+        if "limitation of warranty and liability" in page_text:
+            continue
+        lines.extend(page.text_lines())
+        lines.append("--- PAGE BREAK ---")
+    return lines
 
 def extract_items_from_ocr_lines(lines: List[str]) -> List[Dict]:
     line_items = []
@@ -304,24 +291,33 @@ def _choose_batch_key(report_text_upper: str, filename: str) -> str | None:
         return codes[-1].upper()
     return None
 
-def extract_purity_analysis_reports_from_bytes(pdf_files: list[tuple[str, bytes]]) -> Dict[str, Dict]:
+def extract_purity_analysis_reports_from_bytes(pdf_files: list[tuple[str, bytes]], store: DocumentStore = None) -> Dict[str, Dict]:
     purity_data = defaultdict(dict)
-    for filename, pdf_bytes in pdf_files:
+    if store is None:
+        store = DocumentStore(pdf_files, needs_ocr=None, role_rules=HM_CLAUSE_ROLE_RULES)
+
+    # Searchable files were classified from their text layer; only reports are
+    # read here. Scanned files have no role yet, so they are OCR'd (shared with
+    # the invoice pass) and classified from the OCR text.
+    scanned = [doc for doc in store if no_usable_text(doc.qualities)]
+    store.prefetch_ocr(scanned)
+
+    for doc in store:
+        filename = doc.filename
+        named_as_report = bool(REPORT_FILENAME_RE.match(os.path.basename(filename)))
         try:
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            text = ""
-            for page in doc:
-                text += page.get_text() + " " 
-            doc.close()
-
-            is_valid_report_text = "REPORT" in text.upper() or "ANALYSIS" in text.upper()
-            if not text.strip() or not is_valid_report_text:
+            text = "".join(t + " " for t in doc.page_texts)
+            if no_usable_text(doc.qualities):
                 try:
-                    ocr_lines = extract_text_with_azure_ocr(pdf_bytes)
+                    ocr_lines = _ocr_result_to_lines(doc.ocr_result())
                     text = " ".join(ocr_lines)
                 except Exception as e:
                     print(f"OCR failed for {filename}: {e}")
                     continue
+                doc.classify_ocr(HM_CLAUSE_ROLE_RULES)
+
+            if ANALYSIS_REPORT not in doc.role_set and not named_as_report:
+                continue
 
             if "REPORT" not in text.upper() and "ANALYSIS" not in text.upper():
                 continue
@@ -669,7 +665,7 @@ def extract_discounts(blocks: List) -> List[Tuple[str, float]]:
 
 #     return line_items, extraction_info
 
-def extract_hm_clause_invoice_data_from_bytes(pdf_bytes: bytes) -> Tuple[List[Dict], Dict]:
+def extract_hm_clause_invoice_data_from_bytes(pdf_bytes: bytes, document: ExtractedDocument = None) -> Tuple[List[Dict], Dict]:
     # ... [Keep initial setup, fitz open, blocks extraction, OCR fallback logic] ...
     item_usage_counter.clear()
     
@@ -689,20 +685,21 @@ def extract_hm_clause_invoice_data_from_bytes(pdf_bytes: bytes) -> Tuple[List[Di
     ocr_triggered = False
 
     for page in doc:
-        if "limitation of warranty and liability" in page.get_text("text").lower():
+        page_text = page.get_text("text")
+        if "limitation of warranty and liability" in page_text.lower():
             continue
             
         blocks = page.get_text("blocks")
         
-        # Calculate the total length of meaningful text on the page
-        total_char_count = sum(len(b[4].strip()) for b in blocks) if blocks else 0
-        
-        # Trigger OCR if the page is completely empty OR has less than 100 characters
-        if total_char_count < 100:
+        # Trigger OCR if the page has no usable text layer (scan, garbled glyphs, outlined text)
+        quality = score_page(page, text=page_text)
+        if quality.needs_ocr:
+            print(f"OCR needed for page {page.number + 1}: {quality.reason}")
             ocr_triggered = True
             doc.close()
-            ocr_lines = extract_text_with_azure_ocr(pdf_bytes)
-            extraction_info['method'] = 'Azure OCR'
+            ocr_result = document.ocr_result() if document else analyze_pdf(pdf_bytes)
+            ocr_lines = _ocr_result_to_lines(ocr_result)
+            extraction_info['method'] = ocr_result.method
             return extract_items_from_ocr_lines(ocr_lines), extraction_info
             
     # for page in doc:
@@ -1154,16 +1151,30 @@ def extract_hm_clause_data_from_bytes(pdf_files: list[tuple[str, bytes]]) -> dic
     if not pdf_files:
         return {}
 
-    purity_data = extract_purity_analysis_reports_from_bytes(pdf_files)
+    # Shared by both passes so a file is OCR'd and classified at most once per batch
+    store = DocumentStore(pdf_files, needs_ocr=None, role_rules=HM_CLAUSE_ROLE_RULES)
+    purity_data = extract_purity_analysis_reports_from_bytes(pdf_files, store)
 
+    invoices = []
+    for document in store:
+        filename = document.filename
+        if REPORT_FILENAME_RE.match(os.path.basename(filename)):
+            continue
+        roles = document.role_set
+        if ANALYSIS_REPORT in roles and INVOICE not in roles:
+            print(f"DEBUG [{filename}]: classified as analysis report, skipping invoice pass")
+            continue
+        invoices.append(document)
+
+    # Invoices are parsed across the process pool; logging stays in this process
     grouped_results = {}
-    for filename, pdf_bytes in pdf_files:
-        if re.match(r"^[A-Z]\d{5}", os.path.basename(filename), re.IGNORECASE):
+    results = parallel_map(_hm_clause_invoice_job, invoices, shared={"purity_data": purity_data})
+    for filename, items, info, error in results:
+        if error:
+            print(f"Error processing invoice {filename}: {error}")
             continue
 
         try:
-            items, info = extract_hm_clause_invoice_data_from_bytes(pdf_bytes)
-            
             # --- LOGGING ---
             po_number = items[0].get("PurchaseOrder") if items else None
             log_processing_event(
@@ -1172,16 +1183,24 @@ def extract_hm_clause_data_from_bytes(pdf_files: list[tuple[str, bytes]]) -> dic
                 extraction_info=info,
                 po_number=po_number
             )
-            
-            if items:
-                enriched_items = enrich_invoice_items_with_purity(items, purity_data)
-                grouped_results[filename] = enriched_items
         except Exception as e:
             print(f"Error processing invoice {filename}: {e}")
             continue
 
+        if items:
+            grouped_results[filename] = items
+
     return grouped_results
 
+def _hm_clause_invoice_job(document: ExtractedDocument, shared: Dict) -> Tuple[str, List[Dict], Dict, str | None]:
+    """parallel_map job: parse one invoice and attach purity data from the shared report map."""
+    try:
+        items, info = extract_hm_clause_invoice_data_from_bytes(document.pdf_bytes, document)
+        items = enrich_invoice_items_with_purity(items, shared.get("purity_data", {}))
+        return document.filename, items, info, None
+    except Exception as e:
+        return document.filename, [], {}, str(e)
+
 def find_best_hm_clause_package_description(vendor_desc: str, pkg_desc_list: list[str]) -> str:
     if not vendor_desc or not pkg_desc_list:
         return ""
@@ -1205,4 +1224,13 @@ def find_best_hm_clause_package_description(vendor_desc: str, pkg_desc_list: lis
             return candidate
 
     matches = get_close_matches(normalized_desc, pkg_desc_list, n=1, cutoff=0.6)
-    return matches[0] if matches else ""
\ No newline at end of file
+    return matches[0] if matches else ""
+
+
+VENDOR = VendorSpec(
+    name="hm_clause",
+    template="results_hm_clause.html",
+    extract=lambda pdf_files, pkg_descs, token: extract_hm_clause_data_from_bytes(pdf_files),
+    package_description=find_best_hm_clause_package_description,
+    extract_uses_pkg_descs=False,
+)
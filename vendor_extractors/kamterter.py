@@ -1,6 +1,7 @@
 import fitz  # PyMuPDF
 import re
-from db_logger import log_processing_event
+from events import log_processing_event
+from .registry import VendorSpec
 
 
 def parse_currency(value_str):
@@ -223,4 +224,13 @@ def extract_kamterter_data_from_bytes(pdf_files: list[tuple[str, bytes]]) -> dic
 
             grouped_results[filename] = resource_lines
 
-    return grouped_results
\ No newline at end of file
+    return grouped_results
+
+
+VENDOR = VendorSpec(
+    name="kamterter",
+    template="results_kamterter.html",
+    extract=lambda pdf_files, pkg_descs, token: extract_kamterter_data_from_bytes(pdf_files),
+    uses_bc=False,
+    keep_uploads=True,
+)
@@ -1,14 +1,12 @@
-import os
 import re
 from datetime import date, timedelta
 import fitz  # PyMuPDF
-import requests
 
-try:
-    from db_logger import log_processing_event
-except Exception:  # ponytail: logging optional; ignore if unavailable
-    def log_processing_event(*args, **kwargs):
-        return None
+from .azure_ocr import analyze_pdf, AZURE_OCR_METHOD, OCR_CACHE_METHOD
+from .page_quality import score_document, no_usable_text
+from .registry import VendorSpec
+
+from events import log_processing_event
 
 
 def _is_business_day(d: date) -> bool:
@@ -41,55 +39,29 @@ def add_business_days_inclusive(shipped_date: date, days: int = 5) -> date:
     return d
 
 
-# --- OCR SUPPORT (pattern reused from other vendors) ---
-AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT")
-AZURE_KEY = os.getenv("AZURE_KEY")
+def _extract_text_with_azure_ocr(pdf_content: bytes) -> str:
+    return analyze_pdf(pdf_content).text
 
 
-def _extract_text_with_azure_ocr(pdf_content: bytes) -> str:
-    if not AZURE_ENDPOINT or not AZURE_KEY:
-        raise ValueError("Azure OCR credentials (AZURE_ENDPOINT / AZURE_KEY) are not set.")
-
-    headers = {"Ocp-Apim-Subscription-Key": AZURE_KEY, "Content-Type": "application/pdf"}
-    resp = requests.post(
-        f"{AZURE_ENDPOINT}formrecognizer/documentModels/prebuilt-layout:analyze?api-version=2023-07-31",
-        headers=headers,
-        data=pdf_content,
-        timeout=30,
-    )
-    if resp.status_code != 202:
-        raise RuntimeError(f"Azure OCR request failed: {resp.text}")
-
-    op_url = resp.headers.get("Operation-Location")
-    if not op_url:
-        raise RuntimeError("Azure OCR missing Operation-Location header")
-
-    # ponytail: simple poll; fine for small docs. Upgrade to event grid if needed.
-    for _ in range(30):
-        r = requests.get(op_url, headers={"Ocp-Apim-Subscription-Key": AZURE_KEY}, timeout=15)
-        j = r.json()
-        st = j.get("status")
-        if st == "succeeded":
-            lines = [
-                ln.get("content", "").strip()
-                for pg in j.get("analyzeResult", {}).get("pages", [])
-                for ln in pg.get("lines", [])
-                if ln.get("content", "").strip()
-            ]
-            return "\n".join(lines)
-        if st == "failed":
-            raise RuntimeError("Azure OCR analysis failed")
-    raise TimeoutError("Azure OCR timed out")
+def _ocr_text_and_method(pdf_content: bytes):
+    """Return (method, text) where method is 'ocr_cache' for a cached result, else 'ocr'."""
+    result = analyze_pdf(pdf_content)
+    return ("ocr_cache" if result.from_cache else "ocr"), result.text
+
+
+def _log_method(method: str) -> str:
+    return {"ocr": AZURE_OCR_METHOD, "ocr_cache": OCR_CACHE_METHOD}.get(method, "PyMuPDF")
 
 
 def _extract_text_with_fallback(pdf_bytes: bytes):
     """Return (method, text, page_count) using PyMuPDF then OCR fallback.
 
-    method = 'text' or 'ocr'
+    method = 'text', 'ocr' or 'ocr_cache'
     """
     method = "text"
     text = ""
     page_count = 0
+    needs_ocr = False
     try:
         with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
             texts: list[str] = []
@@ -102,24 +74,27 @@ def _extract_text_with_fallback(pdf_bytes: bytes):
                     texts.append(str(page))
             text = "".join(texts)
             page_count = getattr(doc, "page_count", len(texts) if texts else 0)
+            try:
+                needs_ocr = no_usable_text(score_document(doc, texts=texts))
+            except Exception:
+                needs_ocr = len(text.strip()) < 200
     except Exception:
         # If PyMuPDF fails, try OCR directly
         try:
-            text = _extract_text_with_azure_ocr(pdf_bytes)
-            method = "ocr"
+            method, text = _ocr_text_and_method(pdf_bytes)
         except Exception:
             text = ""
             method = "text"
             page_count = 0
             return method, text, page_count
 
-    # Low-searchable-text threshold triggers OCR
-    if len(text.strip()) < 200:
+    # No usable text layer (see page_quality) triggers OCR
+    if needs_ocr:
         try:
-            ocr_text = _extract_text_with_azure_ocr(pdf_bytes)
+            ocr_method, ocr_text = _ocr_text_and_method(pdf_bytes)
             if ocr_text.strip():
                 text = ocr_text
-                method = "ocr"
+                method = ocr_method
         except Exception:
             pass
     return method, text, page_count
@@ -225,7 +200,7 @@ def extract_kamterter_shipping_data_from_bytes(pdf_files):
                         vendor="kamterter_shipping",
                         filename=filename,
                         extraction_info={
-                            "method": ("Azure OCR" if method == "ocr" else "PyMuPDF"),
+                            "method": _log_method(method),
                             "page_count": page_count,
                         },
                         po_number=po,
@@ -251,7 +226,7 @@ def extract_kamterter_shipping_data_from_bytes(pdf_files):
                     vendor="kamterter_shipping",
                     filename=filename,
                     extraction_info={
-                        "method": ("Azure OCR" if method == "ocr" else "PyMuPDF"),
+                        "method": _log_method(method),
                         "page_count": page_count,
                     },
                     po_number=None,
@@ -260,3 +235,11 @@ def extract_kamterter_shipping_data_from_bytes(pdf_files):
                 pass
 
     return results
+
+
+VENDOR = VendorSpec(
+    name="kamterter_shipping",
+    template="results_kamterter_shipping.html",
+    extract=lambda pdf_files, pkg_descs, token: extract_kamterter_shipping_data_from_bytes(pdf_files),
+    uses_bc=False,
+)
@@ -1270,19 +1270,20 @@ and always pick quality_cert (first check wins). Now we preserve the page
 structure from OCR so each page gets its own correct classification.
 """
 
-import os
 import re
-import fitz
-import requests
-import time
 import pycountry
 from datetime import datetime
 from difflib import get_close_matches
-from typing import Dict, List, Optional, Tuple
-from db_logger import log_processing_event
-
-AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT")
-AZURE_KEY      = os.getenv("AZURE_KEY")
+from typing import Dict, Iterator, List, Optional, Tuple
+from events import log_processing_event
+from .azure_ocr import analyze_pdf
+from .document_store import DocumentStore
+from .parallel import parallel_imap
+from .registry import VendorSpec
+from .page_roles import (
+    RoleRule, classify_lines,
+    INVOICE, ANALYSIS_REPORT, PACKING_LIST, GERM_LETTER,
+)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -1346,69 +1347,12 @@ def _extract_text_with_azure_ocr(pdf_content: bytes) -> List[List[str]]:
     Send PDF to Azure Form Recognizer and return PER-PAGE results.
     Returns List[List[str]] — one inner list per PDF page.
     """
-    if not AZURE_ENDPOINT or not AZURE_KEY:
-        raise ValueError("Azure OCR credentials are not set.")
-    headers = {"Ocp-Apim-Subscription-Key": AZURE_KEY, "Content-Type": "application/pdf"}
-    response = requests.post(
-        f"{AZURE_ENDPOINT}formrecognizer/documentModels/prebuilt-layout:analyze?api-version=2023-07-31",
-        headers=headers, data=pdf_content,
-    )
-    if response.status_code != 202:
-        raise RuntimeError(f"OCR request failed: {response.text}")
-    op_url = response.headers["Operation-Location"]
-    for _ in range(30):
-        time.sleep(1.5)
-        result = requests.get(op_url, headers={"Ocp-Apim-Subscription-Key": AZURE_KEY}).json()
-        if result.get("status") == "succeeded":
-            pages_out = []
-            for page in result["analyzeResult"]["pages"]:
-                page_lines = [
-                    ln.get("content", "").strip()
-                    for ln in page.get("lines", [])
-                    if ln.get("content", "").strip()
-                ]
-                pages_out.append(page_lines)
-            return pages_out
-        if result.get("status") == "failed":
-            raise RuntimeError("OCR analysis failed")
-    raise TimeoutError("OCR timed out")
+    return analyze_pdf(pdf_content).page_lines()
 
 
 def _get_pages_with_info(pdf_bytes: bytes, filename: str = "") -> Tuple[List[List[str]], Dict]:
-    info = {"method": "PyMuPDF", "page_count": 0}
-    pages: List[List[str]] = []
-    try:
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        info["page_count"] = doc.page_count
-        print(f"\nDEBUG [{filename}]: Opened with PyMuPDF. Page count: {doc.page_count}")
-        has_text = False
-        for pg_num, page in enumerate(doc):
-            txt = page.get_text()
-            lines = [l.strip() for l in txt.split("\n") if l.strip()]
-            pages.append(lines)
-            if txt.strip():
-                has_text = True
-            print(f"  Page {pg_num + 1}: {len(lines)} lines, has_text={bool(txt.strip())}, "
-                  f"first_line={repr(lines[0]) if lines else '(empty)'}")
-        doc.close()
-        if has_text:
-            print(f"DEBUG [{filename}]: PyMuPDF succeeded, returning {len(pages)} pages.")
-            return pages, info
-        else:
-            print(f"DEBUG [{filename}]: PyMuPDF found NO text — falling back to Azure OCR.")
-    except Exception as e:
-        print(f"DEBUG [{filename}]: PyMuPDF exception: {e}")
-
-    info["method"] = "Azure OCR"
-    print(f"DEBUG [{filename}]: Sending to Azure OCR...")
-    ocr_pages = _extract_text_with_azure_ocr(pdf_bytes)
-    info["page_count"] = len(ocr_pages)
-    total_lines = sum(len(p) for p in ocr_pages)
-    print(f"DEBUG [{filename}]: Azure OCR returned {len(ocr_pages)} pages, {total_lines} total lines.")
-    for pg_num, pg_lines in enumerate(ocr_pages):
-        print(f"  OCR Page {pg_num + 1}: {len(pg_lines)} lines, "
-              f"first_line={repr(pg_lines[0]) if pg_lines else '(empty)'}")
-    return ocr_pages, info
+    doc = DocumentStore([(filename, pdf_bytes)])[filename]
+    return doc.pages, doc.info
 
 
 def _read_label_value(lines: List[str], idx: int, label: str) -> Optional[str]:
@@ -1427,25 +1371,24 @@ def _read_label_value(lines: List[str], idx: int, label: str) -> Optional[str]:
 # PAGE CLASSIFIER
 # ─────────────────────────────────────────────────────────────────────────────
 
-def _classify_page(lines: List[str]) -> str:
-    text = " ".join(lines).upper()
+# First match wins; labels are the page types used by the steps below.
+NUNHEMS_ROLE_RULES = (
+    RoleRule("quality_cert",     ANALYSIS_REPORT, all_of=("QUALITY CERTIFICATE",)),
+    RoleRule("germ_letter",      GERM_LETTER,     all_of=("TEST DATE CONFIRMATION",)),
+    RoleRule("packing_list",     PACKING_LIST,    all_of=("PACKING LIST", "LOT NUMBER:")),
+    RoleRule("customs_invoice",  INVOICE,         all_of=("CONSIGNEE", "H-S CODE")),
+    RoleRule("standard_invoice", INVOICE,         all_of=("INVOICE", "NET PRICE")),
+)
+
 
-    if "QUALITY CERTIFICATE" in text:
-        return "quality_cert"
-    if "TEST DATE CONFIRMATION" in text:
-        return "germ_letter"
-    if "PACKING LIST" in text and "LOT NUMBER:" in text:
-        return "packing_list"
-    if "CONSIGNEE" in text and "H-S CODE" in text:
-        return "customs_invoice"
-    if "INVOICE" in text and "NET PRICE" in text:
-        return "standard_invoice"
-    return "other"
+def _classify_page(lines: List[str]) -> str:
+    return classify_lines(lines, NUNHEMS_ROLE_RULES).label
 
 
-def _classify_page_debug(lines: List[str], page_num: int) -> str:
+def _classify_page_debug(lines: List[str], page_num: int, result: Optional[str] = None) -> str:
     text = " ".join(lines).upper()
-    result = _classify_page(lines)
+    if result is None:
+        result = _classify_page(lines)
     checks = {
         "QUALITY CERTIFICATE": "QUALITY CERTIFICATE" in text,
         "TEST DATE CONFIRMATION": "TEST DATE CONFIRMATION" in text,
@@ -1827,22 +1770,37 @@ def extract_nunhems_data_from_bytes(
     pdf_files:     List[Tuple[str, bytes]],
     pkg_desc_list: List[str],
 ) -> Dict[str, List[Dict]]:
+    grouped_results = dict(iter_nunhems_data_from_bytes(pdf_files, pkg_desc_list))
+    print(f"\nDEBUG: === Final result: {len(grouped_results)} file(s) with data ===")
+    print(f"{'='*60}\n")
+    return grouped_results
+
+
+def iter_nunhems_data_from_bytes(
+    pdf_files:     List[Tuple[str, bytes]],
+    pkg_desc_list: List[str],
+) -> Iterator[Tuple[str, List[Dict]]]:
+    """Yields (filename, items) per customs invoice as soon as it is parsed, for streaming results."""
     if not pdf_files:
-        return {}
+        return
 
     print(f"\n{'='*60}")
     print(f"DEBUG: extract_nunhems_data_from_bytes called with {len(pdf_files)} file(s):")
 
+    # Every file is read (and OCR'd if needed) and its pages classified exactly
+    # once; steps 1-3 reuse the page labels instead of re-scanning the text.
+    store = DocumentStore(pdf_files, role_rules=NUNHEMS_ROLE_RULES)
+
     # ── Step 1: Build auxiliary lookup maps ──────────────────────────────────
     print(f"\nDEBUG: === Step 1: Building auxiliary maps ===")
     quality_map: Dict[str, Dict] = {}
     germ_map:    Dict[str, Dict] = {}
     packing_map: Dict[str, Dict] = {}
 
-    for filename, pdf_bytes in pdf_files:
-        pages, _ = _get_pages_with_info(pdf_bytes, filename)
-        for pg_num, page_lines in enumerate(pages, 1):
-            ptype = _classify_page_debug(page_lines, pg_num)
+    for doc in store:
+        pages = doc.pages
+        for pg_num, (page_lines, role) in enumerate(zip(pages, doc.roles), 1):
+            ptype = _classify_page_debug(page_lines, pg_num, role.label)
             if ptype == "quality_cert":
                 result = _parse_quality_cert_page(page_lines)
                 quality_map.update(result)
@@ -1862,9 +1820,9 @@ def extract_nunhems_data_from_bytes(
     global_invoice_no: Optional[str] = None
     global_po_no:      Optional[str] = None
 
-    for filename, pdf_bytes in pdf_files:
-        pages, _ = _get_pages_with_info(pdf_bytes, filename)
-        page_types = [_classify_page(p) for p in pages]
+    for doc in store:
+        pages = doc.pages
+        page_types = [role.label for role in doc.roles]
         if "standard_invoice" in page_types:
             flat = [l for p in pages for l in p]
             inv_no, po_no = _parse_standard_invoice_header(flat)
@@ -1875,24 +1833,28 @@ def extract_nunhems_data_from_bytes(
 
     # ── Step 3: Extract items from customs invoice pages ─────────────────────
     print(f"\nDEBUG: === Step 3: Extracting from customs invoice pages ===")
-    grouped_results: Dict[str, List[Dict]] = {}
-
-    for filename, pdf_bytes in pdf_files:
-        pages, info = _get_pages_with_info(pdf_bytes, filename)
+    customs_jobs: List[Tuple[str, List[str]]] = []
+    for doc in store:
+        filename, pages, info = doc.filename, doc.pages, doc.info
 
         customs_lines: List[str] = []
-        for pg_num, page_lines in enumerate(pages, 1):
-            ptype = _classify_page(page_lines)
-            if ptype == "customs_invoice":
+        for page_lines, role in zip(pages, doc.roles):
+            if role.label == "customs_invoice":
                 customs_lines.extend(page_lines)
 
         if not customs_lines:
             log_processing_event(vendor="Nunhems", filename=filename, extraction_info=info, po_number=global_po_no)
             continue
+        customs_jobs.append((filename, customs_lines))
 
-        items, po_number = _parse_customs_invoice_pages(
-            customs_lines, quality_map, germ_map, packing_map, pkg_desc_list
-        )
+    # Parse the customs pages of every file across the process pool; the
+    # auxiliary maps go to each worker once, not with every file.
+    shared = {
+        "quality_map": quality_map, "germ_map": germ_map,
+        "packing_map": packing_map, "pkg_descs": pkg_desc_list,
+    }
+    for filename, items, po_number in parallel_imap(_customs_invoice_job, customs_jobs, shared=shared):
+        info = store[filename].info
 
         effective_po = po_number or global_po_no
         for item in items:
@@ -1904,11 +1866,16 @@ def extract_nunhems_data_from_bytes(
         log_processing_event(vendor="Nunhems", filename=filename, extraction_info=info, po_number=effective_po)
 
         if items:
-            grouped_results[filename] = items
+            yield filename, items
 
-    print(f"\nDEBUG: === Final result: {len(grouped_results)} file(s) with data ===")
-    print(f"{'='*60}\n")
-    return grouped_results
+
+def _customs_invoice_job(job: Tuple[str, List[str]], shared: Dict) -> Tuple[str, List[Dict], Optional[str]]:
+    """parallel_map job: parse one file's customs invoice pages."""
+    filename, customs_lines = job
+    items, po_number = _parse_customs_invoice_pages(
+        customs_lines, shared["quality_map"], shared["germ_map"], shared["packing_map"], shared["pkg_descs"]
+    )
+    return filename, items, po_number
 
 
 def find_best_nunhems_package_description(vendor_desc: str, pkg_desc_list: List[str]) -> str:
@@ -2013,4 +1980,12 @@ def _process_single_nunhems_invoice(
                 "GrowerGermDate":         quality_info.get("GrowerGermDate"),
                 "PackageDescription":     package_desc,
             })
-    return items
\ No newline at end of file
+    return items
+
+
+VENDOR = VendorSpec(
+    name="nunhems",
+    template="results_nunhems.html",
+    extract=lambda pdf_files, pkg_descs, token: extract_nunhems_data_from_bytes(pdf_files, pkg_descs),
+    iter_extract=iter_nunhems_data_from_bytes,
+)
@@ -0,0 +1,125 @@
+# vendor_extractors/ocr_cache.py
+"""
+Content-addressed on-disk cache for Azure OCR results.
+
+Re-uploading the same batch (e.g. after fixing a PO in Business Central) used
+to pay for Azure OCR and its polling delay again. Results are now stored as
+JSON under ``OCR_CACHE_DIR`` keyed by the SHA-256 of the exact PDF bytes that
+were submitted - a whole upload or a single-page PDF built for page-level OCR.
+
+Eviction is size-based LRU: every hit touches the file's mtime, and after each
+write the oldest entries are removed until the directory is under
+``OCR_CACHE_MAX_MB``.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OCR_CACHE_DIR    = os.getenv("OCR_CACHE_DIR", os.path.join(BASE_DIR, "ocr_cache"))
+OCR_CACHE_MAX_MB = float(os.getenv("OCR_CACHE_MAX_MB", "500"))
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# extraction_info['method'] written to processing_log when a result is served from this cache
+OCR_CACHE_METHOD = "OCR Cache"
+
+logger = logging.getLogger("invoice-ocr")
+
+_evict_lock = threading.Lock()
+
+
+def cache_key(pdf_bytes: bytes, variant: str = "") -> str:
+    """SHA-256 of the submitted bytes, optionally salted with request options (model, pages...)."""
+    h = hashlib.sha256(pdf_bytes)
+    if variant:
+        h.update(b"\0" + variant.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _path_for(key: str) -> str:
+    return os.path.join(OCR_CACHE_DIR, key[:2], f"{key}.json")
+
+
+def get(key: str) -> Optional[dict]:
+    """Return the cached analyzeResult payload, or None on a miss."""
+    if not OCR_CACHE_ENABLED:
+        return None
+    path = _path_for(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"[OCR CACHE] Dropping unreadable entry {key[:12]}: {e}")
+        _remove(path)
+        return None
+
+    try:
+        os.utime(path, None)  # LRU: a hit makes the entry most-recently-used
+    except OSError:
+        pass
+    return payload
+
+
+def put(key: str, payload: dict) -> None:
+    """Store an analyzeResult payload, then trim the cache back under its size cap."""
+    if not OCR_CACHE_ENABLED:
+        return
+    path = _path_for(key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(tmp_path, path)  # atomic, so concurrent readers never see a partial file
+    except OSError as e:
+        logger.warning(f"[OCR CACHE] Could not write entry {key[:12]}: {e}")
+        _remove(tmp_path)
+        return
+    evict()
+
+
+def evict(max_bytes: Optional[int] = None) -> int:
+    """Delete least-recently-used entries until the cache fits. Returns the number removed."""
+    if max_bytes is None:
+        max_bytes = int(OCR_CACHE_MAX_MB * 1024 * 1024)
+
+    with _evict_lock:
+        entries = []
+        total = 0
+        for root, _dirs, files in os.walk(OCR_CACHE_DIR):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        if total <= max_bytes:
+            return 0
+
+        removed = 0
+        for _mtime, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            _remove(path)
+            total -= size
+            removed += 1
+        logger.info(f"[OCR CACHE] Evicted {removed} entries; {total / 1024 / 1024:.1f} MB remain")
+        return removed
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
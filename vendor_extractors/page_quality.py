@@ -0,0 +1,144 @@
+# vendor_extractors/page_quality.py
+"""
+Shared text-layer quality scorer that decides, page by page, whether OCR is needed.
+
+Each vendor used to carry its own trigger (fewer than 50/100/200 characters,
+or "page doesn't say INVOICE and SYNGENTA"), which sent plenty of perfectly
+searchable pages to Azure. ``score_page`` combines four signals instead:
+
+- character count of the extracted text layer,
+- glyph validity (replacement characters, private-use and control glyphs are
+  what broken font encodings produce),
+- image coverage of the page from ``get_text("dict")`` image blocks, falling
+  back to ``page.get_images`` when images live in XObjects,
+- optional keyword hits that prove the text layer is the real content.
+
+A page needs OCR when its text is garbled, or when it has little text and is
+mostly covered by an image (a scan, possibly with a thin stamped text layer)
+or by vector paths (text converted to outlines). Pages with little text and
+nothing drawn on them are treated as blank and skipped.
+"""
+
+import os
+import unicodedata
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence
+
+import fitz  # PyMuPDF
+
+MIN_CHARS          = int(os.getenv("OCR_MIN_PAGE_CHARS", "50"))   # below this a page has no usable text layer
+SPARSE_CHARS       = int(os.getenv("OCR_SPARSE_PAGE_CHARS", "400"))  # below this an image-heavy page is a scan
+MIN_VALID_RATIO    = 0.85   # share of non-space glyphs that must be legible
+MIN_IMAGE_COVERAGE = 0.35   # share of the page area covered by images to call it scanned
+MIN_VECTOR_PATHS   = 20     # drawings on a text-less page that suggest outlined text
+
+
+@dataclass
+class PageQuality:
+    char_count: int
+    valid_ratio: float
+    image_coverage: float
+    keyword_hit: bool
+    needs_ocr: bool
+    reason: str
+
+    @property
+    def usable_text(self) -> bool:
+        """The text layer can be used as-is (not blank, not garbled, not a scan)."""
+        return not self.needs_ocr and self.char_count >= MIN_CHARS
+
+
+def _glyph_valid_ratio(text: str) -> float:
+    glyphs = [ch for ch in text if not ch.isspace()]
+    if not glyphs:
+        return 1.0
+    bad = 0
+    for ch in glyphs:
+        if ch == "\ufffd":
+            bad += 1
+            continue
+        cat = unicodedata.category(ch)
+        if cat in ("Co", "Cn", "Cc", "Cs"):  # private use, unassigned, control, surrogate
+            bad += 1
+    return 1.0 - bad / len(glyphs)
+
+
+def _image_coverage(page: fitz.Page) -> float:
+    page_area = abs(page.rect) or 1.0
+    covered = 0.0
+    try:
+        for block in page.get_text("dict").get("blocks", []):
+            if block.get("type") == 1:
+                covered += abs(fitz.Rect(block["bbox"]) & page.rect)
+    except Exception:
+        pass
+    if covered == 0.0 and page.get_images(full=False):
+        # Images referenced from form XObjects do not show up as dict blocks.
+        # Assume a page-sized image if that's the only thing on the page.
+        return 1.0
+    return min(covered / page_area, 1.0)
+
+
+def _has_vector_content(page: fitz.Page) -> bool:
+    try:
+        return len(page.get_drawings()) >= MIN_VECTOR_PATHS
+    except Exception:
+        return False
+
+
+def score_page(page: fitz.Page, keywords: Sequence[str] = (), text: Optional[str] = None) -> PageQuality:
+    """Score one page's text layer. Pass ``text`` if ``page.get_text()`` was already called."""
+    if text is None:
+        text = page.get_text()
+    stripped = text.strip()
+    char_count = len(stripped)
+    valid_ratio = _glyph_valid_ratio(stripped)
+    upper = stripped.upper()
+    keyword_hit = any(kw.upper() in upper for kw in keywords)
+
+    # Plenty of legible text needs no further checks (and no costly dict extraction).
+    image_coverage = 0.0
+    if char_count < SPARSE_CHARS or valid_ratio < MIN_VALID_RATIO:
+        image_coverage = _image_coverage(page)
+
+    if char_count and valid_ratio < MIN_VALID_RATIO:
+        needs_ocr, reason = True, f"garbled text layer ({valid_ratio:.0%} legible)"
+    elif keyword_hit and char_count >= MIN_CHARS:
+        needs_ocr, reason = False, "keywords found in text layer"
+    elif char_count < MIN_CHARS:
+        if image_coverage >= MIN_IMAGE_COVERAGE:
+            needs_ocr, reason = True, f"no text layer ({char_count} chars), {image_coverage:.0%} image"
+        elif _has_vector_content(page):
+            needs_ocr, reason = True, f"no text layer ({char_count} chars), vector-drawn content"
+        else:
+            needs_ocr, reason = False, "blank page"
+    elif char_count < SPARSE_CHARS and image_coverage >= MIN_IMAGE_COVERAGE:
+        needs_ocr, reason = True, f"sparse text ({char_count} chars) over {image_coverage:.0%} image"
+    else:
+        needs_ocr, reason = False, "usable text layer"
+
+    return PageQuality(char_count, valid_ratio, image_coverage, keyword_hit, needs_ocr, reason)
+
+
+def score_document(doc: fitz.Document, keywords: Sequence[str] = (),
+                   texts: Optional[Sequence[str]] = None) -> List[PageQuality]:
+    return [
+        score_page(page, keywords, texts[i] if texts is not None else None)
+        for i, page in enumerate(doc)
+    ]
+
+
+# ── Document-level policies ──────────────────────────────────────────────────
+
+def no_usable_text(qualities: Iterable[PageQuality]) -> bool:
+    """OCR the whole file only when no page has a usable text layer."""
+    return not any(q.usable_text for q in qualities)
+
+
+def any_page_needs_ocr(qualities: Iterable[PageQuality]) -> bool:
+    return any(q.needs_ocr for q in qualities)
+
+
+def pages_needing_ocr(qualities: Sequence[PageQuality]) -> List[int]:
+    """1-based page numbers to send to Azure (``analyze_pdf(..., pages=...)``)."""
+    return [i + 1 for i, q in enumerate(qualities) if q.needs_ocr]
@@ -0,0 +1,85 @@
+# vendor_extractors/page_roles.py
+"""
+Cheap keyword pre-classification of every page into a document role.
+
+Vendor packets mix invoices, analysis/purity reports, packing lists, germ
+test letters and terms-and-conditions pages. Role-specific passes (purity,
+seed analysis, packing, invoice) used to scan - and sometimes OCR - every
+file in the batch. Classifying pages up front from the text we already have
+lets each pass skip the documents it doesn't need.
+
+Rules are ordered; the first match wins. Each rule carries a vendor-specific
+``label`` (e.g. Nunhems' "customs_invoice") and the coarse ``role`` it belongs
+to. Pages with no text layer classify as UNKNOWN until they are OCR'd.
+"""
+
+from dataclasses import dataclass
+from typing import Iterable, List, Sequence, Set, Tuple
+
+INVOICE         = "invoice"
+ANALYSIS_REPORT = "analysis_report"
+PACKING_LIST    = "packing_list"
+GERM_LETTER     = "germ_letter"
+BOILERPLATE     = "boilerplate"
+UNKNOWN         = "unknown"
+
+
+@dataclass(frozen=True)
+class RoleRule:
+    label: str
+    role: str
+    all_of: Tuple[str, ...] = ()
+    any_of: Tuple[str, ...] = ()
+
+    def matches(self, upper_text: str) -> bool:
+        if not all(kw in upper_text for kw in self.all_of):
+            return False
+        return not self.any_of or any(kw in upper_text for kw in self.any_of)
+
+
+@dataclass(frozen=True)
+class PageRole:
+    label: str
+    role: str
+
+
+# Generic rules shared by vendors without their own table. Order matters:
+# reports and packing lists often quote an invoice number, so they go first;
+# invoices often carry their terms of sale, so boilerplate goes last.
+DEFAULT_RULES: Tuple[RoleRule, ...] = (
+    RoleRule(GERM_LETTER, GERM_LETTER, any_of=("TEST DATE CONFIRMATION",)),
+    RoleRule(ANALYSIS_REPORT, ANALYSIS_REPORT, any_of=(
+        "REPORT OF SEED ANALYSIS", "REPORT OF ANALYSIS", "PURITY ANALYSIS", "QUALITY CERTIFICATE",
+        "CERTIFICATE OF ANALYSIS", "SEED ANALYSIS",
+    )),
+    RoleRule(PACKING_LIST, PACKING_LIST, any_of=("PACKING LIST", "PACKING SLIP")),
+    RoleRule(INVOICE, INVOICE, any_of=("INVOICE",)),
+    RoleRule(BOILERPLATE, BOILERPLATE, any_of=(
+        "LIMITATION OF WARRANTY AND LIABILITY", "NOTICE TO PURCHASER", "TERMS AND CONDITIONS OF SALE",
+    )),
+)
+
+UNKNOWN_ROLE = PageRole("other", UNKNOWN)
+
+
+def classify_text(text: str, rules: Sequence[RoleRule] = DEFAULT_RULES) -> PageRole:
+    upper = text.upper()
+    if not upper.strip():
+        return UNKNOWN_ROLE
+    for rule in rules:
+        if rule.matches(upper):
+            return PageRole(rule.label, rule.role)
+    return UNKNOWN_ROLE
+
+
+def classify_lines(lines: List[str], rules: Sequence[RoleRule] = DEFAULT_RULES) -> PageRole:
+    return classify_text(" ".join(lines), rules)
+
+
+def classify_pages(page_texts: Iterable[str], rules: Sequence[RoleRule] = DEFAULT_RULES) -> List[PageRole]:
+    return [classify_text(text, rules) for text in page_texts]
+
+
+def document_roles(page_roles: Iterable[PageRole]) -> Set[str]:
+    """Coarse roles present in a document (UNKNOWN included if any page is unclassified)."""
+    return {pr.role for pr in page_roles}
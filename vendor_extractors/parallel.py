@@ -0,0 +1,132 @@
+# vendor_extractors/parallel.py
+"""
+Process pool for the CPU-bound, per-file invoice parsing step.
+
+Text extraction and block/regex parsing are pure Python and hold the GIL, so
+a 40-invoice batch used to parse on a single core. ``parallel_map`` fans the
+per-file parsers (HM Clause invoices, Sakata invoices, Nunhems customs pages)
+out over a ``multiprocessing.Pool``.
+
+The pool is created once per process and reused by every request. Its workers
+are started with ``EXTRACTION_START_METHOD`` (``forkserver`` by default, else
+``spawn``), not forked from the web process: forking a multithreaded process
+can leave a child holding a lock (logging, the connection pool, an HTTP
+session) that no thread will ever release. Threads are no substitute, since
+PyMuPDF must not be used from several threads at once.
+
+Reference data a batch's jobs need (package descriptions, purity/quality
+maps, the fallback PO...) travels with each chunk of jobs rather than with
+every single job. Job functions are module-level ``fn(item, shared)``
+callables; with ``EXTRACTION_WORKERS`` <= 1, a single item, or a pool that
+cannot be started, the same functions run serially in-process.
+
+Workers must not touch Flask, the database or BC: they return results and
+the request process does the ``log_processing_event`` calls and BC lookups.
+"""
+
+import os
+import atexit
+import logging
+import threading
+from functools import partial
+from multiprocessing import cpu_count, get_context
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(cpu_count())))
+EXTRACTION_START_METHOD = os.getenv("EXTRACTION_START_METHOD", "forkserver")
+
+logger = logging.getLogger("invoice-ocr")
+
+_shared: Dict[str, Any] = {}
+_pool = None
+_pool_key = None  # (pid, workers) the pool was started for
+_pool_lock = threading.Lock()
+
+
+def init_worker() -> None:
+    """Pool initializer, run once when a long-lived worker process starts."""
+    # Events are logged by the parent; a worker never writes them itself.
+    import events
+    events.set_sink(events.NullSink())
+
+
+def _use_shared(shared: Dict[str, Any]) -> None:
+    global _shared
+    _shared = shared
+
+    # Sakata's package-description matcher reads reference_cache; seed it
+    # with the parent's list instead of letting each worker ask BC.
+    pkg_descs = _shared.get("pkg_descs")
+    if pkg_descs is not None:
+        import reference_cache
+        reference_cache.put("package_descriptions", pkg_descs)
+
+
+def _run_job(fn: Callable[[Any, Dict[str, Any]], Any], shared: Dict[str, Any], item: Any) -> Any:
+    _use_shared(shared)
+    return fn(item, shared)
+
+
+def _close_pool() -> None:
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is not None and _pool_key[0] == os.getpid():
+            _pool.terminate()
+        _pool, _pool_key = None, None
+
+
+atexit.register(_close_pool)
+
+
+def get_pool(workers: int):
+    """The process-wide pool, started on first use; None if it cannot be started."""
+    global _pool, _pool_key
+    key = (os.getpid(), workers)
+    with _pool_lock:
+        if _pool is not None and _pool_key == key:
+            return _pool
+        if _pool is not None and _pool_key[0] == os.getpid():
+            _pool.terminate()  # EXTRACTION_WORKERS changed (the CLI's --workers)
+        _pool, _pool_key = None, None
+        try:
+            try:
+                ctx = get_context(EXTRACTION_START_METHOD)
+            except ValueError:
+                ctx = get_context("spawn")  # e.g. forkserver on Windows
+            _pool = ctx.Pool(processes=workers, initializer=init_worker)
+            _pool_key = key
+        except (OSError, AssertionError) as e:
+            # e.g. no /dev/shm, or called from a daemonic process
+            logger.warning(f"[PARALLEL] Could not start a {workers}-process pool ({e}); parsing serially.")
+        return _pool
+
+
+def parallel_imap(fn: Callable[[Any, Dict[str, Any]], Any], items: Iterable[Any],
+                  shared: Optional[Dict[str, Any]] = None, workers: Optional[int] = None) -> Iterator[Any]:
+    """
+    Like ``parallel_map`` but yields each result, in input order, as soon as it
+    is ready - so callers can stream the first file while the rest still parse.
+    """
+    items = list(items)
+    shared = shared or {}
+    pool_size = EXTRACTION_WORKERS if workers is None else workers
+    used = min(pool_size, len(items))
+
+    pool = get_pool(pool_size) if used > 1 else None
+    if pool is None:
+        for item in items:
+            yield fn(item, shared)
+        return
+
+    # shared is pickled once per chunk; a couple of chunks per worker keeps the first results early
+    chunksize = max(1, len(items) // (used * 2))
+    yield from pool.imap(partial(_run_job, fn, shared), items, chunksize=chunksize)
+
+
+def parallel_map(fn: Callable[[Any, Dict[str, Any]], Any], items: Iterable[Any],
+                 shared: Optional[Dict[str, Any]] = None, workers: Optional[int] = None) -> List[Any]:
+    """
+    ``[fn(item, shared) for item in items]``, across a process pool when it pays off.
+    ``fn`` must be a module-level function and should catch its own per-file errors.
+    """
+    return list(parallel_imap(fn, items, shared, workers))
@@ -0,0 +1,101 @@
+# vendor_extractors/parsed_pdf.py
+"""
+A PDF opened once per request, with lazily cached page text and layout blocks.
+
+Multi-pass extractors (Sakata in particular) used to call ``fitz.open`` on the
+same bytes for every pass - PO header scan, seed-report sniffing, invoice
+sniffing, page counting and block parsing. ``ParsedPdf`` keeps one document
+handle and memoises what each pass asks for, so a page is parsed at most once
+per representation.
+"""
+
+from typing import List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from .page_quality import PageQuality, score_page
+
+Block = Tuple  # PyMuPDF "blocks" tuple: (x0, y0, x1, y1, text, block_no, block_type)
+
+
+class ParsedPdf:
+    def __init__(self, pdf_bytes: bytes, filename: str = ""):
+        self.filename = filename
+        self.pdf_bytes = pdf_bytes
+        self._doc: Optional[fitz.Document] = None
+        self._page_texts: dict = {}
+        self._sorted_blocks: dict = {}
+        self._qualities: dict = {}
+
+    @classmethod
+    def from_path(cls, path: str) -> "ParsedPdf":
+        with open(path, "rb") as f:
+            return cls(f.read(), filename=path)
+
+    # ── Document handle ──────────────────────────────────────────────────────
+
+    @property
+    def doc(self) -> fitz.Document:
+        """The underlying document, opened on first use. Raises if the bytes are not a PDF."""
+        if self._doc is None:
+            self._doc = fitz.open(stream=self.pdf_bytes, filetype="pdf")
+        return self._doc
+
+    @property
+    def page_count(self) -> int:
+        return self.doc.page_count
+
+    def close(self) -> None:
+        if self._doc is not None:
+            self._doc.close()
+            self._doc = None
+
+    def __enter__(self) -> "ParsedPdf":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __getstate__(self) -> dict:
+        # Picklable for the extraction process pool: the cached views travel,
+        # the fitz handle is reopened on the other side if still needed.
+        state = self.__dict__.copy()
+        state["_doc"] = None
+        return state
+
+    # ── Cached views ─────────────────────────────────────────────────────────
+
+    def page_text(self, index: int) -> str:
+        if index not in self._page_texts:
+            self._page_texts[index] = self.doc[index].get_text()
+        return self._page_texts[index]
+
+    def page_texts(self) -> List[str]:
+        return [self.page_text(i) for i in range(self.page_count)]
+
+    @property
+    def text(self) -> str:
+        """All page text concatenated, as ``"".join(page.get_text() for page in doc)``."""
+        return "".join(self.page_texts())
+
+    def page_quality(self, index: int) -> PageQuality:
+        """Text-layer quality of one page (decides whether it needs OCR)."""
+        if index not in self._qualities:
+            self._qualities[index] = score_page(self.doc[index], text=self.page_text(index))
+        return self._qualities[index]
+
+    def page_qualities(self) -> List[PageQuality]:
+        return [self.page_quality(i) for i in range(self.page_count)]
+
+    def sorted_blocks(self, index: int) -> List[Block]:
+        """Text blocks for one page in reading order (top-to-bottom, then left-to-right)."""
+        if index not in self._sorted_blocks:
+            blocks = self.doc[index].get_text("blocks")
+            self._sorted_blocks[index] = sorted(blocks, key=lambda b: (b[1], b[0]))
+        return self._sorted_blocks[index]
+
+    def all_sorted_blocks(self) -> List[Block]:
+        blocks: List[Block] = []
+        for i in range(self.page_count):
+            blocks.extend(self.sorted_blocks(i))
+        return blocks
@@ -0,0 +1,60 @@
+# vendor_extractors/registry.py
+"""
+One declaration per vendor of everything the shared pipeline needs.
+
+Every vendor module ends with a ``VENDOR = VendorSpec(...)`` naming its
+extractor, the item key holding the vendor's description, its results
+template and, optionally, a package-description finder and a per-file
+streaming extractor. ``pipeline.run_vendor_pipeline`` runs any of them the
+same way, so a new vendor is a new module plus an entry in ``VENDOR_MODULES``
+rather than another branch in ``app.py``.
+"""
+
+import importlib
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+PdfFiles = List[Tuple[str, bytes]]
+
+# Module names under vendor_extractors, in the order the upload form lists them
+VENDOR_MODULES = ("sakata", "hm_clause", "seminis", "nunhems", "syngenta", "kamterter", "kamterter_shipping")
+
+
+@dataclass(frozen=True)
+class VendorSpec:
+    name: str
+    template: str
+    # (pdf_files, pkg_descs, token) -> {filename: [item, ...]}
+    extract: Callable[[PdfFiles, List[str], str], Dict[str, List[dict]]]
+    desc_key: str = "VendorItemDescription"
+    # False for vendors whose results page needs no BC data (no pkg descs, treatments or PO options)
+    uses_bc: bool = True
+    # (vendor_desc, pkg_descs) -> description; sets item["PackageDescription"] when given
+    package_description: Optional[Callable[[str, List[str]], str]] = None
+    # False when pkg_descs are only used after extraction (package_description), so the
+    # pipeline can start parsing while they are still loading from BC
+    extract_uses_pkg_descs: bool = True
+    # (pdf_files, pkg_descs) -> yields (filename, items) per file, for the streaming results page
+    iter_extract: Optional[Callable[[PdfFiles, List[str]], Iterator[Tuple[str, List[dict]]]]] = None
+    # Kamterter invoices are attached to the BC purchase invoice later from a saved copy
+    keep_uploads: bool = False
+
+
+_specs: Dict[str, VendorSpec] = {}
+
+
+def _load() -> Dict[str, VendorSpec]:
+    # Imported on first use: vendor modules import VendorSpec from here
+    if not _specs:
+        for module_name in VENDOR_MODULES:
+            spec = importlib.import_module(f"{__package__}.{module_name}").VENDOR
+            _specs[spec.name] = spec
+    return _specs
+
+
+def get_vendor(name: str) -> Optional[VendorSpec]:
+    return _load().get(name)
+
+
+def vendor_names() -> Tuple[str, ...]:
+    return tuple(_load())
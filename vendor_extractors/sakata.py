@@ -1,15 +1,26 @@
 import os
 import re
-import fitz  # PyMuPDF
-from typing import List, Dict, TypedDict, Union, Tuple
+from typing import List, Dict, TypedDict, Union, Tuple, Optional
 import requests
 from difflib import get_close_matches
 import time
 import pycountry
 import logging
 from functools import wraps
+from collections import OrderedDict
+import threading
 from dotenv import load_dotenv
-from db_logger import log_processing_event
+from events import log_processing_event
+import reference_cache
+from .azure_ocr import analyze_pdf, analyze_many, OcrResult
+from .parsed_pdf import ParsedPdf
+from .page_quality import no_usable_text, pages_needing_ocr
+from .parallel import parallel_map
+from .page_roles import (
+    classify_pages, document_roles, RoleRule, DEFAULT_RULES,
+    INVOICE, ANALYSIS_REPORT, PACKING_LIST, BOILERPLATE,
+)
+from .registry import VendorSpec
 
 load_dotenv()
 BC_TENANT  = os.getenv("AZURE_TENANT_ID")
@@ -18,11 +29,6 @@ BC_COMPANY = os.getenv("BC_COMPANY")
 CLIENT_ID     = os.getenv("AZURE_CLIENT_ID")
 CLIENT_SECRET = os.getenv("AZURE_CLIENT_SECRET")
 
-# ── OCR SUPPORT ────────────────────────────────────────────────────────────────
-AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT")
-AZURE_KEY      = os.getenv("AZURE_KEY")
-# ── END OCR SUPPORT ────────────────────────────────────────────────────────────
-
 logger = logging.getLogger("invoice-ocr")
 logger.setLevel(logging.INFO)
 
@@ -58,38 +64,9 @@ def _normalize_ocr_text(ocr_text: str) -> str:
     return text
 
 def _extract_text_with_azure_ocr(pdf_content: bytes) -> str:
-    if not AZURE_ENDPOINT or not AZURE_KEY:
-        raise ValueError("Azure OCR credentials (AZURE_ENDPOINT / AZURE_KEY) are not set.")
-
-    headers = {
-        "Ocp-Apim-Subscription-Key": AZURE_KEY,
-        "Content-Type": "application/pdf",
-    }
-    response = requests.post(
-        f"{AZURE_ENDPOINT}formrecognizer/documentModels/prebuilt-layout:analyze?api-version=2023-07-31",
-        headers=headers,
-        data=pdf_content,
-    )
-    if response.status_code != 202:
-        raise RuntimeError(f"Azure OCR request failed: {response.text}")
-
-    op_url = response.headers["Operation-Location"]
-    for _ in range(30):
-        time.sleep(1.5)
-        result = requests.get(op_url, headers={"Ocp-Apim-Subscription-Key": AZURE_KEY}).json()
-        if result.get("status") == "succeeded":
-            lines = [
-                ln.get("content", "").strip()
-                for page in result["analyzeResult"]["pages"]
-                for ln in page["lines"]
-                if ln.get("content", "").strip()
-            ]
-            full_text = "\n".join(lines)
-            print(f"DEBUG: Azure OCR Extracted Text:\n{full_text}")
-            return full_text
-        if result.get("status") == "failed":
-            raise RuntimeError("Azure OCR analysis failed.")
-    raise TimeoutError("Azure OCR timed out.")
+    full_text = analyze_pdf(pdf_content).text
+    print(f"DEBUG: Azure OCR Extracted Text:\n{full_text}")
+    return full_text
 
 def _parse_ocr_lot_line(chunk: str, vendor_lot_no: str) -> Dict:
     lot = {
@@ -158,7 +135,7 @@ def _parse_ocr_lot_line(chunk: str, vendor_lot_no: str) -> Dict:
 
     return lot
 
-def _extract_invoice_from_ocr_text(ocr_text: str, fallback_po: str, token: str) -> List[Dict]:
+def _extract_invoice_from_ocr_text(ocr_text: str, fallback_po: str) -> List[Dict]:
     """Anchor-based extraction for OCR results where field ordering may be unstable."""
     items = []
     
@@ -336,11 +313,6 @@ def _extract_invoice_from_ocr_text(ocr_text: str, fallback_po: str, token: str)
             "Lots": lots_raw  
         }
 
-        try:
-            current["BCOptions"] = get_po_items(current["PurchaseOrder"], token) if current["PurchaseOrder"] else []
-        except Exception:
-            current["BCOptions"] = []
-
         items.append(current)
 
     return items
@@ -361,20 +333,29 @@ def get_bc_token(client_id, client_secret, tenant_id):
     resp.raise_for_status()
     return resp.json()["access_token"]
 
-token = get_bc_token(
-    client_id=CLIENT_ID,
-    client_secret=CLIENT_SECRET,
-    tenant_id=BC_TENANT
-)
-
-_items_cache = None
+# App-only tokens last about an hour; fetch a new one well before that
+SERVICE_TOKEN_TTL = int(os.getenv("SERVICE_TOKEN_TTL", "3000"))
+_service_token = None
+_service_token_at = 0.0
+
+def get_service_token() -> str:
+    """App-only BC token, fetched on first use so importing this module needs no network."""
+    global _service_token, _service_token_at
+    if _service_token is None or time.time() - _service_token_at > SERVICE_TOKEN_TTL:
+        _service_token = get_bc_token(
+            client_id=CLIENT_ID,
+            client_secret=CLIENT_SECRET,
+            tenant_id=BC_TENANT
+        )
+        _service_token_at = time.time()
+    return _service_token
 
-@timed_func("load_all_items")
-def load_all_items(force: bool = False) -> list[dict]:
-    global _items_cache
-    if _items_cache is not None and not force:
-        return _items_cache
+# Reference data lives in reference_cache; these TTLs say how long BC's copy may be ahead of ours
+ITEMS_TTL = int(os.getenv("ITEMS_TTL", "3600"))
+PKG_DESC_TTL = int(os.getenv("PKG_DESC_TTL", "900"))
 
+@timed_func("fetch_all_items")
+def _fetch_all_items(token: Optional[str] = None) -> list[dict]:
     base_url = (
         f"https://api.businesscentral.dynamics.com/v2.0/"
         f"{BC_TENANT}/{BC_ENV}/ODataV4/"
@@ -386,43 +367,45 @@ def load_all_items(force: bool = False) -> list[dict]:
         "$orderby": "No"
     }
     headers = {
-        "Authorization": f"Bearer {token}",
+        "Authorization": f"Bearer {get_service_token()}",
         "Accept": "application/json;odata.metadata=none"
     }
     resp = requests.get(base_url, params=params, headers=headers)
     resp.raise_for_status()
-    _items_cache = resp.json().get("value", [])
-    return _items_cache
-
-_pkg_desc_list = None
-
-@timed_func("load_package_descriptions")
-def load_package_descriptions(token: str) -> list[str]:
-    global _pkg_desc_list
-    if _pkg_desc_list is not None:
-        return _pkg_desc_list
+    return resp.json().get("value", [])
 
+@timed_func("fetch_package_descriptions")
+def _fetch_package_descriptions(token: Optional[str] = None) -> list[str]:
     odata_url = (
         f"https://api.businesscentral.dynamics.com/v2.0/"
         f"{BC_TENANT}/{BC_ENV}/ODataV4/"
         f"Company('{BC_COMPANY}')/Package_Descriptions_List_Excel"
     )
     headers = {
-        "Authorization": f"Bearer {token}",
+        "Authorization": f"Bearer {token or get_service_token()}",
         "Accept": "application/json"
     }
+    resp = requests.get(odata_url, headers=headers)
+    resp.raise_for_status()
+    rows = resp.json().get("value", [])
+    desc_set = set()
+    for row in rows:
+        pkg_desc = row.get("Package_Description")
+        if pkg_desc:
+            desc_set.add(pkg_desc.strip().upper())
+    return sorted(desc_set)
+
+reference_cache.register("items", _fetch_all_items, ITEMS_TTL)
+reference_cache.register("package_descriptions", _fetch_package_descriptions, PKG_DESC_TTL)
+
+def load_all_items(force: bool = False) -> list[dict]:
+    if force:
+        reference_cache.refresh("items")
+    return reference_cache.get("items")
+
+def load_package_descriptions(token: str) -> list[str]:
     try:
-        resp = requests.get(odata_url, headers=headers)
-        resp.raise_for_status()
-        payload = resp.json()
-        rows = payload.get("value", [])
-        desc_set = set()
-        for row in rows:
-            pkg_desc = row.get("Package_Description")
-            if pkg_desc:
-                desc_set.add(pkg_desc.strip().upper())
-        _pkg_desc_list = sorted(desc_set)
-        return _pkg_desc_list
+        return reference_cache.get("package_descriptions", token)
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to load package descriptions: {e}")
         return []
@@ -432,10 +415,9 @@ def normalize_text(s: str) -> str:
 
 @timed_func("find_best_package_description")
 def find_best_package_description(vendor_desc: str) -> str:
-    global _pkg_desc_list
-    if _pkg_desc_list is None:
+    pkg_desc_list = reference_cache.peek("package_descriptions")
+    if pkg_desc_list is None:
         return ""
-    pkg_desc_list = _pkg_desc_list
 
     normalized = normalize_text(vendor_desc)
     # Case-insensitive match for M or LB
@@ -455,58 +437,90 @@ def find_best_package_description(vendor_desc: str) -> str:
     matches = get_close_matches(normalized, pkg_desc_list, n=1, cutoff=0.6)
     return matches[0] if matches else ""
 
-_po_cache = {}
+# Purchase-line options per individual PO: {po: (expires_at, [{"No", "Description"}])}, oldest first
+PO_CACHE_TTL = float(os.getenv("PO_CACHE_TTL", "600"))
+PO_CACHE_MAX = int(os.getenv("PO_CACHE_MAX", "2000"))
+_po_cache: "OrderedDict[str, Tuple[float, List[Dict]]]" = OrderedDict()
+_po_cache_lock = threading.Lock()
+
+def _po_cache_get(po: str) -> Optional[List[Dict]]:
+    with _po_cache_lock:
+        entry = _po_cache.get(po)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _po_cache[po]
+            return None
+        _po_cache.move_to_end(po)
+        return entry[1]
+
+def _po_cache_put(po: str, items: List[Dict]):
+    with _po_cache_lock:
+        _po_cache[po] = (time.monotonic() + PO_CACHE_TTL, items)
+        _po_cache.move_to_end(po)
+        while len(_po_cache) > PO_CACHE_MAX:
+            _po_cache.popitem(last=False)
+
+def _fetch_po_lines(query: str, po_numbers: List[str], headers: dict) -> Optional[Dict[str, List[Dict]]]:
+    """One $filter call for several POs; {po: unique items} for the POs that have lines, None on failure."""
+    filter_clause = " or ".join(f"PurchaseOrderNo eq '{po}'" for po in po_numbers)
+    url = (
+        f"https://api.businesscentral.dynamics.com/v2.0/{BC_TENANT}/{BC_ENV}"
+        f"/ODataV4/Company('Stokes%20Seeds%20Limited')/{query}?$filter={filter_clause}"
+    )
+    try:
+        response = requests.get(url, headers=headers)
+        if response.status_code != 200:
+            return None
+        by_po: Dict[str, List[Dict]] = {}
+        for item in response.json().get("value", []):
+            no = item.get("ItemNumber")
+            po = item.get("PurchaseOrderNo")
+            if not no or po not in po_numbers: continue
+            lines = by_po.setdefault(po, [])
+            if any(line["No"] == no for line in lines): continue
+            lines.append({"No": no, "Description": item.get("ItemDescription", "")})
+        return by_po
+    except Exception:
+        return None
 
 @timed_func("get_po_items")
 def get_po_items(po_number, token):
-    if po_number in _po_cache:
-        return _po_cache[po_number]
-
-    po_numbers = [po.strip() for po in po_number.split("|") if po.strip()]
+    """
+    BC item options for one PO or several joined with "|", merged and de-duplicated.
+    Cached per PO, so only POs not seen recently are fetched - in one call, with
+    the archive queried only for POs the live query does not know.
+    """
+    po_numbers = list(dict.fromkeys(po.strip() for po in po_number.split("|") if po.strip()))
     if not po_numbers: return []
 
-    if len(po_numbers) == 1:
-        filter_clause = f"PurchaseOrderNo eq '{po_numbers[0]}'"
-    else:
-        filter_clause = " or ".join(f"PurchaseOrderNo eq '{po}'" for po in po_numbers)
+    per_po = {po: _po_cache_get(po) for po in po_numbers}
+    missing = [po for po, items in per_po.items() if items is None]
 
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    
-    url_main = (
-        f"https://api.businesscentral.dynamics.com/v2.0/{BC_TENANT}/{BC_ENV}"
-        f"/ODataV4/Company('Stokes%20Seeds%20Limited')/PurchaseOrderQuery?$filter={filter_clause}"
-    )
-    
-    data = []
-    seen = set()
+    if missing:
+        headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+        live = _fetch_po_lines("PurchaseOrderQuery", missing, headers)
+        live_ok = live is not None
+        found = dict(live or {})
 
-    try:
-        response = requests.get(url_main, headers=headers)
-        if response.status_code == 200:
-            for item in response.json().get("value", []):
-                no = item.get("ItemNumber")
-                if not no or no in seen: continue
-                seen.add(no)
-                data.append({"No": no, "Description": item.get("ItemDescription", "")})
-    except Exception: pass
+        not_live = [po for po in missing if po not in found]
+        archived = _fetch_po_lines("ArchivePurchaseOrderQuery", not_live, headers) if not_live else {}
+        found.update(archived or {})
 
-    if not data:
-        url_archive = (
-            f"https://api.businesscentral.dynamics.com/v2.0/{BC_TENANT}/{BC_ENV}"
-            f"/ODataV4/Company('Stokes%20Seeds%20Limited')/ArchivePurchaseOrderQuery?$filter={filter_clause}"
-        )
-        try:
-            response = requests.get(url_archive, headers=headers)
-            if response.status_code == 200:
-                seen = set()
-                for item in response.json().get("value", []):
-                    no = item.get("ItemNumber")
-                    if not no or no in seen: continue
-                    seen.add(no)
-                    data.append({"No": no, "Description": item.get("ItemDescription", "")})
-        except Exception: pass
+        for po in missing:
+            per_po[po] = found.get(po, [])
+            # Only cache what the live query vouches for: a PO that was merely missing from a failed
+            # live lookup could be live, so its archive lines (or no lines) must not be pinned for the TTL
+            if live_ok and (po in live or archived is not None):
+                _po_cache_put(po, per_po[po])
 
-    _po_cache[po_number] = data
+    data = []
+    seen = set()
+    for po in po_numbers:
+        for item in per_po[po]:
+            if item["No"] in seen: continue
+            seen.add(item["No"])
+            data.append(item)
     return data
 
 def convert_to_alpha2(country_value: str) -> str:
@@ -578,30 +592,68 @@ def parse_lot_block(raw_text: str) -> Dict:
     except Exception as e:
         return {"error": str(e), "raw": raw_text}
 
-@timed_func("extract_seed_analysis_reports_from_bytes")
-def extract_seed_analysis_reports_from_bytes(pdf_files: list[tuple[str, bytes]]) -> Dict[str, PurityData]:
-    """Page-by-page OCR fallback for Seed Analysis Reports."""
+def _ocr_scanned_pages(pdfs: List[ParsedPdf]) -> Dict[str, Union[OcrResult, Exception]]:
+    """
+    OCR, concurrently, the pages of every file whose text layer is unusable - one
+    upload per file with Azure's pages= filter. The seed-report and invoice passes
+    share the result, so a scanned invoice is no longer OCR'd once per pass.
+    """
+    names, jobs = [], []
+    for pdf in pdfs:
+        try:
+            scanned_pages = pages_needing_ocr(pdf.page_qualities())
+        except Exception as e:
+            logger.warning(f"Could not read {pdf.filename}: {e}")
+            continue
+        if scanned_pages:
+            logger.info(f"'{pdf.filename}' pages {scanned_pages} need OCR. Queuing for OCR.")
+            names.append(pdf.filename)
+            jobs.append((pdf.pdf_bytes, scanned_pages))
+    return dict(zip(names, analyze_many(jobs)))
+
+def _merged_page_texts(pdf: ParsedPdf, ocr_result: Optional[Union[OcrResult, Exception]]) -> List[str]:
+    """Text layer per page, with scanned pages replaced by their OCR text (empty if OCR failed)."""
+    texts = []
+    for i in range(pdf.page_count):
+        if not pdf.page_quality(i).needs_ocr:
+            texts.append(pdf.page_text(i))
+        elif isinstance(ocr_result, OcrResult) and (ocr_page := ocr_result.page(i + 1)) is not None:
+            texts.append(ocr_page.text)
+        else:
+            if isinstance(ocr_result, Exception):
+                logger.warning(f"OCR failed for {pdf.filename} p{i+1}: {ocr_result}")
+            texts.append("")
+    return texts
+
+@timed_func("extract_seed_analysis_reports")
+def extract_seed_analysis_reports(
+    pdfs: List[ParsedPdf],
+    ocr_results: Optional[Dict[str, Union[OcrResult, Exception]]] = None
+) -> Dict[str, PurityData]:
+    """
+    Purity/germ data from the Seed Analysis Reports among already-opened PDFs,
+    keyed by lot. Reads the text layer and uses ``ocr_results`` (filename ->
+    OCR of that file's scanned pages) where the text layer is unusable; scanned
+    pages are OCR'd here when it is not given.
+    """
     report_map: Dict[str, PurityData] = {}
-    for fname, bts in pdf_files:
+    if ocr_results is None:
+        ocr_results = _ocr_scanned_pages(pdfs)
+
+    for pdf in pdfs:
+        fname = pdf.filename
         try:
-            full_text_parts = []
-            with fitz.open(stream=bts, filetype="pdf") as doc:
-                for i, page in enumerate(doc):
-                    pg_text = page.get_text()
-                    # individual page sanity check
-                    if len(pg_text.strip()) < 100:
-                        logger.info(f"'{fname}' p{i+1} appears scanned. Attempting OCR.")
-                        temp_doc = fitz.open()
-                        temp_doc.insert_pdf(doc, from_page=i, to_page=i)
-                        pg_bts = temp_doc.tobytes()
-                        temp_doc.close()
-                        try:
-                            ocr_pg_text = _extract_text_with_azure_ocr(pg_bts)
-                            full_text_parts.append(ocr_pg_text)
-                        except Exception as e:
-                            logger.warning(f"OCR failed for {fname} p{i+1}: {e}")
-                    else:
-                        full_text_parts.append(pg_text)
+            page_texts = _merged_page_texts(pdf, ocr_results.get(fname))
+            page_roles = classify_pages(page_texts)
+            if ANALYSIS_REPORT not in document_roles(page_roles):
+                continue
+
+            # Invoice, packing-list and terms pages bundled into the same file
+            # would only confuse the lot/number regexes below.
+            full_text_parts = [
+                t for t, r in zip(page_texts, page_roles)
+                if r.role not in (INVOICE, PACKING_LIST, BOILERPLATE)
+            ]
             
             text = "\n".join(full_text_parts)
             print(f"DEBUG: Combined Report Text ({fname}):\n{text}")
@@ -651,25 +703,24 @@ def extract_seed_analysis_reports_from_bytes(pdf_files: list[tuple[str, bytes]])
 
 @timed_func("extract_invoice_from_pdf")
 def extract_invoice_from_pdf(
-    source: Union[str, bytes],
-    fallback_po: str = "",
-    token: str = ""
+    source: Union[str, bytes, ParsedPdf],
+    fallback_po: str = ""
 ) -> List[Dict]:
-    """Legacy PyMuPDF invoice extractor."""
-    doc = None
+    """Legacy PyMuPDF invoice extractor. Pass a ParsedPdf to reuse an already-open document."""
+    pdf = None
+    owns_pdf = not isinstance(source, ParsedPdf)
     try:
-        if isinstance(source, bytes): doc = fitz.open(stream=source, filetype="pdf")
-        elif isinstance(source, str): doc = fitz.open(source)
-        else: raise ValueError("Source must be file path (str) or bytes.")
+        if isinstance(source, ParsedPdf): pdf = source
+        elif isinstance(source, bytes): pdf = ParsedPdf(source)
+        elif isinstance(source, str): pdf = ParsedPdf.from_path(source)
+        else: raise ValueError("Source must be file path (str), bytes or ParsedPdf.")
         
-        first_page_text = doc[0].get_text()
+        first_page_text = pdf.page_text(0)
         
         header_po_match = re.search(r"(?:PO|Purchase\s*order)[-\s#:]*(\d{5})\b", first_page_text, re.IGNORECASE | re.DOTALL)
         header_po = f"PO-{header_po_match.group(1)}" if header_po_match else fallback_po
 
-        all_blocks = []
-        for page in doc:
-            all_blocks.extend(sorted(page.get_text("blocks"), key=lambda b: (b[1], b[0])))
+        all_blocks = pdf.all_sorted_blocks()
 
         items: List[Dict] = []
         current = None
@@ -686,10 +737,6 @@ def extract_invoice_from_pdf(
                     current["TreatmentName"] = treatment_name.group(1).strip() if treatment_name else None
                     po_match = re.search(r"(?:PO|Purchase\s+order)[#\s\-:]*(\d{5})\b", text_acc, re.IGNORECASE)
                     current["PurchaseOrder"] = (f"PO-{po_match.group(1)}" if po_match else header_po)
-                    try:
-                        current["BCOptions"] = get_po_items(current["PurchaseOrder"], token) if current["PurchaseOrder"] else []
-                    except Exception:
-                        current["BCOptions"] = []
                     items.append(current)
 
                 item_y0 = b[1]
@@ -736,67 +783,87 @@ def extract_invoice_from_pdf(
             current["TreatmentName"] = treatment_name.group(1).strip() if treatment_name else None
             po_match = re.search(r"(?:PO|Purchase\s+order)[#\s\-:]*(\d{5})\b", text_acc, re.IGNORECASE)
             current["PurchaseOrder"] = (f"PO-{po_match.group(1)}" if po_match else header_po)
-            try:
-                current["BCOptions"] = get_po_items(current["PurchaseOrder"], token) if current["PurchaseOrder"] else []
-            except Exception:
-                current["BCOptions"] = []
             items.append(current)
 
         return items
     finally:
-        if doc: doc.close()         
+        if pdf and owns_pdf: pdf.close()
+
+# Invoice pass only: a page carrying a Sakata invoice number is an invoice even when it
+# also mentions seed analysis, which the generic report rule would otherwise match first
+SAKATA_INVOICE_ROLE_RULES = (
+    RoleRule(INVOICE, INVOICE, any_of=("INV-", "INVOICE NUMBER")),
+) + DEFAULT_RULES
 
 @timed_func("extract_sakata_data_from_bytes")
-def extract_sakata_data_from_bytes(pdf_files: list[tuple[str, bytes]], token: str = "") -> dict[str, list[dict]]:
+def extract_sakata_data_from_bytes(pdf_files: list[tuple[str, bytes]]) -> dict[str, list[dict]]:
     if not pdf_files: return {}
 
+    # Each PDF is opened once here and shared by every pass below
+    pdfs = [ParsedPdf(pdf_bytes, filename) for filename, pdf_bytes in pdf_files]
+    try:
+        return _extract_sakata_from_parsed(pdfs)
+    finally:
+        for pdf in pdfs:
+            pdf.close()
+
+def _extract_sakata_from_parsed(pdfs: List[ParsedPdf]) -> dict[str, list[dict]]:
     # Extract global PO fallback
-    first_filename, first_bytes = pdf_files[0]
     fallback_po = ""
     try:
-        with fitz.open(stream=first_bytes, filetype="pdf") as doc0:
-            hdr = doc0[0].get_text()
-            m = re.search(r"Purchase\s+order\s*[:\-]?(.*?)(?:Terms of payment|Ship to)", hdr, re.IGNORECASE | re.DOTALL) or \
-                re.search(r"Customer\s+reference\s*[:\-]?(.*?)(?:Terms of delivery|Ship to)", hdr, re.IGNORECASE | re.DOTALL)
-            if m:
-                nums = re.findall(r"\b(\d{5})\b", m.group(1))
-                if nums: fallback_po = " | ".join(f"PO-{n}" for n in nums)
+        hdr = pdfs[0].page_text(0)
+        m = re.search(r"Purchase\s+order\s*[:\-]?(.*?)(?:Terms of payment|Ship to)", hdr, re.IGNORECASE | re.DOTALL) or \
+            re.search(r"Customer\s+reference\s*[:\-]?(.*?)(?:Terms of delivery|Ship to)", hdr, re.IGNORECASE | re.DOTALL)
+        if m:
+            nums = re.findall(r"\b(\d{5})\b", m.group(1))
+            if nums: fallback_po = " | ".join(f"PO-{n}" for n in nums)
     except Exception: pass
     
     logger.info(f"Using fallback PO: {fallback_po}")
     
-    # 1. Build report map
-    report_map = extract_seed_analysis_reports_from_bytes(pdf_files)
+    # 1. OCR every scanned page of the batch once; both passes below share it
+    ocr_results = _ocr_scanned_pages(pdfs)
+
+    # 2. Build report map
+    report_map = extract_seed_analysis_reports(pdfs, ocr_results)
     grouped_results = {}
+    invoice_jobs = []
 
-    for filename, pdf_bytes in pdf_files:
+    for pdf in pdfs:
+        filename = pdf.filename
         is_invoice = True
         extraction_method = "PyMuPDF"
         full_doc_text = ""
 
         try:
-            with fitz.open(stream=pdf_bytes, filetype="pdf") as temp_doc:
-                full_doc_text = "".join(page.get_text() for page in temp_doc)
-                text_len = len(full_doc_text.strip())
-
-                if text_len < 200:
-                    logger.info(f"'{filename}': low searchable text ({text_len} chars). Attempting Azure OCR.")
-                    try:
-                        ocr_text = _extract_text_with_azure_ocr(pdf_bytes)
-                        full_doc_text = ocr_text
-                        extraction_method = "Azure OCR"
-                    except Exception as ocr_err:
-                        logger.warning(f"Azure OCR failed for {filename}: {ocr_err}")
-                        is_invoice = False
-
-                _NON_INVOICE_PHRASES = ["Report of Seed Analysis", "Purity Analysis", "Packing List", "Pro forma packing slip"]
-                if is_invoice:
-                    if any(phrase in full_doc_text for phrase in _NON_INVOICE_PHRASES):
-                        is_invoice = False
-                        logger.info(f"Skipping supporting document: {filename}")
-                    elif "INV-" not in full_doc_text and "Invoice number" not in full_doc_text:
-                        # Final check for invoice signature
-                        is_invoice = False
+            full_doc_text = pdf.text
+            text_len = len(full_doc_text.strip())
+
+            if no_usable_text(pdf.page_qualities()):
+                logger.info(f"'{filename}': no usable text layer ({text_len} chars). Using Azure OCR.")
+                ocr_result = ocr_results.get(filename)
+                if isinstance(ocr_result, OcrResult):
+                    full_doc_text = ocr_result.text
+                    extraction_method = ocr_result.method
+                else:
+                    logger.warning(f"Azure OCR failed for {filename}: {ocr_result}")
+                    is_invoice = False
+
+            # Cheap role check first: reports, packing lists and terms pages never
+            # reach the invoice parsers.
+            page_roles = classify_pages(_merged_page_texts(pdf, ocr_results.get(filename)), SAKATA_INVOICE_ROLE_RULES)
+            if is_invoice and INVOICE not in document_roles(page_roles):
+                is_invoice = False
+                logger.info(f"Skipping non-invoice document: {filename}")
+
+            _NON_INVOICE_PHRASES = ["Report of Seed Analysis", "Purity Analysis", "Packing List", "Pro forma packing slip"]
+            if is_invoice:
+                if any(phrase in full_doc_text for phrase in _NON_INVOICE_PHRASES):
+                    is_invoice = False
+                    logger.info(f"Skipping supporting document: {filename}")
+                elif "INV-" not in full_doc_text and "Invoice number" not in full_doc_text:
+                    # Final check for invoice signature
+                    is_invoice = False
         except Exception as e:
             logger.warning(f"Error reading {filename}: {e}")
             continue
@@ -807,7 +874,7 @@ def extract_sakata_data_from_bytes(pdf_files: list[tuple[str, bytes]], token: st
 
         page_count = 0
         try:
-            with fitz.open(stream=pdf_bytes, filetype="pdf") as d: page_count = d.page_count
+            page_count = pdf.page_count
             log_processing_event(
                 vendor='Sakata', filename=filename,
                 extraction_info={'method': extraction_method, 'page_count': page_count},
@@ -818,34 +885,65 @@ def extract_sakata_data_from_bytes(pdf_files: list[tuple[str, bytes]], token: st
         m_inv = re.search(r"INV[-\s]*0*([0-9]+)", full_doc_text, re.IGNORECASE)
         invoice_id = m_inv.group(1) if m_inv else ""
 
-        if extraction_method == "Azure OCR":
-            raw_items = _extract_invoice_from_ocr_text(full_doc_text, fallback_po, token)
-        else:
-            raw_items = extract_invoice_from_pdf(source=pdf_bytes, fallback_po=fallback_po, token=token)
+        used_ocr = extraction_method != "PyMuPDF"
+        # OCR'd invoices are parsed from text; the PDF only travels for block parsing
+        invoice_jobs.append((filename, None if used_ocr else pdf, full_doc_text if used_ocr else "", invoice_id))
+
+    # 3. Parse the invoices across the process pool
+    # BC options are attached afterwards by pipeline.attach_bc_options, so jobs need no token
+    shared = {"report_map": report_map, "fallback_po": fallback_po}
+    pkg_desc_list = reference_cache.peek("package_descriptions")
+    if pkg_desc_list is not None:
+        shared["pkg_descs"] = pkg_desc_list
+    for filename, raw_items in parallel_map(_sakata_invoice_job, invoice_jobs, shared=shared):
+        if raw_items: grouped_results[filename] = raw_items
 
-        for itm in raw_items:
-            parsed_lots = []
-            for lot_data in itm.get("Lots", []):
-                
-                if extraction_method != "Azure OCR":
-                    lot = parse_lot_block(lot_data)
-                else:
-                    lot = lot_data
-                
-                lot["USD_Actual_Cost_$"] = itm.get("USD_Actual_Cost_$")
-                lot["PackageDescription"] = itm.get("PackageDescription")
-                lot["OriginalReceivedQty"] = itm.get("OriginalReceivedQty")
-                
-                vendor_lot_no = lot.get("VendorLotNo")
-                if vendor_lot_no in report_map:
-                    lot.update(report_map[vendor_lot_no])
-                
-                lot["PurchaseOrder"] = itm.get("PurchaseOrder") or fallback_po
-                lot["InvoiceNumber"] = invoice_id
-                parsed_lots.append(lot)
+    return grouped_results
+
+def _sakata_invoice_job(job: Tuple[str, Optional[ParsedPdf], str, str], shared: Dict) -> Tuple[str, List[Dict]]:
+    """parallel_map job: parse one invoice and merge in the seed-report data for its lots."""
+    filename, pdf, ocr_text, invoice_id = job
+    fallback_po = shared.get("fallback_po", "")
+    report_map = shared.get("report_map", {})
+
+    used_ocr = pdf is None
+    if used_ocr:
+        raw_items = _extract_invoice_from_ocr_text(ocr_text, fallback_po)
+    else:
+        try:
+            raw_items = extract_invoice_from_pdf(source=pdf, fallback_po=fallback_po)
+        finally:
+            pdf.close()
+
+    for itm in raw_items:
+        parsed_lots = []
+        for lot_data in itm.get("Lots", []):
+            
+            if not used_ocr:
+                lot = parse_lot_block(lot_data)
+            else:
+                lot = lot_data
+            
+            lot["USD_Actual_Cost_$"] = itm.get("USD_Actual_Cost_$")
+            lot["PackageDescription"] = itm.get("PackageDescription")
+            lot["OriginalReceivedQty"] = itm.get("OriginalReceivedQty")
+            
+            vendor_lot_no = lot.get("VendorLotNo")
+            if vendor_lot_no in report_map:
+                lot.update(report_map[vendor_lot_no])
             
-            itm["Lots"] = parsed_lots
+            lot["PurchaseOrder"] = itm.get("PurchaseOrder") or fallback_po
+            lot["InvoiceNumber"] = invoice_id
+            parsed_lots.append(lot)
         
-        if raw_items: grouped_results[filename] = raw_items
+        itm["Lots"] = parsed_lots
 
-    return grouped_results
+    return filename, raw_items
+
+
+VENDOR = VendorSpec(
+    name="sakata",
+    template="results_sakata.html",
+    extract=lambda pdf_files, pkg_descs, token: extract_sakata_data_from_bytes(pdf_files),
+    desc_key="VendorDescription",
+)
@@ -266,57 +266,26 @@
 
 
 # seminis.py
-import os
 import json
-import fitz  # PyMuPDF
 import re
-from typing import List, Dict, Tuple, Union
-import requests
-import time
+from typing import List, Dict, Tuple, Union, Iterator
 from difflib import get_close_matches
 from collections import defaultdict
-from db_logger import log_processing_event
-
-# --- Configuration for Azure OCR (if needed) ---
-AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT")
-AZURE_KEY = os.getenv("AZURE_KEY")
+from events import log_processing_event
+from .azure_ocr import analyze_pdf
+from .document_store import DocumentStore, ExtractedDocument
+from .registry import VendorSpec
 
 # --- OCR and Text Extraction Logic (Modified for In-Memory) ---
 def extract_text_with_azure_ocr(pdf_content: bytes) -> Tuple[List[str], int]:
     """Sends PDF content to Azure OCR and returns lines and page count."""
-    headers = {
-        "Ocp-Apim-Subscription-Key": AZURE_KEY,
-        "Content-Type": "application/pdf"
-    }
-    response = requests.post(
-        f"{AZURE_ENDPOINT}formrecognizer/documentModels/prebuilt-layout:analyze?api-version=2023-07-31",
-        headers=headers,
-        data=pdf_content
-    )
-    if response.status_code != 202:
-        raise RuntimeError(f"OCR request failed: {response.text}")
-
-    op_url = response.headers["Operation-Location"]
-    for _ in range(30):
-        time.sleep(1.5)
-        result = requests.get(op_url, headers={"Ocp-Apim-Subscription-Key": AZURE_KEY}).json()
-        if result.get("status") == "succeeded":
-            lines = []
-            analyze_result = result.get("analyzeResult", {})
-            pages = analyze_result.get("pages", [])
-            page_count = len(pages)  # Get page count from OCR result
-            for page in pages:
-                # ... existing line processing logic ...
-                if "notice to purchaser" in " ".join(line.get("content", "").lower() for line in page.get("lines", [])):
-                    continue
-                for line in page["lines"]:
-                    txt = line.get("content", "").strip()
-                    if txt:
-                        lines.append(txt)
-            return lines, page_count
-        if result.get("status") == "failed":
-            raise RuntimeError("OCR analysis failed")
-    raise TimeoutError("OCR timed out")
+    result = analyze_pdf(pdf_content)
+    lines = []
+    for page in result.pages:
+        if "notice to purchaser" in " ".join(ln.content.lower() for ln in page.lines):
+            continue
+        lines.extend(page.text_lines())
+    return lines, result.page_count
 
 # def extract_text_with_fallback(source: Union[str, bytes]) -> List[str]:
 #     """
@@ -360,43 +329,31 @@ def extract_text_with_azure_ocr(pdf_content: bytes) -> Tuple[List[str], int]:
 #     with open(source, "rb") as f:
 #         return extract_text_with_azure_ocr(f.read())
 
+def _seminis_lines(doc: ExtractedDocument) -> List[str]:
+    """All lines of an extracted document, skipping 'notice to purchaser' boilerplate pages."""
+    lines = []
+    for page_lines in doc.pages:
+        if "notice to purchaser" in " ".join(page_lines).lower():
+            continue
+        lines.extend(page_lines)
+    return lines
+
 def extract_text_with_fallback(source: Union[str, bytes]) -> Dict:
     """Extracts text and returns a dictionary with metadata for logging."""
-    doc = None
-    try:
-        doc = fitz.open(stream=source, filetype="pdf") if isinstance(source, bytes) else fitz.open(source)
-    except Exception:
-        # If PyMuPDF fails, go straight to OCR
-        pdf_bytes = source if isinstance(source, bytes) else open(source, "rb").read()
-        lines, page_count = extract_text_with_azure_ocr(pdf_bytes)
-        return {'lines': lines, 'method': 'Azure OCR', 'page_count': page_count}
-
-    page_count = doc.page_count
-    is_scanned = not any(page.get_text().strip() for page in doc)
-    
-    if not is_scanned:
-        lines = []
-        for page in doc:
-            page_text = page.get_text()
-            if "notice to purchaser" in page_text.lower():
-                continue
-            lines.extend([ln.strip() for ln in page_text.splitlines() if ln.strip()])
-        doc.close()
-        return {'lines': lines, 'method': 'PyMuPDF', 'page_count': page_count}
-    
-    # If scanned, fall back to OCR
-    doc.close()
-    pdf_bytes = source if isinstance(source, bytes) else open(source, "rb").read()
-    lines, page_count_ocr = extract_text_with_azure_ocr(pdf_bytes)
-    return {'lines': lines, 'method': 'Azure OCR', 'page_count': page_count_ocr}
+    if isinstance(source, bytes):
+        pdf_bytes = source
+    else:
+        with open(source, "rb") as f:
+            pdf_bytes = f.read()
+    doc = DocumentStore([("", pdf_bytes)])[""]
+    return {'lines': _seminis_lines(doc), 'method': doc.method, 'page_count': doc.page_count}
 
 # --- Data Extraction Logic (Modified for In-Memory) ---
-def _extract_seminis_analysis_data(pdf_files: List[Tuple[str, bytes]]) -> Dict[str, Dict]:
+def _extract_seminis_analysis_data(store: DocumentStore) -> Dict[str, Dict]:
     """Extracts data from Seminis analysis reports."""
     analysis = {}
-    for filename, pdf_bytes in pdf_files:
-        extraction_info = extract_text_with_fallback(pdf_bytes)
-        lines = extraction_info['lines']
+    for doc in store:
+        lines = _seminis_lines(doc)
         if not lines: continue
         
         text = "\n".join(lines)
@@ -425,12 +382,11 @@ def _extract_seminis_analysis_data(pdf_files: List[Tuple[str, bytes]]) -> Dict[s
         }
     return analysis
 
-def _extract_seminis_packing_data(pdf_files: List[Tuple[str, bytes]]) -> Dict[str, Dict]:
-    """Extracts data from Seminis packing slips from a list of file bytes."""
+def _extract_seminis_packing_data(store: DocumentStore) -> Dict[str, Dict]:
+    """Extracts data from Seminis packing slips in the batch."""
     packing_data = {}
-    for filename, pdf_bytes in pdf_files:
-        extraction_info = extract_text_with_fallback(pdf_bytes)
-        lines = extraction_info['lines']
+    for doc in store:
+        lines = _seminis_lines(doc)
         if not lines: continue
         
         text = "\n".join(lines)
@@ -599,16 +555,22 @@ def _process_single_seminis_invoice(lines: List[str], analysis_map: dict, packin
 
 def extract_seminis_data_from_bytes(pdf_files: List[Tuple[str, bytes]], pkg_desc_list: list[str]) -> Dict[str, List[Dict]]:
     """Main function to extract all data from a batch of Seminis files and log each one."""
+    return dict(iter_seminis_data_from_bytes(pdf_files, pkg_desc_list))
+
+def iter_seminis_data_from_bytes(pdf_files: List[Tuple[str, bytes]], pkg_desc_list: list[str]) -> Iterator[Tuple[str, List[Dict]]]:
+    """Yields (filename, items) for each invoice as soon as it is parsed, for streaming results."""
     if not pdf_files:
-        return {}
+        return
 
-    analysis_map = _extract_seminis_analysis_data(pdf_files)
-    packing_map = _extract_seminis_packing_data(pdf_files)
+    # Each file is read (and OCR'd if scanned) once; all three passes share it.
+    store = DocumentStore(pdf_files)
+    analysis_map = _extract_seminis_analysis_data(store)
+    packing_map = _extract_seminis_packing_data(store)
 
-    grouped_results = {}
-    for filename, pdf_bytes in pdf_files:
-        extraction_info = extract_text_with_fallback(pdf_bytes)
-        lines = extraction_info['lines']
+    for doc in store:
+        filename = doc.filename
+        extraction_info = doc.info
+        lines = _seminis_lines(doc)
         
         po_number = None
         is_invoice = False
@@ -634,9 +596,7 @@ def extract_seminis_data_from_bytes(pdf_files: List[Tuple[str, bytes]], pkg_desc
                 for item in invoice_items:
                     if not item.get("PurchaseOrder") and po_number:
                         item["PurchaseOrder"] = po_number
-                grouped_results[filename] = invoice_items
-    
-    return grouped_results
+                yield filename, invoice_items
 
 # def find_best_seminis_package_description(vendor_desc: str, pkg_desc_list: list[str]) -> str:
 #     """Finds the best matching package description for Seminis items."""
@@ -677,4 +637,12 @@ def find_best_seminis_package_description(vendor_desc: str, pkg_desc_list: list[
 
     # Fallback to general fuzzy matching
     matches = get_close_matches(normalized_desc, pkg_desc_list, n=1, cutoff=0.6)
-    return matches[0] if matches else ""
\ No newline at end of file
+    return matches[0] if matches else ""
+
+
+VENDOR = VendorSpec(
+    name="seminis",
+    template="results_seminis.html",
+    extract=lambda pdf_files, pkg_descs, token: extract_seminis_data_from_bytes(pdf_files, pkg_descs),
+    iter_extract=iter_seminis_data_from_bytes,
+)
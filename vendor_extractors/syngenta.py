@@ -567,60 +567,21 @@
 #     print("=== END EXTRACTION ===\n")
 #     return grouped_results
 
-import os
 import re
 import fitz  # PyMuPDF
-import time
-import requests
 from typing import List, Dict, Tuple, Set
-from db_logger import log_processing_event
-
-# --- Azure Configuration ---
-AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT")
-AZURE_KEY = os.getenv("AZURE_KEY")
+from events import log_processing_event
+from .azure_ocr import analyze_pdf, analyze_many
+from .page_quality import score_page
+from .registry import VendorSpec
 
 def extract_text_with_azure_ocr(pdf_bytes: bytes) -> List[str]:
     """
     Performs OCR on in-memory PDF bytes using Azure Form Recognizer.
+    Returns an empty list on any failure so a bad page never aborts the batch.
     """
-    if not AZURE_ENDPOINT or not AZURE_KEY:
-        print("Warning: Azure credentials not set. Skipping OCR.")
-        return []
-
-    headers = {
-        "Ocp-Apim-Subscription-Key": AZURE_KEY,
-        "Content-Type": "application/pdf"
-    }
-    
-    url = f"{AZURE_ENDPOINT}formrecognizer/documentModels/prebuilt-layout:analyze?api-version=2023-07-31"
-    
     try:
-        response = requests.post(url, headers=headers, data=pdf_bytes)
-        if response.status_code != 202:
-            print(f"Azure OCR request failed: {response.status_code} - {response.text}")
-            return []
-
-        result_url = response.headers["Operation-Location"]
-
-        for _ in range(30):
-            time.sleep(1.0)
-            result = requests.get(result_url, headers={"Ocp-Apim-Subscription-Key": AZURE_KEY}).json()
-            status = result.get("status")
-            
-            if status == "succeeded":
-                lines = []
-                for page in result.get("analyzeResult", {}).get("pages", []):
-                    for line in page.get("lines", []):
-                        content = line.get("content", "").strip()
-                        if content:
-                            lines.append(content)
-                return lines
-            elif status == "failed":
-                print("Azure OCR analysis failed.")
-                return []
-                
-        print("Azure OCR timed out.")
-        return []
+        return analyze_pdf(pdf_bytes).lines()
     except Exception as e:
         print(f"Error during Azure OCR: {e}")
         return []
@@ -1004,6 +965,33 @@ def parse_invoice_text(text: str, filename: str, global_po: str, invoice_no: str
             
     return items
 
+# Text-layer signals that a page is one of ours and already searchable
+SYNGENTA_KEYWORDS = ("INVOICE", "SYNGENTA", "REPORT OF ANALYSIS", "PURITY ANALYSIS", "VIABILITY")
+
+def _page_needs_ocr(page: fitz.Page, page_text: str, filename: str) -> bool:
+    quality = score_page(page, SYNGENTA_KEYWORDS, text=page_text)
+    if quality.needs_ocr:
+        print(f"   > {filename}: {quality.reason}.")
+    elif quality.keyword_hit:
+        print(f"   > Detected {filename} as searchable ({quality.reason}).")
+    return quality.needs_ocr
+
+def _read_pages_for_ocr(filename: str, pdf_bytes: bytes) -> Tuple[str, int, List[Dict]]:
+    """
+    Returns (filename, page_count, pages). Each page dict holds its PyMuPDF text and
+    a 'needs_ocr' flag for pages that look scanned.
+    """
+    pages = []
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        print(f"Processing File: {filename} ({doc.page_count} pages)")
+        for i, page in enumerate(doc):
+            page_text = page.get_text()
+            needs_ocr = _page_needs_ocr(page, page_text, filename)
+            if needs_ocr:
+                print(f"   > Page {i + 1} appears scanned. Queuing for Azure OCR...")
+            pages.append({"filename": filename, "page_num": i + 1, "text": page_text, "needs_ocr": needs_ocr})
+        return filename, doc.page_count, pages
+
 def extract_syngenta_data_from_bytes(pdf_files: List[Tuple[str, bytes]], pkg_desc_list: list) -> Dict[str, List[Dict]]:
     analysis_map = {}
     temp_invoice_items = {}
@@ -1011,51 +999,42 @@ def extract_syngenta_data_from_bytes(pdf_files: List[Tuple[str, bytes]], pkg_des
     
     print("\n=== START SYNGENTA EXTRACTION (Page-by-Page Logic) ===")
 
+    # --- PASS 0: Read every page, queue scanned ones for one concurrent OCR batch ---
+    scanned_docs = []
+    ocr_jobs = []  # one (pdf_bytes, [page numbers]) job per file, not one upload per page
     for filename, pdf_bytes in pdf_files:
         try:
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            final_page_count = doc.page_count
-            
+            scanned = _read_pages_for_ocr(filename, pdf_bytes)
+        except Exception as e:
+            print(f"Error processing file {filename}: {e}")
+            continue
+        scanned_docs.append(scanned)
+        ocr_pages = [pg for pg in scanned[2] if pg["needs_ocr"]]
+        if ocr_pages:
+            ocr_jobs.append((pdf_bytes, ocr_pages))
+
+    if ocr_jobs:
+        print(f"   > Sending scanned pages of {len(ocr_jobs)} file(s) to Azure OCR concurrently...")
+        results = analyze_many([(pdf_bytes, [pg["page_num"] for pg in pages]) for pdf_bytes, pages in ocr_jobs])
+        for (_, pages), result in zip(ocr_jobs, results):
+            for pg in pages:
+                ocr_page = None if isinstance(result, Exception) else result.page(pg["page_num"])
+                ocr_lines = ocr_page.text_lines() if ocr_page else []
+                if ocr_lines:
+                    pg["text"] = "\n".join(ocr_lines)
+                    print(f"   > OCR Successful for {pg['filename']} Page {pg['page_num']}")
+                else:
+                    print(f"   > OCR failed/empty for {pg['filename']} Page {pg['page_num']}")
+
+    # --- PASS 1: Classify pages and parse invoices ---
+    for filename, final_page_count, pages in scanned_docs:
+        try:
             current_invoice_text = ""
             invoice_pages_found = False
-            
-            print(f"Processing File: {filename} ({final_page_count} pages)")
 
-            for i, page in enumerate(doc):
-                page_num = i + 1
-                page_text = page.get_text()
-                
-                stripped_text = page_text.strip()
-                needs_ocr = False
-                
-                if len(stripped_text) < 50:
-                    needs_ocr = True
-                elif ("REPORT OF ANALYSIS" not in page_text.upper() 
-                    or "PURITY ANALYSIS" not in page_text.upper()):
-                    
-                    if ("INVOICE" not in page_text.upper() 
-                    or "SYNGENTA" not in page_text.upper()):
-                        needs_ocr = True
-                    elif ("INVOICE" in page_text.upper()):
-                        print(f"   > Detected {filename} as a searchable Invoice.")
-                
-                elif ("REPORT OF ANALYSIS" in page_text.upper() 
-                    or "PURITY ANALYSIS" in page_text.upper()):
-                    print(f"   > Detected {filename} as a searchable Certificate.")
-                
-                if needs_ocr:
-                    print(f"   > Page {page_num} appears scanned. Attempting Azure OCR...")
-                    new_doc = fitz.open()
-                    new_doc.insert_pdf(doc, from_page=i, to_page=i)
-                    page_bytes = new_doc.tobytes()
-                    new_doc.close()
-                    
-                    ocr_lines = extract_text_with_azure_ocr(page_bytes)
-                    if ocr_lines:
-                        page_text = "\n".join(ocr_lines)
-                        print(f"   > OCR Successful for Page {page_num}")
-                    else:
-                        print(f"   > OCR failed/empty for Page {page_num}")
+            for pg in pages:
+                page_num = pg["page_num"]
+                page_text = pg["text"]
 
                 page_upper = page_text.upper()
                 is_analysis = "REPORT OF ANALYSIS" in page_upper and "VIABILITY" in page_upper
@@ -1074,8 +1053,6 @@ def extract_syngenta_data_from_bytes(pdf_files: List[Tuple[str, bytes]], pkg_des
                 else:
                     print(f"   > [Page {page_num}] Irrelevant/Unknown content. Skipping.")
 
-            doc.close()
-
             if invoice_pages_found and current_invoice_text.strip():
                 print(f"   > Parsing accumulated invoice text for {filename}...")
                 
@@ -1134,4 +1111,11 @@ def extract_syngenta_data_from_bytes(pdf_files: List[Tuple[str, bytes]], pkg_des
         grouped_results[filename] = final_items
     
     print("=== END EXTRACTION ===\n")
-    return grouped_results
\ No newline at end of file
+    return grouped_results
+
+
+VENDOR = VendorSpec(
+    name="syngenta",
+    template="results_syngenta.html",
+    extract=lambda pdf_files, pkg_descs, token: extract_syngenta_data_from_bytes(pdf_files, pkg_descs),
+)
@@ -0,0 +1,95 @@
+# worker.py
+"""
+Background extraction worker. Run as many as the box can take:
+
+    python worker.py
+
+Each worker claims queued jobs from Postgres (``job_queue.claim_job``), runs
+the same vendor pipeline as the synchronous upload (``build_vendor_results``)
+inside a Flask app context so processing-log writes work, and stores the
+results page context for ``/jobs/<id>`` to render.
+"""
+
+import os
+import time
+import signal
+import logging
+import traceback
+
+import db_logger
+import job_queue
+from app import app, build_vendor_results, token_broker
+
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+
+logger = logging.getLogger("invoice-ocr")
+
+_stopping = False
+
+
+def _request_stop(signum, frame):
+    global _stopping
+    _stopping = True
+    logger.info("[WORKER] Stop requested; finishing the current job first.")
+
+
+def run_job(job: dict):
+    job_id, vendor = job["id"], job["vendor"]
+    start = time.perf_counter()
+    logger.info(f"[WORKER] Job {job_id}: {vendor}, {len(job['pdf_files'])} file(s)")
+    try:
+        # Fetched at claim time, so a job that waited in the queue still gets a live token
+        user_token = token_broker.get_token(job["user_name"])
+        if not user_token:
+            job_queue.fail_job(job_id, "Sign-in expired; sign in again and re-upload the batch")
+            return
+        with app.app_context():
+            built = build_vendor_results(vendor, job["pdf_files"], user_token)
+        if built is None:
+            job_queue.fail_job(job_id, f"Unsupported vendor: {vendor}")
+            return
+        template, context = built
+        job_queue.complete_job(job_id, {"template": template, "context": context})
+        logger.info(f"[WORKER] Job {job_id} done in {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        logger.error(f"[WORKER] Job {job_id} failed: {e}\n{traceback.format_exc()}")
+        job_queue.fail_job(job_id, str(e))
+
+
+def main():
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+    logger.info(f"[WORKER] Started (pid {os.getpid()})")
+
+    last_prune = 0.0
+    while not _stopping:
+        if time.time() - last_prune > 3600:
+            try:
+                removed = job_queue.prune_jobs()
+                if removed:
+                    logger.info(f"[WORKER] Pruned {removed} old job(s)")
+            except Exception as e:
+                logger.error(f"[WORKER] Job prune failed: {e}")
+            try:
+                dropped = db_logger.run_log_maintenance()
+                if dropped:
+                    logger.info(f"[WORKER] Dropped expired log partition(s): {', '.join(dropped)}")
+            except Exception as e:
+                logger.error(f"[WORKER] Log maintenance failed: {e}")
+            last_prune = time.time()
+
+        try:
+            job = job_queue.claim_job()
+        except Exception as e:
+            # A Postgres hiccup (or no free pooled connection) must not kill the worker
+            logger.error(f"[WORKER] Claiming a job failed: {e}")
+            time.sleep(POLL_INTERVAL)
+            continue
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+        run_job(job)
+
+
+if __name__ == "__main__":
+    main()